@@ -0,0 +1,193 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import asdict
+from pathlib import Path
+from typing import Optional, Tuple, Union
+
+from .prompts import Summary
+
+
+class CacheBackend(ABC):
+    """Key-value store for serialized summaries."""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[str]:
+        """Get the value stored under ``key``, None if missing or expired."""
+
+    @abstractmethod
+    def set(self, key: str, value: str) -> None:
+        """Store ``value`` under ``key``."""
+
+
+class LRUCacheBackend(CacheBackend):
+    """In-process cache evicting the least recently used entries.
+
+    Attributes:
+        max_size: maximum number of entries kept in the cache.
+        ttl: number of seconds an entry stays valid, None to never expire.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            created_at, value = entry
+            if self.ttl is not None and time.time() - created_at > self.ttl:
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        with self._lock:
+            self._entries[key] = (time.time(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """On-disk cache stored in a SQLite database, shared across restarts.
+
+    Attributes:
+        path: path of the SQLite database file.
+        ttl: number of seconds an entry stays valid, None to never expire.
+        max_size: maximum number of entries kept in the cache, None for no limit.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = "summary_cache.sqlite3",
+        ttl: Optional[float] = None,
+        max_size: Optional[int] = None,
+    ) -> None:
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "SELECT value, created_at FROM summaries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at = row
+            if self.ttl is not None and now - created_at > self.ttl:
+                self._connection.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                return None
+
+            self._connection.execute(
+                "UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+            return value
+
+    def set(self, key: str, value: str) -> None:
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            if self.max_size is not None:
+                self._connection.execute(
+                    "DELETE FROM summaries WHERE key NOT IN ("
+                    "SELECT key FROM summaries ORDER BY accessed_at DESC LIMIT ?)",
+                    (self.max_size,),
+                )
+
+
+class SummaryCache:
+    """Content-addressed cache of summaries.
+
+    Entries are keyed on the hash of the summarized text, the model and the prompt,
+    so identical documents or chunks are only ever summarized once.
+    """
+
+    def __init__(self, backend: CacheBackend) -> None:
+        self.backend = backend
+
+    @staticmethod
+    def make_key(text: str, model_name: str, prompt_key: str) -> str:
+        """Make the cache key of a summary.
+
+        Args:
+            text (str): summarized text.
+            model_name (str): name of the model generating the summary.
+            prompt_key (str): string identifying the prompt, see ``SummarizationPrompt.cache_key``.
+
+        Returns:
+            str: cache key.
+        """
+        digest = hashlib.sha256()
+        for part in (model_name, prompt_key, text):
+            digest.update(part.encode())
+            # separator so that parts can not run into one another
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, text: str, model_name: str, prompt_key: str) -> Optional[Summary]:
+        """Get the cached summary of the given text, None on a cache miss."""
+        value = self.backend.get(self.make_key(text, model_name, prompt_key))
+        if value is None:
+            return None
+        return Summary(**json.loads(value))
+
+    def set(
+        self, text: str, model_name: str, prompt_key: str, summary: Summary
+    ) -> None:
+        """Store the summary of the given text."""
+        self.backend.set(
+            self.make_key(text, model_name, prompt_key), json.dumps(asdict(summary))
+        )
+
+
+def make_summary_cache(
+    backend_name: str,
+    max_size: int = 4096,
+    ttl: Optional[float] = None,
+    path: Union[str, Path] = "summary_cache.sqlite3",
+) -> Optional[SummaryCache]:
+    """Create a summary cache.
+
+    Args:
+        backend_name (str): backend of the cache, one of "memory", "sqlite" or "none".
+        max_size (int, optional): maximum number of cached summaries. Defaults to 4096.
+        ttl (Optional[float], optional): lifetime of cached summaries in seconds. Defaults to None.
+        path (Union[str, Path], optional): SQLite database file. Defaults to "summary_cache.sqlite3".
+
+    Returns:
+        Optional[SummaryCache]: summary cache, None if caching is disabled.
+    """
+    if backend_name == "none":
+        return None
+    if backend_name == "memory":
+        return SummaryCache(LRUCacheBackend(max_size=max_size, ttl=ttl))
+    if backend_name == "sqlite":
+        return SummaryCache(SQLiteCacheBackend(path, ttl=ttl, max_size=max_size))
+
+    raise ValueError(f"Unknown summary cache backend: {backend_name}")
@@ -0,0 +1,153 @@
+import re
+from bisect import bisect_left
+from enum import IntEnum
+from typing import Callable, List, Optional, Sequence, Tuple
+
+
+class Boundary(IntEnum):
+    """Places where a document can be cut, the higher the better."""
+
+    WORD = 0
+    SENTENCE = 1
+    PARAGRAPH = 2
+    HEADING = 3
+
+
+# a single alternation so the text is scanned once, alternatives are tried in order
+_BOUNDARY_PATTERN = re.compile(
+    # markdown headings and short numbered section titles, e.g. "2.1 Related Work"
+    r"(?P<heading>^(?:#{1,6}[ \t]+|\d+(?:\.\d+)*\.?[ \t]+(?=[A-Z]))[^\n]{1,80}(?<![.,;:])$)"
+    r"|(?P<paragraph>\n[ \t]*\n\s*)"
+    r"|(?P<sentence>[.!?][\"')\]]*\s+)"
+    r"|(?P<word>\s+)",
+    re.MULTILINE,
+)
+
+_BOUNDARY_BY_GROUP = {
+    "heading": Boundary.HEADING,
+    "paragraph": Boundary.PARAGRAPH,
+    "sentence": Boundary.SENTENCE,
+    "word": Boundary.WORD,
+}
+
+
+def find_boundaries(
+    text: str, token_offsets: Sequence[int]
+) -> List[Tuple[int, Boundary]]:
+    """Find the tokens a chunk can start at, with the kind of boundary preceding them.
+
+    Headings are boundaries before the heading line, the others after the paragraph break,
+    the end of the sentence or the whitespace.
+
+    Args:
+        text (str): decoded text of the tokens.
+        token_offsets (Sequence[int]): index in ``text`` of the first character of each token.
+
+    Returns:
+        List[Tuple[int, Boundary]]: index of the token following each boundary, in increasing
+            order, with the best boundary found before that token.
+    """
+    n_tokens = len(token_offsets)
+    boundaries: List[Tuple[int, Boundary]] = []
+    token_index = 0
+    for match in _BOUNDARY_PATTERN.finditer(text):
+        boundary = _BOUNDARY_BY_GROUP[match.lastgroup]
+        position = match.start() if boundary == Boundary.HEADING else match.end()
+
+        # boundaries inside a token move to the start of the next token
+        while token_index < n_tokens and token_offsets[token_index] < position:
+            token_index += 1
+        if token_index == 0 or token_index == n_tokens:
+            continue
+
+        if boundaries and boundaries[-1][0] == token_index:
+            boundaries[-1] = (token_index, max(boundaries[-1][1], boundary))
+        else:
+            boundaries.append((token_index, boundary))
+
+    return boundaries
+
+
+def pack_chunks(
+    n_tokens: int,
+    boundaries: List[Tuple[int, Boundary]],
+    max_tokens_per_chunk: int,
+    overlap_tokens: int = 0,
+    min_chunk_fraction: float = 0.5,
+    boundary_key: Optional[Callable[[int], int]] = None,
+) -> List[Tuple[int, int]]:
+    """Pack a document greedily into chunks of at most ``max_tokens_per_chunk`` tokens.
+
+    Each chunk ends at the best boundary between ``min_chunk_fraction`` of the budget and the
+    full budget: a heading over a paragraph break over the end of a sentence over a space,
+    the latest of equally good boundaries. Only text without any boundary is cut mid-word.
+
+    With ``boundary_key``, equally good boundaries are ranked by their key instead, the lowest
+    wins. Keys derived from the text around each boundary make the chunk ends depend on the
+    content rather than on the position in the document: after an edit, chunks fall back on
+    the same ends as before within a chunk or two, and the chunks after it are unchanged.
+
+    Args:
+        n_tokens (int): number of tokens of the document.
+        boundaries (List[Tuple[int, Boundary]]): boundaries of the document, see ``find_boundaries``.
+        max_tokens_per_chunk (int): maximum number of tokens in a chunk.
+        overlap_tokens (int, optional): number of tokens a chunk repeats from the end of the
+            previous one, at most a quarter of the budget. Defaults to 0.
+        min_chunk_fraction (float, optional): fraction of the budget a chunk fills at least,
+            unless it is the last one. Defaults to 0.5.
+        boundary_key (Optional[Callable[[int], int]], optional): key of the boundary before the
+            given token, ranking equally good boundaries. Defaults to None, the latest wins.
+
+    Returns:
+        List[Tuple[int, int]]: start (inclusive) and end (exclusive) token index of each chunk.
+    """
+    # a chunk always ends past the start of the next one, so the packing moves forward
+    overlap_tokens = max(0, min(overlap_tokens, max_tokens_per_chunk // 4))
+    min_tokens_per_chunk = max(1, int(max_tokens_per_chunk * min_chunk_fraction))
+    boundary_tokens = [token_index for token_index, _ in boundaries]
+
+    slices: List[Tuple[int, int]] = []
+    start = 0
+    boundary_index = 0
+    while start < n_tokens:
+        max_end = start + max_tokens_per_chunk
+        if max_end >= n_tokens:
+            slices.append((start, n_tokens))
+            break
+
+        while (
+            boundary_index < len(boundaries)
+            and boundaries[boundary_index][0] < start + min_tokens_per_chunk
+        ):
+            boundary_index += 1
+
+        end, best, best_key = max_end, None, None
+        index = boundary_index
+        while index < len(boundaries) and boundaries[index][0] <= max_end:
+            token_index, boundary = boundaries[index]
+            if boundary_key is None:
+                if best is None or boundary >= best:
+                    end, best = token_index, boundary
+            elif best is None or boundary > best:
+                end, best, best_key = token_index, boundary, boundary_key(token_index)
+            elif boundary == best:
+                key = boundary_key(token_index)
+                if key < best_key:
+                    end, best_key = token_index, key
+            index += 1
+        slices.append((start, end))
+
+        start = end
+        if overlap_tokens:
+            # start the overlap at a sentence, if one starts within it
+            index = bisect_left(boundary_tokens, end - overlap_tokens)
+            while index < len(boundaries) and boundaries[index][0] < end:
+                if boundaries[index][1] >= Boundary.SENTENCE:
+                    break
+                index += 1
+            if index < len(boundaries) and boundaries[index][0] < end:
+                start = boundaries[index][0]
+            else:
+                start = end - overlap_tokens
+
+    return slices
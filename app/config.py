@@ -0,0 +1,168 @@
+import json
+import os
+import tempfile
+
+from dotenv import load_dotenv
+
+load_dotenv(".env")
+
+# development mode: debug logs and chunk and summary dumps in the working directory
+DEBUG = os.environ.get("GLOBAL_DEBUG", "").lower() in ("1", "true", "yes")
+# logs: minimum level, "text" or "json" lines, or rich rendering for development
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "DEBUG" if DEBUG else "INFO").upper()
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+RICH_CONSOLE = os.environ.get("RICH_CONSOLE", "false").lower() in ("1", "true", "yes")
+
+# maximum number of chunks of a single document summarized at the same time
+MAX_CONCURRENT_CHUNKS = int(os.environ.get("MAX_CONCURRENT_CHUNKS", 8))
+
+# model calls: timeout of a single attempt in seconds, retries on rate limits and transient
+# errors with exponential backoff, and re-asks when the output can not be parsed
+LLM_CALL_TIMEOUT = float(os.environ.get("LLM_CALL_TIMEOUT", 120))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 4))
+LLM_MAX_PARSE_RETRIES = int(os.environ.get("LLM_MAX_PARSE_RETRIES", 2))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 1))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 60))
+# stream the output of models, so the answer is parsed while it is generated and the
+# generation stops as soon as the last summary asked for is complete
+LLM_STREAMING = os.environ.get("LLM_STREAMING", "true").lower() in ("1", "true", "yes")
+# seconds after which a straggling chunk call is duplicated, unset to never hedge
+LLM_HEDGE_AFTER = (
+    float(os.environ["LLM_HEDGE_AFTER"]) if os.environ.get("LLM_HEDGE_AFTER") else None
+)
+
+# price of 1000 input and 1000 output tokens in USD by model name, overriding the built-in
+# prices, e.g. '{"gpt-4": [0.03, 0.06]}'
+MODEL_PRICES = {
+    model_name: tuple(prices)
+    for model_name, prices in json.loads(os.environ.get("MODEL_PRICES", "{}")).items()
+}
+# latency model of the dry-run plans: seconds before the first output token of a call and
+# output tokens generated per second
+PLAN_CALL_LATENCY = float(os.environ.get("PLAN_CALL_LATENCY", 1.0))
+PLAN_OUTPUT_TOKENS_PER_SECOND = float(
+    os.environ.get("PLAN_OUTPUT_TOKENS_PER_SECOND", 50)
+)
+
+# rate limiter of the models, one of "memory" for a limiter per process or "sqlite" for a
+# limiter shared by all the processes using RATE_LIMITER_PATH, e.g. the workers of a server
+RATE_LIMITER = os.environ.get("RATE_LIMITER", "memory")
+RATE_LIMITER_PATH = os.environ.get("RATE_LIMITER_PATH", "rate_limits.sqlite3")
+
+# identical summaries requested at the same time are computed once, by a single request of
+# the current process ("memory") or of all the processes using SINGLE_FLIGHT_PATH ("sqlite"),
+# or "none"
+SINGLE_FLIGHT = os.environ.get("SINGLE_FLIGHT", "memory")
+SINGLE_FLIGHT_PATH = os.environ.get("SINGLE_FLIGHT_PATH", "single_flight.sqlite3")
+
+# model served by a local OpenAI-compatible server (llama.cpp, vLLM...), unset for none
+LOCAL_LLM_MODEL = os.environ.get("LOCAL_LLM_MODEL")
+LOCAL_LLM_API_BASE = os.environ.get("LOCAL_LLM_API_BASE", "http://localhost:8080/v1")
+LOCAL_LLM_CONTEXT_LENGTH = int(os.environ.get("LOCAL_LLM_CONTEXT_LENGTH", 4096))
+# tiktoken encoding approximating the tokenizer of the local model
+LOCAL_LLM_TOKENIZER = os.environ.get("LOCAL_LLM_TOKENIZER", "cl100k_base")
+
+# model summarizing the chunks of long documents, e.g. the local model, unset to use the
+# requested model. The requested model still joins the chunk summaries.
+MAP_MODEL = os.environ.get("MAP_MODEL")
+
+# number of tokens a chunk repeats from the end of the previous chunk
+CHUNK_OVERLAP_TOKENS = int(os.environ.get("CHUNK_OVERLAP_TOKENS", 0))
+
+# topic clustering of long documents: passages are embedded by an OpenAI-compatible
+# embeddings endpoint, linked to their most similar neighbors and grouped into topics,
+# each topic is summarized on its own. Requires numpy and networkx.
+TOPIC_CLUSTERING = os.environ.get("TOPIC_CLUSTERING", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+EMBEDDING_MODEL = os.environ.get("EMBEDDING_MODEL", "nomic-embed-text")
+EMBEDDING_API_BASE = os.environ.get("EMBEDDING_API_BASE", LOCAL_LLM_API_BASE)
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 64))
+# number of tokens of a clustered passage, neighbors of each passage in the similarity graph
+# and resolution of the community detection, higher for more and smaller topics
+TOPIC_PASSAGE_TOKENS = int(os.environ.get("TOPIC_PASSAGE_TOKENS", 512))
+TOPIC_NEIGHBORS = int(os.environ.get("TOPIC_NEIGHBORS", 10))
+TOPIC_RESOLUTION = float(os.environ.get("TOPIC_RESOLUTION", 1.0))
+
+# text removed before summarizing: lines repeated at the top or bottom of pages, paragraphs
+# nearly repeating an earlier one, and everything from the last heading with one of the
+# comma-separated STRIP_SECTIONS titles, e.g. "References,Bibliography", unset to keep it all
+FILTER_REPEATED_LINES = os.environ.get("FILTER_REPEATED_LINES", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+FILTER_NEAR_DUPLICATES = os.environ.get("FILTER_NEAR_DUPLICATES", "true").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+NEAR_DUPLICATE_SIMILARITY = float(os.environ.get("NEAR_DUPLICATE_SIMILARITY", 0.8))
+STRIP_SECTIONS = [
+    title.strip()
+    for title in os.environ.get("STRIP_SECTIONS", "").split(",")
+    if title.strip()
+]
+
+# maximum number of summaries joined by a single call in the reduce phase
+REDUCE_FAN_IN = int(os.environ.get("REDUCE_FAN_IN", 10))
+
+# limits on downloaded files, bounding the memory and disk used per request
+MAX_DOWNLOAD_BYTES = int(os.environ.get("MAX_DOWNLOAD_BYTES", 100 * 1024 * 1024))
+DOWNLOAD_TIMEOUT = float(os.environ.get("DOWNLOAD_TIMEOUT", 60))
+
+# shared HTTP client of downloads: pooled keep-alive connections, requests in flight per
+# host, connect timeout in seconds and HTTP/2 (requires the h2 package)
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(
+    os.environ.get("HTTP_MAX_KEEPALIVE_CONNECTIONS", 20)
+)
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP_MAX_CONNECTIONS_PER_HOST = int(os.environ.get("HTTP_MAX_CONNECTIONS_PER_HOST", 8))
+HTTP_CONNECT_TIMEOUT = float(os.environ.get("HTTP_CONNECT_TIMEOUT", 10))
+HTTP2 = os.environ.get("HTTP2", "false").lower() in ("1", "true", "yes")
+
+# store of downloaded files and their text, backend is one of "disk" or "none"
+ARTIFACT_STORE = os.environ.get("ARTIFACT_STORE", "disk")
+ARTIFACT_STORE_DIR = os.environ.get(
+    "ARTIFACT_STORE_DIR", os.path.join(tempfile.gettempdir(), "brevity-artifacts")
+)
+ARTIFACT_STORE_MAX_BYTES = int(
+    os.environ.get("ARTIFACT_STORE_MAX_BYTES", 1024 * 1024 * 1024)
+)
+# seconds a request may use a stored file before it can be removed
+ARTIFACT_STORE_PIN_LEASE = float(os.environ.get("ARTIFACT_STORE_PIN_LEASE", 3600))
+
+# summary cache backend, one of "memory", "sqlite" or "none"
+SUMMARY_CACHE = os.environ.get("SUMMARY_CACHE", "memory")
+SUMMARY_CACHE_MAX_SIZE = int(os.environ.get("SUMMARY_CACHE_MAX_SIZE", 4096))
+SUMMARY_CACHE_TTL = (
+    float(os.environ["SUMMARY_CACHE_TTL"])
+    if os.environ.get("SUMMARY_CACHE_TTL")
+    else None
+)
+SUMMARY_CACHE_PATH = os.environ.get("SUMMARY_CACHE_PATH", "summary_cache.sqlite3")
+
+# interval between keep-alive comments of streamed responses, in seconds
+STREAM_KEEP_ALIVE_INTERVAL = float(os.environ.get("STREAM_KEEP_ALIVE_INTERVAL", 15))
+
+# background summarization jobs, store backend is one of "memory" or "sqlite"
+MAX_CONCURRENT_JOBS = int(os.environ.get("MAX_CONCURRENT_JOBS", 4))
+JOB_STORE = os.environ.get("JOB_STORE", "memory")
+JOB_STORE_PATH = os.environ.get("JOB_STORE_PATH", "jobs.sqlite3")
+# finished jobs kept by the "memory" store, and for how many seconds
+JOB_STORE_MAX_FINISHED = int(os.environ.get("JOB_STORE_MAX_FINISHED", 1000))
+JOB_TTL = float(os.environ.get("JOB_TTL", 24 * 60 * 60))
+# seconds a worker holds a running job without renewing its lease
+JOB_LEASE = float(os.environ.get("JOB_LEASE", 60))
+
+# batch summarization, model calls are bounded across all the documents of a batch
+BATCH_MAX_CONCURRENT_CALLS = int(os.environ.get("BATCH_MAX_CONCURRENT_CALLS", 32))
+BATCH_MAX_CONCURRENT_DOWNLOADS = int(
+    os.environ.get("BATCH_MAX_CONCURRENT_DOWNLOADS", 8)
+)
+# documents of a batch held in memory at the same time, and items of a batch
+BATCH_MAX_DOCUMENTS = int(os.environ.get("BATCH_MAX_DOCUMENTS", 16))
+BATCH_MAX_ITEMS = int(os.environ.get("BATCH_MAX_ITEMS", 100))
@@ -0,0 +1,229 @@
+import asyncio
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import Executor, ProcessPoolExecutor
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+import textract
+from pypdf import PdfReader
+
+
+class TextExtractor(ABC):
+    """Extracts text from a file page by page.
+
+    Extractors are registered for file extensions and MIME types with ``register_extractor``.
+    They are pickled to worker processes, so they should not hold any state.
+
+    Attributes:
+        extensions: file extensions handled by the extractor, e.g. ".pdf".
+        mime_types: MIME types handled by the extractor, e.g. "application/pdf".
+    """
+
+    extensions: Tuple[str, ...] = ()
+    mime_types: Tuple[str, ...] = ()
+
+    def count_pages(self, path: Path) -> int:
+        """Count the pages of the file. Formats without pages have a single page."""
+        return 1
+
+    @abstractmethod
+    def extract_pages(self, path: Path, start: int, end: int) -> List[str]:
+        """Extract the text of pages ``start`` (inclusive) to ``end`` (exclusive)."""
+
+    def iter_pages(self, path: Path, pages_per_batch: int = 8) -> Iterator[str]:
+        """Extract the text of the file in the current process, one page at a time.
+
+        Args:
+            path (Path): path of the file.
+            pages_per_batch (int, optional): number of pages extracted at a time. Defaults to 8.
+
+        Yields:
+            str: text of each page, in order.
+        """
+        n_pages = self.count_pages(path)
+        for start in range(0, n_pages, pages_per_batch):
+            yield from self.extract_pages(
+                path, start, min(start + pages_per_batch, n_pages)
+            )
+
+
+class PlainTextExtractor(TextExtractor):
+    extensions = (".txt", ".md", ".rst", ".csv")
+    mime_types = ("text/plain", "text/markdown", "text/csv")
+
+    def extract_pages(self, path: Path, start: int, end: int) -> List[str]:
+        return [Path(path).read_text(errors="replace")]
+
+
+class _HTMLTextParser(HTMLParser):
+    _skipped_tags = {"script", "style", "noscript", "template", "svg"}
+    _block_tags = {"p", "div", "br", "li", "tr", "section", "article"} | {
+        f"h{level}" for level in range(1, 7)
+    }
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.parts: List[str] = []
+        self._skip_depth = 0
+
+    def handle_starttag(self, tag: str, attrs) -> None:
+        if tag in self._skipped_tags:
+            self._skip_depth += 1
+        elif tag in self._block_tags:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag: str) -> None:
+        if tag in self._skipped_tags:
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in self._block_tags:
+            self.parts.append("\n")
+
+    def handle_data(self, data: str) -> None:
+        if not self._skip_depth:
+            self.parts.append(data)
+
+
+class HTMLExtractor(TextExtractor):
+    extensions = (".html", ".htm", ".xhtml")
+    mime_types = ("text/html", "application/xhtml+xml")
+
+    def extract_pages(self, path: Path, start: int, end: int) -> List[str]:
+        parser = _HTMLTextParser()
+        parser.feed(Path(path).read_text(errors="replace"))
+        parser.close()
+        return ["".join(parser.parts)]
+
+
+class PDFExtractor(TextExtractor):
+    extensions = (".pdf",)
+    mime_types = ("application/pdf", "application/x-pdf")
+
+    def count_pages(self, path: Path) -> int:
+        return len(PdfReader(path).pages)
+
+    def extract_pages(self, path: Path, start: int, end: int) -> List[str]:
+        reader = PdfReader(path)
+        return [reader.pages[i].extract_text() for i in range(start, end)]
+
+
+class TextractExtractor(TextExtractor):
+    """Fallback for formats without an in-process parser, shells out to textract."""
+
+    def extract_pages(self, path: Path, start: int, end: int) -> List[str]:
+        return [textract.process(str(path)).decode()]
+
+
+_extractors_by_extension: Dict[str, TextExtractor] = {}
+_extractors_by_mime_type: Dict[str, TextExtractor] = {}
+_fallback_extractor = TextractExtractor()
+
+
+def register_extractor(extractor: TextExtractor) -> None:
+    """Register an extractor for its extensions and MIME types, replacing previous ones.
+
+    Args:
+        extractor (TextExtractor): extractor to register.
+    """
+    for extension in extractor.extensions:
+        _extractors_by_extension[extension.lower()] = extractor
+    for mime_type in extractor.mime_types:
+        _extractors_by_mime_type[mime_type.lower()] = extractor
+
+
+def get_extractor(extension: str, mime_type: Optional[str] = None) -> TextExtractor:
+    """Get the extractor for a file.
+
+    The MIME type announced by the server takes precedence over the extension of the URL,
+    which is often missing or misleading (e.g. https://arxiv.org/pdf/2309.10668).
+
+    Args:
+        extension (str): file extension, e.g. ".pdf".
+        mime_type (Optional[str], optional): MIME type of the file. Defaults to None.
+
+    Returns:
+        TextExtractor: extractor for the file, textract if no in-process extractor matches.
+    """
+    if mime_type and mime_type.lower() in _extractors_by_mime_type:
+        return _extractors_by_mime_type[mime_type.lower()]
+    return _extractors_by_extension.get(extension.lower(), _fallback_extractor)
+
+
+for _extractor in (PlainTextExtractor(), HTMLExtractor(), PDFExtractor()):
+    register_extractor(_extractor)
+
+
+_extraction_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_extraction_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """Get the process pool shared by all extractions, creating it on first use.
+
+    Args:
+        max_workers (Optional[int], optional): number of worker processes when the pool is created.
+            Defaults to None, i.e. the number of CPUs.
+
+    Returns:
+        ProcessPoolExecutor: extraction process pool.
+    """
+    global _extraction_pool
+    if _extraction_pool is None:
+        # spawn, forking a process running an event loop and threads is not safe
+        _extraction_pool = ProcessPoolExecutor(
+            max_workers=max_workers, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _extraction_pool
+
+
+def shutdown_extraction_pool() -> None:
+    """Shut down the extraction process pool, if it was created."""
+    global _extraction_pool
+    if _extraction_pool is not None:
+        _extraction_pool.shutdown(cancel_futures=True)
+        _extraction_pool = None
+
+
+async def aiter_pages(
+    extractor: TextExtractor,
+    path: Path,
+    pages_per_batch: int = 8,
+    executor: Optional[Executor] = None,
+) -> AsyncIterator[str]:
+    """Extract the text of a file in worker processes, one page at a time.
+
+    Batches of pages are extracted in parallel and yielded in order as soon as they are done,
+    so consumers can process the first pages while later ones are still being parsed.
+
+    Args:
+        extractor (TextExtractor): extractor for the file.
+        path (Path): path of the file.
+        pages_per_batch (int, optional): number of pages extracted by a single task. Defaults to 8.
+        executor (Optional[Executor], optional): executor running the extraction.
+            Defaults to None, i.e. the shared extraction process pool.
+
+    Yields:
+        str: text of each page, in order.
+    """
+    loop = asyncio.get_running_loop()
+    executor = executor or get_extraction_pool()
+
+    n_pages = await loop.run_in_executor(executor, extractor.count_pages, path)
+    batches = [
+        loop.run_in_executor(
+            executor,
+            extractor.extract_pages,
+            path,
+            start,
+            min(start + pages_per_batch, n_pages),
+        )
+        for start in range(0, n_pages, pages_per_batch)
+    ]
+
+    try:
+        for batch in batches:
+            for page in await batch:
+                yield page
+    finally:
+        for batch in batches:
+            batch.cancel()
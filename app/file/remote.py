@@ -1,10 +1,26 @@
+import asyncio
 import random
 import string
+import tempfile
+from contextlib import AsyncExitStack
+from logging import INFO, getLogger
 from pathlib import Path
-from typing import Dict, Optional
+from typing import AsyncIterator, Callable, Dict, Iterator, Optional
 
-import requests
-import textract
+import httpx
+
+from .extract import TextExtractor, aiter_pages, get_extractor
+from .store import Artifact, ArtifactStore
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# downloaded files live in a dedicated directory instead of the working directory
+DOWNLOAD_DIR = Path(tempfile.gettempdir()) / "brevity"
+
+
+class FileTooLargeError(Exception):
+    """Raised when a remote file exceeds the maximum download size."""
 
 
 def gen_random_string(choices: str = string.ascii_lowercase, length: int = 10) -> str:
@@ -23,46 +39,211 @@ def gen_random_string(choices: str = string.ascii_lowercase, length: int = 10) -
 class RemoteFile:
     """Class for managing files at a remote URL.
 
+    Use as an async context manager to guarantee the downloaded file is deleted:
+
+        async with RemoteFile(url) as remote_file:
+            await remote_file.download()
+            text = await remote_file.aextract_text()
+
+    With an artifact store, the file and its text are kept in the store instead. A stored
+    file is revalidated with the server and, if unchanged, neither downloaded nor extracted.
+
     Methods:
         delete: delete the file.
+        adelete: delete the file without blocking the event loop.
         download: download the file.
         extract_text: extract text from the file.
+        aextract_text: extract text from the file in worker processes.
+        iter_pages: extract text from the file page by page.
+        aiter_pages: extract text from the file page by page in worker processes.
 
     Attributes:
         url: URL of the remote file.
         extension: file extension.
         name: file name.
         stem: file name without the extension.
+        max_size: maximum number of bytes to download, None for no limit.
+        timeout: timeout of the download in seconds, None for no timeout.
+        bytes_downloaded: number of bytes downloaded so far.
+        total_bytes: size of the file announced by the server, None if unknown.
+        content_type: MIME type announced by the server, None if unknown.
+        extractor: extractor used to get the text of the file.
+        store: store keeping the file and its text across requests, None to not keep them.
+        is_from_store: whether the stored file was still valid and not downloaded again.
     """
 
-    def __init__(self, url: str) -> None:
+    def __init__(
+        self,
+        url: str,
+        max_size: Optional[int] = None,
+        timeout: Optional[float] = None,
+        directory: Path = DOWNLOAD_DIR,
+        store: Optional[ArtifactStore] = None,
+    ) -> None:
         """Create a new RemoteFile instance.
 
         Args:
             url (str): URL of the remote file.
+            max_size (Optional[int], optional): maximum number of bytes to download. Defaults to None.
+            timeout (Optional[float], optional): timeout of the download in seconds. Defaults to None.
+            directory (Path, optional): directory to download the file to. Defaults to ``DOWNLOAD_DIR``.
+            store (Optional[ArtifactStore], optional): store keeping the file and its text. Defaults to None.
         """
         self.url = url
-        self._local_path = Path(f"{gen_random_string()}{self.extension}")
+        self.max_size = max_size
+        self.timeout = timeout
+        self.bytes_downloaded = 0
+        self.total_bytes: Optional[int] = None
+        self.content_type: Optional[str] = None
+        self._local_path = directory / f"{gen_random_string()}{self.extension}"
         self._is_deleted = False
         self._is_downloaded = False
+        self.store = store
+        self._artifact: Optional[Artifact] = None
+        self.is_from_store = False
+
+    async def __aenter__(self) -> "RemoteFile":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.adelete()
 
     def delete(self):
-        self._local_path.unlink()
+        if self._is_deleted:
+            return
+        if self._artifact is None:
+            self._local_path.unlink(missing_ok=True)
+        else:
+            # stored files outlive the request, the store evicts them once released
+            self.store.release(self._artifact)
         self._is_deleted = True
 
-    def download(self, headers: Optional[Dict[str, str]] = None) -> None:
-        """Download the file at the given URL.
+    async def adelete(self) -> None:
+        """Delete the file in a thread, releasing a stored file may remove its directory."""
+        await asyncio.to_thread(self.delete)
+
+    def _check_size(self, n_bytes: int) -> None:
+        if self.max_size is not None and n_bytes > self.max_size:
+            raise FileTooLargeError(
+                f"File at {self.url} exceeds the maximum size of {self.max_size} bytes."
+            )
+
+    async def download(
+        self,
+        headers: Optional[Dict[str, str]] = None,
+        chunk_size: int = 64 * 1024,
+        on_progress: Optional[Callable[[int, Optional[int]], None]] = None,
+        client: Optional[httpx.AsyncClient] = None,
+    ) -> None:
+        """Stream the file at the given URL to disk.
 
         Args:
             headers (Optional[Dict[str, str]], optional): HTTP headers to send with the request. Defaults to None.
+            chunk_size (int, optional): number of bytes read from the network at a time. Defaults to 64 KiB.
+            on_progress (Optional[Callable[[int, Optional[int]], None]], optional): called after every chunk
+                with the number of bytes downloaded so far and the total size, if known. Defaults to None.
+            client (Optional[httpx.AsyncClient], optional): client to send the request with, reusing its
+                pooled connections. Defaults to None, in which case a new client is created.
+
+        Raises:
+            httpx.HTTPStatusError: if the server responds with an error status.
+            httpx.TimeoutException: if the download exceeds the timeout.
+            FileTooLargeError: if the file exceeds ``max_size``.
         """
-        # generate a random file name to avoid collisions
-        response = requests.get(self.url, headers=headers)
-        response.raise_for_status()
-        with open(self._local_path, "wb") as f:
-            f.write(response.content)
+        self._local_path.parent.mkdir(parents=True, exist_ok=True)
+        self.bytes_downloaded = 0
+
+        stored = (
+            await asyncio.to_thread(self.store.get, self.url)
+            if self.store is not None
+            else None
+        )
+        if stored is not None:
+            headers = {**(headers or {}), **stored.validation_headers}
+
+        try:
+            try:
+                # httpx times out each network operation, not the whole download, so a
+                # server sending a byte now and then would never time out
+                response_headers = await asyncio.wait_for(
+                    self._download(headers, chunk_size, on_progress, client, stored),
+                    timeout=self.timeout,
+                )
+            except asyncio.TimeoutError as e:
+                raise httpx.TimeoutException(
+                    f"Download of {self.url} exceeded {self.timeout} seconds."
+                ) from e
+
+            if response_headers is not None and self.store is not None:
+                # outside of the timeout, which would leave the file stored and pinned if it hit
+                self._use_artifact(
+                    await asyncio.to_thread(
+                        self.store.put_file,
+                        self.url,
+                        self._local_path,
+                        etag=response_headers.get("ETag"),
+                        last_modified=response_headers.get("Last-Modified"),
+                        content_type=self.content_type,
+                    )
+                )
+            self._is_downloaded = True
+        finally:
+            if stored is not None and self._artifact is not stored:
+                # the stored file is outdated or the download failed
+                await asyncio.to_thread(self.store.release, stored)
+
+    async def _download(
+        self,
+        headers: Optional[Dict[str, str]],
+        chunk_size: int,
+        on_progress: Optional[Callable[[int, Optional[int]], None]],
+        client: Optional[httpx.AsyncClient],
+        stored: Optional[Artifact],
+    ) -> Optional[httpx.Headers]:
+        """Download the file, returns the headers of the response, None if ``stored`` is valid."""
+        async with AsyncExitStack() as stack:
+            if client is None:
+                client = await stack.enter_async_context(
+                    httpx.AsyncClient(follow_redirects=True, timeout=self.timeout)
+                )
+            timeout = (
+                self.timeout if self.timeout is not None else httpx.USE_CLIENT_DEFAULT
+            )
+            response = await stack.enter_async_context(
+                client.stream("GET", self.url, headers=headers, timeout=timeout)
+            )
+            if response.status_code == 304 and stored is not None:
+                self._use_artifact(stored)
+                self.is_from_store = True
+                return None
+            response.raise_for_status()
+
+            content_type = response.headers.get("Content-Type")
+            self.content_type = (
+                content_type.split(";")[0].strip() if content_type else None
+            )
+
+            content_length = response.headers.get("Content-Length")
+            self.total_bytes = int(content_length) if content_length else None
+            if self.total_bytes is not None:
+                # fail early instead of downloading a file we would reject anyway
+                self._check_size(self.total_bytes)
 
-        self._is_downloaded = True
+            with open(self._local_path, "wb") as f:
+                async for chunk in response.aiter_bytes(chunk_size):
+                    self.bytes_downloaded += len(chunk)
+                    self._check_size(self.bytes_downloaded)
+                    f.write(chunk)
+                    if on_progress is not None:
+                        on_progress(self.bytes_downloaded, self.total_bytes)
+
+            return response.headers
+
+    def _use_artifact(self, artifact: Artifact) -> None:
+        self._artifact = artifact
+        self._local_path = artifact.raw_path
+        self.content_type = artifact.content_type
+        self.total_bytes = artifact.raw_size
 
     @property
     def _url_path(self) -> Path:
@@ -80,10 +261,62 @@ class RemoteFile:
     def stem(self) -> str:
         return self._url_path.stem
 
+    @property
+    def extractor(self) -> TextExtractor:
+        return get_extractor(self.extension, self.content_type)
+
+    def iter_pages(self) -> Iterator[str]:
+        """Extract text from the file in the current process, page by page.
+
+        Yields:
+            str: text of each page, in order.
+        """
+        yield from self.extractor.iter_pages(self._local_path)
+
+    async def aiter_pages(self) -> AsyncIterator[str]:
+        """Extract text from the file in worker processes, page by page.
+
+        The text of a stored file is read from the store when it was extracted before,
+        and stored once the whole file is extracted otherwise.
+
+        Yields:
+            str: text of each page, in order.
+        """
+        if self._artifact is not None and self._artifact.has_text:
+            # pages are small, reading them from the memory map does not need a thread
+            for page in self.store.iter_pages(self._artifact):
+                yield page
+            return
+
+        pages = []
+        async for page in aiter_pages(self.extractor, self._local_path):
+            pages.append(page)
+            yield page
+
+        if self._artifact is not None:
+            try:
+                await asyncio.to_thread(self.store.put_text, self._artifact, pages)
+            except OSError as e:
+                # the text is extracted again next time
+                logger.warning(
+                    "Unable to store the text of %s: %r",
+                    self.url,
+                    e,
+                    extra={"url": self.url},
+                )
+
     def extract_text(self) -> str:
         """Extract text from the file.
 
         Returns:
             str: text content of the file.
         """
-        return textract.process(str(self._local_path)).decode()
+        return "\n".join(self.iter_pages())
+
+    async def aextract_text(self) -> str:
+        """Extract text from the file in worker processes, without blocking the event loop.
+
+        Returns:
+            str: text content of the file.
+        """
+        return "\n".join([page async for page in self.aiter_pages()])
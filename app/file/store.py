@@ -0,0 +1,457 @@
+import hashlib
+import mmap
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager, suppress
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Union
+
+# separates pages in stored text, the page break of plain text
+PAGE_SEPARATOR = "\f"
+
+
+@dataclass
+class Artifact:
+    url: str
+    directory: Path
+    etag: Optional[str]
+    last_modified: Optional[str]
+    content_type: Optional[str]
+    raw_size: int
+    # None until the text of the file is stored
+    text_size: Optional[int] = None
+    # id of the pin of the file in the store, None once released
+    pin: Optional[str] = None
+
+    @property
+    def raw_path(self) -> Path:
+        return self.directory / "raw"
+
+    @property
+    def text_path(self) -> Path:
+        return self.directory / "text"
+
+    @property
+    def has_text(self) -> bool:
+        return self.text_size is not None
+
+    @property
+    def validation_headers(self) -> Dict[str, str]:
+        """Headers asking the server to answer 304 Not Modified if the file did not change."""
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class ArtifactStore:
+    """On-disk store of downloaded files and their extracted text, keyed by URL.
+
+    Stored files are revalidated with their ``ETag`` and ``Last-Modified`` headers, so an
+    unchanged file is neither downloaded nor extracted again. The least recently used
+    entries are evicted once the store exceeds ``max_bytes``.
+
+    Each download of a URL is stored in a directory of its own, so a new version never
+    overwrites a file another request is still reading. Artifacts returned by ``get`` and
+    ``put_file`` are pinned until ``release``: they are neither evicted nor replaced meanwhile,
+    and their directory is removed once the last request using them releases them.
+
+    Pins are kept in the SQLite index next to the entries, so they hold for every process
+    sharing the directory. A pin expires after ``pin_lease`` seconds, so the files of a
+    process that died without releasing them are eventually removed; requests must not
+    use an artifact for longer than that.
+
+    Attributes:
+        directory: directory of the store.
+        max_bytes: maximum number of bytes of files and text kept in the store.
+        pin_lease: seconds an artifact stays pinned if it is not released.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, Path],
+        max_bytes: int = 1024 * 1024 * 1024,
+        pin_lease: float = 3600.0,
+    ) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.pin_lease = pin_lease
+        self._lock = threading.Lock()
+        # transactions are started explicitly, see ``_transaction``
+        self._connection = sqlite3.connect(
+            self.directory / "index.sqlite3",
+            timeout=60,
+            isolation_level=None,
+            check_same_thread=False,
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        with self._transaction():
+            columns = [
+                row[1]
+                for row in self._connection.execute("PRAGMA table_info(artifacts)")
+            ]
+            if columns and "version" not in columns:
+                # stored before versions, entries were a single directory per URL
+                self._connection.execute("DROP TABLE artifacts")
+                for path in self.directory.iterdir():
+                    if path.is_dir():
+                        shutil.rmtree(path, ignore_errors=True)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS artifacts ("
+                "key TEXT PRIMARY KEY, version TEXT NOT NULL, url TEXT NOT NULL, "
+                "etag TEXT, last_modified TEXT, content_type TEXT, "
+                "raw_size INTEGER NOT NULL, text_size INTEGER, accessed_at REAL NOT NULL)"
+            )
+            # requests using each version directory, and directories to remove once unused
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS pins ("
+                "id TEXT PRIMARY KEY, directory TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS pins_directory ON pins (directory)"
+            )
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS removed (directory TEXT PRIMARY KEY)"
+            )
+
+    @contextmanager
+    def _transaction(self) -> Iterator[None]:
+        """Run statements in a transaction holding the write lock of the index.
+
+        Taken from the start, so no other process pins or removes an entry in between
+        the statements.
+        """
+        with self._lock:
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+
+    @staticmethod
+    def make_key(url: str) -> str:
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    def _make_directory(self, key: str, version: str) -> Path:
+        return self.directory / key / version
+
+    def _make_artifact(self, row) -> Artifact:
+        key, version, url, etag, last_modified, content_type, raw_size, text_size = row
+        return Artifact(
+            url=url,
+            directory=self._make_directory(key, version),
+            etag=etag,
+            last_modified=last_modified,
+            content_type=content_type,
+            raw_size=raw_size,
+            text_size=text_size,
+        )
+
+    def _index_name(self, directory: Path) -> str:
+        return directory.relative_to(self.directory).as_posix()
+
+    def _pin(self, artifact: Artifact) -> None:
+        """Pin a version directory. Call within a transaction."""
+        artifact.pin = uuid.uuid4().hex
+        self._connection.execute(
+            "INSERT INTO pins VALUES (?, ?, ?)",
+            (
+                artifact.pin,
+                self._index_name(artifact.directory),
+                time.time() + self.pin_lease,
+            ),
+        )
+
+    def _is_pinned(self, directory: Path) -> bool:
+        """Whether a request uses a version directory. Call within a transaction."""
+        row = self._connection.execute(
+            "SELECT 1 FROM pins WHERE directory = ? AND expires_at >= ?",
+            (self._index_name(directory), time.time()),
+        ).fetchone()
+        return row is not None
+
+    def _unlink_directory(self, directory: Path) -> Optional[Path]:
+        """Mark a version directory as removed, returns it if no request uses it.
+
+        Call within a transaction, and remove the returned directory with ``_remove_directory``
+        once it is committed.
+        """
+        if self._is_pinned(directory):
+            self._connection.execute(
+                "INSERT OR IGNORE INTO removed VALUES (?)",
+                (self._index_name(directory),),
+            )
+            return None
+        return directory
+
+    def _reap(self) -> List[Path]:
+        """Forget expired pins, returns the removed directories no request uses anymore.
+
+        Call within a transaction, and remove the returned directories with
+        ``_remove_directory`` once it is committed.
+        """
+        self._connection.execute(
+            "DELETE FROM pins WHERE expires_at < ?", (time.time(),)
+        )
+        names = [
+            row[0]
+            for row in self._connection.execute(
+                "SELECT directory FROM removed WHERE directory NOT IN "
+                "(SELECT directory FROM pins)"
+            )
+        ]
+        self._connection.executemany(
+            "DELETE FROM removed WHERE directory = ?", [(name,) for name in names]
+        )
+        return [self.directory / name for name in names]
+
+    @staticmethod
+    def _remove_directory(directory: Optional[Path]) -> None:
+        if directory is None:
+            return
+        shutil.rmtree(directory, ignore_errors=True)
+        # the directory of the URL, once its last version is gone
+        with suppress(OSError):
+            directory.parent.rmdir()
+
+    def get(self, url: str) -> Optional[Artifact]:
+        """Get and pin the stored file at ``url``, marking it as recently used.
+
+        Args:
+            url (str): URL of the file.
+
+        Returns:
+            Optional[Artifact]: the stored file, to ``release`` once done with it. None if not stored.
+        """
+        key = self.make_key(url)
+        with self._transaction():
+            row = self._connection.execute(
+                "SELECT key, version, url, etag, last_modified, content_type, raw_size, "
+                "text_size FROM artifacts WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                "UPDATE artifacts SET accessed_at = ? WHERE key = ?", (time.time(), key)
+            )
+            artifact = self._make_artifact(row)
+            self._pin(artifact)
+
+        if not artifact.raw_path.exists():
+            # removed from disk behind our back, e.g. by a cleaner of the temp directory
+            self.release(artifact)
+            self.delete(url)
+            return None
+        return artifact
+
+    def release(self, artifact: Artifact) -> None:
+        """Unpin a file returned by ``get`` or ``put_file``.
+
+        Args:
+            artifact (Artifact): the stored file, not to be used afterwards.
+        """
+        if artifact.pin is None:
+            return
+        directory = None
+        with self._transaction():
+            self._connection.execute("DELETE FROM pins WHERE id = ?", (artifact.pin,))
+            artifact.pin = None
+            name = self._index_name(artifact.directory)
+            is_removed = self._connection.execute(
+                "SELECT 1 FROM removed WHERE directory = ?", (name,)
+            ).fetchone()
+            if is_removed and not self._is_pinned(artifact.directory):
+                self._connection.execute(
+                    "DELETE FROM removed WHERE directory = ?", (name,)
+                )
+                directory = artifact.directory
+        self._remove_directory(directory)
+
+    def put_file(
+        self,
+        url: str,
+        path: Path,
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+        content_type: Optional[str] = None,
+    ) -> Artifact:
+        """Move a downloaded file into the store, replacing the previous version and its text.
+
+        The previous version is removed once no request uses it anymore.
+
+        Args:
+            url (str): URL the file was downloaded from.
+            path (Path): path of the downloaded file, moved into the store.
+            etag (Optional[str], optional): ``ETag`` header of the response. Defaults to None.
+            last_modified (Optional[str], optional): ``Last-Modified`` header of the response. Defaults to None.
+            content_type (Optional[str], optional): MIME type of the file. Defaults to None.
+
+        Returns:
+            Artifact: the stored file, pinned, to ``release`` once done with it.
+        """
+        key = self.make_key(url)
+        version = uuid.uuid4().hex
+        artifact = Artifact(
+            url=url,
+            directory=self._make_directory(key, version),
+            etag=etag,
+            last_modified=last_modified,
+            content_type=content_type,
+            raw_size=Path(path).stat().st_size,
+        )
+        artifact.directory.mkdir(parents=True, exist_ok=True)
+        os.replace(path, artifact.raw_path)
+
+        with self._transaction():
+            row = self._connection.execute(
+                "SELECT version FROM artifacts WHERE key = ?", (key,)
+            ).fetchone()
+            self._connection.execute(
+                "INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?, ?, ?, ?, NULL, ?)",
+                (
+                    key,
+                    version,
+                    url,
+                    etag,
+                    last_modified,
+                    content_type,
+                    artifact.raw_size,
+                    time.time(),
+                ),
+            )
+            self._pin(artifact)
+            previous_directory = (
+                self._unlink_directory(self._make_directory(key, row[0]))
+                if row is not None
+                else None
+            )
+        self._remove_directory(previous_directory)
+        self.evict()
+        return artifact
+
+    def put_text(self, artifact: Artifact, pages: Iterable[str]) -> None:
+        """Store the text extracted from a stored file.
+
+        Args:
+            artifact (Artifact): the stored file, pinned.
+            pages (Iterable[str]): text of each page of the file.
+        """
+        tmp_path = artifact.directory / f"text.{os.getpid()}.{threading.get_ident()}"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(PAGE_SEPARATOR.join(pages))
+        text_size = tmp_path.stat().st_size
+        os.replace(tmp_path, artifact.text_path)
+        artifact.text_size = text_size
+
+        with self._transaction():
+            # a no-op if the file was replaced by a newer version meanwhile
+            self._connection.execute(
+                "UPDATE artifacts SET text_size = ? WHERE key = ? AND version = ?",
+                (text_size, self.make_key(artifact.url), artifact.directory.name),
+            )
+        self.evict()
+
+    def iter_pages(self, artifact: Artifact) -> Iterator[str]:
+        """Read the stored text of a file page by page through a memory map.
+
+        Pages are decoded one at a time straight from the page cache, the text is never
+        loaded into memory as a whole.
+
+        Args:
+            artifact (Artifact): the stored file, pinned.
+
+        Yields:
+            str: text of each page, in order.
+        """
+        if not artifact.text_size:
+            # empty files can not be memory-mapped
+            yield ""
+            return
+
+        separator = PAGE_SEPARATOR.encode()
+        with (
+            open(artifact.text_path, "rb") as f,
+            mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as text,
+        ):
+            start = 0
+            while True:
+                end = text.find(separator, start)
+                if end == -1:
+                    yield text[start:].decode("utf-8")
+                    return
+                yield text[start:end].decode("utf-8")
+                start = end + len(separator)
+
+    def delete(self, url: str) -> None:
+        """Remove the file at ``url`` and its text from the store, once no request uses them."""
+        key = self.make_key(url)
+        with self._transaction():
+            row = self._connection.execute(
+                "SELECT version FROM artifacts WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return
+            self._connection.execute("DELETE FROM artifacts WHERE key = ?", (key,))
+            directory = self._unlink_directory(self._make_directory(key, row[0]))
+        self._remove_directory(directory)
+
+    def evict(self) -> None:
+        """Remove the least recently used entries until the store fits ``max_bytes``.
+
+        Entries in use are never evicted, e.g. the one just stored. Also removes the
+        replaced versions whose requests are done, or died without releasing them.
+        """
+        with self._transaction():
+            directories = self._reap()
+            rows = self._connection.execute(
+                "SELECT key, version, raw_size + COALESCE(text_size, 0) "
+                "FROM artifacts ORDER BY accessed_at DESC"
+            ).fetchall()
+            total_bytes = 0
+            for key, version, n_bytes in rows:
+                total_bytes += n_bytes
+                directory = self._make_directory(key, version)
+                if total_bytes > self.max_bytes and not self._is_pinned(directory):
+                    self._connection.execute(
+                        "DELETE FROM artifacts WHERE key = ?", (key,)
+                    )
+                    directories.append(directory)
+
+        for directory in directories:
+            self._remove_directory(directory)
+
+
+def make_artifact_store(
+    backend_name: str,
+    directory: Union[str, Path],
+    max_bytes: int = 1024 * 1024 * 1024,
+    pin_lease: float = 3600.0,
+) -> Optional[ArtifactStore]:
+    """Create an artifact store.
+
+    Args:
+        backend_name (str): backend of the store, one of "disk" or "none".
+        directory (Union[str, Path]): directory of the store.
+        max_bytes (int, optional): maximum size of the store in bytes. Defaults to 1 GiB.
+        pin_lease (float, optional): seconds a file stays pinned if not released. Defaults to 3600.
+
+    Returns:
+        Optional[ArtifactStore]: artifact store, None if storing is disabled.
+    """
+    if backend_name == "none":
+        return None
+    if backend_name == "disk":
+        return ArtifactStore(directory, max_bytes=max_bytes, pin_lease=pin_lease)
+
+    raise ValueError(f"Unknown artifact store backend: {backend_name}")
@@ -0,0 +1,238 @@
+import heapq
+import re
+import zlib
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Sequence, Set
+
+# separates paragraphs, the units compared by ``remove_near_duplicates``
+_PARAGRAPH_BREAK = re.compile(r"(\n[ \t]*\n\s*)")
+_DIGITS = re.compile(r"\d+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def _normalize_line(line: str) -> str:
+    # page numbers and dates change from page to page, the rest of a header does not
+    return _WHITESPACE.sub(" ", _DIGITS.sub("#", line)).strip().lower()
+
+
+def _edge_line_indices(lines: List[str], n_edge_lines: int) -> List[int]:
+    """Indices of the first and last non-blank lines, where headers and footers are."""
+    non_blank = [i for i, line in enumerate(lines) if line.strip()]
+    if len(non_blank) <= 2 * n_edge_lines:
+        return non_blank
+    return non_blank[:n_edge_lines] + non_blank[-n_edge_lines:]
+
+
+def find_repeated_lines(
+    pages: Sequence[str],
+    min_pages: int = 3,
+    min_page_fraction: float = 0.5,
+    n_edge_lines: int = 3,
+) -> Set[str]:
+    """Find the lines repeated at the top or bottom of many pages, e.g. headers and footers.
+
+    Lines are compared with digits masked, so "Page 3 of 12" and "Page 4 of 12" are the same.
+
+    Args:
+        pages (Sequence[str]): text of each page.
+        min_pages (int, optional): minimum number of pages a line is on. Defaults to 3.
+        min_page_fraction (float, optional): minimum fraction of the pages a line is on.
+            Defaults to 0.5.
+        n_edge_lines (int, optional): number of lines at the top and at the bottom of a page
+            searched for repeated lines. Defaults to 3.
+
+    Returns:
+        Set[str]: normalized repeated lines, see ``remove_repeated_lines``.
+    """
+    pages = [page for page in pages if page.strip()]
+    n_pages_by_line: Counter = Counter()
+    for page in pages:
+        lines = page.splitlines()
+        n_pages_by_line.update(
+            {_normalize_line(lines[i]) for i in _edge_line_indices(lines, n_edge_lines)}
+        )
+
+    min_count = max(min_pages, min_page_fraction * len(pages))
+    return {line for line, count in n_pages_by_line.items() if count >= min_count}
+
+
+def remove_repeated_lines(
+    pages: Sequence[str],
+    min_pages: int = 3,
+    min_page_fraction: float = 0.5,
+    n_edge_lines: int = 3,
+) -> List[str]:
+    """Remove the lines repeated at the top or bottom of many pages, see ``find_repeated_lines``.
+
+    Args:
+        pages (Sequence[str]): text of each page.
+        min_pages (int, optional): minimum number of pages a line is on. Defaults to 3.
+        min_page_fraction (float, optional): minimum fraction of the pages a line is on.
+            Defaults to 0.5.
+        n_edge_lines (int, optional): number of lines at the top and at the bottom of a page
+            searched for repeated lines. Defaults to 3.
+
+    Returns:
+        List[str]: text of each page without the repeated lines.
+    """
+    repeated_lines = find_repeated_lines(
+        pages, min_pages, min_page_fraction, n_edge_lines
+    )
+    if not repeated_lines:
+        return list(pages)
+
+    filtered_pages = []
+    for page in pages:
+        lines = page.splitlines(keepends=True)
+        removed = {
+            i
+            for i in _edge_line_indices(lines, n_edge_lines)
+            if _normalize_line(lines[i]) in repeated_lines
+        }
+        filtered_pages.append(
+            "".join(line for i, line in enumerate(lines) if i not in removed)
+        )
+    return filtered_pages
+
+
+def strip_sections(pages: Sequence[str], titles: Sequence[str]) -> List[str]:
+    """Drop everything from the last heading with one of the given titles, e.g. "References".
+
+    Headings are lines holding only the title, optionally numbered or in markdown, so
+    mentions of the title in the text are left alone. The last heading is used, as the
+    first one may be in a table of contents.
+
+    Args:
+        pages (Sequence[str]): text of each page.
+        titles (Sequence[str]): titles of the sections to drop, matched case-insensitively.
+
+    Returns:
+        List[str]: text of each page, up to the heading.
+    """
+    pages = list(pages)
+    if not titles:
+        return pages
+
+    heading = re.compile(
+        r"^[ \t]*(?:#{1,6}[ \t]*)?(?:\d+(?:\.\d+)*\.?[ \t]+|[IVX]+\.[ \t]+)?"
+        rf"(?:{'|'.join(re.escape(title) for title in titles)})[ \t]*:?[ \t]*$",
+        re.IGNORECASE | re.MULTILINE,
+    )
+    for page_index in range(len(pages) - 1, -1, -1):
+        matches = list(heading.finditer(pages[page_index]))
+        if matches:
+            pages[page_index] = pages[page_index][: matches[-1].start()]
+            return pages[: page_index + 1]
+    return pages
+
+
+def _sketch(text: str, shingle_words: int, sketch_size: int) -> List[int]:
+    """Bottom-k MinHash sketch of the word shingles of a text: their smallest hashes."""
+    words = _WHITESPACE.split(text.lower())
+    shingles = {
+        " ".join(words[i : i + shingle_words])
+        for i in range(max(1, len(words) - shingle_words + 1))
+    }
+    # crc32 is stable across processes, so the same text is always filtered the same way
+    hashes = {zlib.crc32(shingle.encode()) for shingle in shingles}
+    return sorted(heapq.nsmallest(sketch_size, hashes))
+
+
+def _estimate_similarity(sketch: List[int], other_sketch: List[int]) -> float:
+    """Estimate the Jaccard similarity of two texts from their bottom-k sketches."""
+    sketch_size = max(len(sketch), len(other_sketch))
+    union = heapq.nsmallest(sketch_size, set(sketch) | set(other_sketch))
+    shared = set(sketch) & set(other_sketch)
+    return sum(1 for value in union if value in shared) / len(union)
+
+
+def remove_near_duplicates(
+    pages: Sequence[str],
+    min_similarity: float = 0.8,
+    min_words: int = 20,
+    shingle_words: int = 5,
+    sketch_size: int = 64,
+) -> List[str]:
+    """Remove paragraphs that nearly repeat an earlier paragraph, e.g. repeated license text.
+
+    Paragraphs are compared by the Jaccard similarity of their word shingles, estimated with
+    MinHash sketches. Only paragraphs sharing sketch values are compared, so the cost grows
+    with the number of paragraphs rather than its square.
+
+    Args:
+        pages (Sequence[str]): text of each page.
+        min_similarity (float, optional): similarity above which a paragraph is a duplicate.
+            Defaults to 0.8.
+        min_words (int, optional): shorter paragraphs, e.g. headings, are always kept. Defaults to 20.
+        shingle_words (int, optional): number of words of a shingle. Defaults to 5.
+        sketch_size (int, optional): number of hashes in a sketch. Defaults to 64.
+
+    Returns:
+        List[str]: text of each page without the duplicate paragraphs.
+    """
+    sketches: List[List[int]] = []
+    paragraphs_by_value: Dict[int, List[int]] = defaultdict(list)
+
+    def is_duplicate(paragraph: str) -> bool:
+        if len(paragraph.split()) < min_words:
+            return False
+
+        sketch = _sketch(paragraph, shingle_words, sketch_size)
+        # sketches of near duplicates share most of their values, skip the other paragraphs
+        min_shared_values = max(1, int(min_similarity * len(sketch) / 2))
+        n_shared_values: Counter = Counter()
+        for value in sketch:
+            n_shared_values.update(paragraphs_by_value.get(value, ()))
+        for other_index, count in n_shared_values.most_common():
+            if count < min_shared_values:
+                break
+            if _estimate_similarity(sketch, sketches[other_index]) >= min_similarity:
+                return True
+
+        for value in sketch:
+            paragraphs_by_value[value].append(len(sketches))
+        sketches.append(sketch)
+        return False
+
+    filtered_pages = []
+    for page in pages:
+        # odd parts are the paragraph breaks, kept so the layout of the page is unchanged
+        parts = _PARAGRAPH_BREAK.split(page)
+        filtered_pages.append(
+            "".join(
+                part
+                for i, part in enumerate(parts)
+                if i % 2 == 1 or not is_duplicate(part)
+            )
+        )
+    return filtered_pages
+
+
+def filter_pages(
+    pages: Sequence[str],
+    repeated_lines: bool = True,
+    near_duplicates: bool = True,
+    strip_section_titles: Optional[Sequence[str]] = None,
+    min_similarity: float = 0.8,
+) -> List[str]:
+    """Remove the text of a document that does not need summarizing.
+
+    Args:
+        pages (Sequence[str]): text of each page.
+        repeated_lines (bool, optional): remove lines repeated on many pages. Defaults to True.
+        near_duplicates (bool, optional): remove near-duplicate paragraphs. Defaults to True.
+        strip_section_titles (Optional[Sequence[str]], optional): drop everything from the last
+            heading with one of these titles, e.g. ["References"]. Defaults to None.
+        min_similarity (float, optional): similarity above which a paragraph is a duplicate.
+            Defaults to 0.8.
+
+    Returns:
+        List[str]: filtered text of each page.
+    """
+    if strip_section_titles:
+        pages = strip_sections(pages, strip_section_titles)
+    if repeated_lines:
+        pages = remove_repeated_lines(pages)
+    if near_duplicates:
+        pages = remove_near_duplicates(pages, min_similarity=min_similarity)
+    return list(pages)
@@ -0,0 +1,150 @@
+import asyncio
+import importlib.util
+from logging import INFO, getLogger
+from typing import AsyncIterator, Callable, Dict, Optional
+
+import httpx
+
+from .config import (
+    DOWNLOAD_TIMEOUT,
+    HTTP2,
+    HTTP_CONNECT_TIMEOUT,
+    HTTP_KEEPALIVE_EXPIRY,
+    HTTP_MAX_CONNECTIONS,
+    HTTP_MAX_CONNECTIONS_PER_HOST,
+    HTTP_MAX_KEEPALIVE_CONNECTIONS,
+)
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+
+class _ReleasingStream(httpx.AsyncByteStream):
+    """Response body calling ``release`` once it is closed."""
+
+    def __init__(self, stream: httpx.AsyncByteStream, release: Callable[[], None]):
+        self._stream = stream
+        self._release: Optional[Callable[[], None]] = release
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self) -> None:
+        try:
+            await self._stream.aclose()
+        finally:
+            if self._release is not None:
+                self._release()
+                self._release = None
+
+
+class HostLimitedTransport(httpx.AsyncBaseTransport):
+    """Transport allowing at most ``max_requests_per_host`` requests in flight to each host.
+
+    A request holds its slot until its response body is closed, so a few slow downloads
+    from one host can not take all the connections of the pool.
+    """
+
+    def __init__(
+        self, transport: httpx.AsyncBaseTransport, max_requests_per_host: int
+    ) -> None:
+        self._transport = transport
+        self.max_requests_per_host = max_requests_per_host
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        host = request.url.host
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self.max_requests_per_host)
+        semaphore = self._semaphores[host]
+
+        await semaphore.acquire()
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        response.stream = _ReleasingStream(response.stream, semaphore.release)
+        return response
+
+    async def aclose(self) -> None:
+        await self._transport.aclose()
+
+
+def make_http_client(
+    max_connections: int = HTTP_MAX_CONNECTIONS,
+    max_keepalive_connections: int = HTTP_MAX_KEEPALIVE_CONNECTIONS,
+    keepalive_expiry: float = HTTP_KEEPALIVE_EXPIRY,
+    max_connections_per_host: int = HTTP_MAX_CONNECTIONS_PER_HOST,
+    timeout: float = DOWNLOAD_TIMEOUT,
+    connect_timeout: float = HTTP_CONNECT_TIMEOUT,
+    http2: bool = HTTP2,
+) -> httpx.AsyncClient:
+    """Create an HTTP client for downloading files.
+
+    Connections are pooled and kept alive, so repeated downloads from the same host skip
+    the TCP and TLS handshakes. Responses are decompressed transparently: gzip and deflate
+    always, brotli if the ``brotli`` package is installed.
+
+    Args:
+        max_connections (int, optional): maximum number of open connections.
+            Defaults to ``HTTP_MAX_CONNECTIONS``.
+        max_keepalive_connections (int, optional): maximum number of idle connections kept open.
+            Defaults to ``HTTP_MAX_KEEPALIVE_CONNECTIONS``.
+        keepalive_expiry (float, optional): seconds an idle connection is kept open.
+            Defaults to ``HTTP_KEEPALIVE_EXPIRY``.
+        max_connections_per_host (int, optional): maximum number of requests in flight to a host.
+            Defaults to ``HTTP_MAX_CONNECTIONS_PER_HOST``.
+        timeout (float, optional): timeout of reads, writes and waiting for a pooled connection, in seconds.
+            Defaults to ``DOWNLOAD_TIMEOUT``.
+        connect_timeout (float, optional): timeout of establishing a connection, in seconds.
+            Defaults to ``HTTP_CONNECT_TIMEOUT``.
+        http2 (bool, optional): negotiate HTTP/2, requires the ``h2`` package. Defaults to ``HTTP2``.
+
+    Returns:
+        httpx.AsyncClient: HTTP client.
+    """
+    if http2 and importlib.util.find_spec("h2") is None:
+        logger.warning("HTTP/2 requires the h2 package, falling back to HTTP/1.1.")
+        http2 = False
+
+    limits = httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=max_keepalive_connections,
+        keepalive_expiry=keepalive_expiry,
+    )
+    transport = HostLimitedTransport(
+        httpx.AsyncHTTPTransport(limits=limits, http2=http2),
+        max_requests_per_host=max_connections_per_host,
+    )
+    return httpx.AsyncClient(
+        transport=transport,
+        follow_redirects=True,
+        timeout=httpx.Timeout(timeout, connect=connect_timeout),
+        headers={"User-Agent": "brevity"},
+    )
+
+
+_http_client: Optional[httpx.AsyncClient] = None
+
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get the HTTP client shared by all downloads, creating it on first use.
+
+    Returns:
+        httpx.AsyncClient: shared HTTP client.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = make_http_client()
+    return _http_client
+
+
+async def close_http_client() -> None:
+    """Close the shared HTTP client and its connections, if it was created."""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
@@ -0,0 +1,411 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from logging import INFO, getLogger
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple, Union
+
+from fastapi.exceptions import HTTPException
+
+from .pipeline import EventCallback, summarize_file
+from .schema import Job, JobStatus, ProgressEvent, SummaryParameters, SummaryResponse
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# runs a summarization, reporting its progress to the callback
+SummarizeFunction = Callable[
+    [SummaryParameters, EventCallback], Awaitable[SummaryResponse]
+]
+
+
+class JobStore(ABC):
+    """Storage of summarization jobs."""
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Job]:
+        """Get the job with the given id, None if there is none."""
+
+    @abstractmethod
+    def save(self, job: Job) -> None:
+        """Insert or update a job."""
+
+    @abstractmethod
+    def claimable(self) -> List[Job]:
+        """Get the jobs that are pending, or running without a live lease, oldest first."""
+
+    @abstractmethod
+    def claim(self, job_id: str, owner: str, lease: float) -> Optional[Job]:
+        """Take a pending job, or a running job whose lease expired, to run it.
+
+        Args:
+            job_id (str): id of the job.
+            owner (str): id of the queue running the job.
+            lease (float): seconds the job is held without renewing the lease.
+
+        Returns:
+            Optional[Job]: the job, None if it is finished or held by another owner.
+        """
+
+    @abstractmethod
+    def renew(self, job_id: str, owner: str, lease: float) -> bool:
+        """Extend the lease of a running job, False if ``owner`` does not hold it anymore."""
+
+
+class InMemoryJobStore(JobStore):
+    """Job store living in the current process, jobs are lost on restart.
+
+    Finished jobs are forgotten after ``ttl`` seconds, and the oldest ones first once more
+    than ``max_finished`` are kept. Pending and running jobs are always kept.
+
+    Attributes:
+        max_finished: maximum number of finished jobs kept in the store.
+        ttl: number of seconds a finished job is kept, None to keep it until evicted.
+    """
+
+    def __init__(self, max_finished: int = 1000, ttl: Optional[float] = None) -> None:
+        self.max_finished = max_finished
+        self.ttl = ttl
+        self._jobs: Dict[str, Job] = {}
+        # owner and lease expiry of the running jobs
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        # ids of the finished jobs and the time they finished at, oldest first
+        self._finished: "OrderedDict[str, float]" = OrderedDict()
+
+    def _evict(self) -> None:
+        now = time.time()
+        while self._finished:
+            job_id, finished_at = next(iter(self._finished.items()))
+            is_expired = self.ttl is not None and now - finished_at > self.ttl
+            if len(self._finished) <= self.max_finished and not is_expired:
+                break
+            del self._finished[job_id]
+            del self._jobs[job_id]
+            self._leases.pop(job_id, None)
+
+    def get(self, job_id: str) -> Optional[Job]:
+        self._evict()
+        return self._jobs.get(job_id)
+
+    def save(self, job: Job) -> None:
+        self._jobs[job.id] = job
+        if (
+            job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED)
+            and job.id not in self._finished
+        ):
+            self._finished[job.id] = time.time()
+        self._evict()
+
+    def _is_claimable(self, job: Job) -> bool:
+        if job.status == JobStatus.PENDING:
+            return True
+        if job.status != JobStatus.RUNNING:
+            return False
+        _, expires_at = self._leases.get(job.id, (None, 0.0))
+        return expires_at < time.time()
+
+    def claimable(self) -> List[Job]:
+        jobs = [job for job in self._jobs.values() if self._is_claimable(job)]
+        return sorted(jobs, key=lambda job: job.created_at)
+
+    def claim(self, job_id: str, owner: str, lease: float) -> Optional[Job]:
+        job = self._jobs.get(job_id)
+        if job is None or not self._is_claimable(job):
+            return None
+        self._leases[job_id] = (owner, time.time() + lease)
+        job.status = JobStatus.RUNNING
+        return job
+
+    def renew(self, job_id: str, owner: str, lease: float) -> bool:
+        job = self._jobs.get(job_id)
+        if job is None or job.status != JobStatus.RUNNING:
+            return False
+        if self._leases.get(job_id, (None, 0.0))[0] != owner:
+            return False
+        self._leases[job_id] = (owner, time.time() + lease)
+        return True
+
+
+class SQLiteJobStore(JobStore):
+    """Job store persisted to a SQLite database, jobs survive restarts.
+
+    The store can be shared by several processes, each job is claimed by a single one of
+    them, see ``claim``.
+
+    Attributes:
+        path: path of the SQLite database file.
+    """
+
+    def __init__(self, path: Union[str, Path] = "jobs.sqlite3") -> None:
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(
+            self.path, timeout=60, check_same_thread=False
+        )
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, "
+                "created_at REAL NOT NULL, value TEXT NOT NULL, "
+                "owner TEXT, expires_at REAL)"
+            )
+            columns = [
+                row[1] for row in self._connection.execute("PRAGMA table_info(jobs)")
+            ]
+            if "owner" not in columns:
+                # created before leases, running jobs are claimable right away
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+                self._connection.execute("ALTER TABLE jobs ADD COLUMN expires_at REAL")
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT value FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return Job.model_validate_json(row[0]) if row else None
+
+    def save(self, job: Job) -> None:
+        with self._lock, self._connection:
+            # keeps the lease of the job
+            self._connection.execute(
+                "INSERT INTO jobs (id, status, created_at, value) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET "
+                "status = excluded.status, value = excluded.value",
+                (job.id, job.status.value, job.created_at, job.model_dump_json()),
+            )
+
+    # pending jobs, and running jobs whose owner died or stopped renewing their lease
+    _CLAIMABLE = (
+        "(status = 'pending' OR "
+        "(status = 'running' AND (expires_at IS NULL OR expires_at < ?)))"
+    )
+
+    def claimable(self) -> List[Job]:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT value FROM jobs WHERE {self._CLAIMABLE} ORDER BY created_at",
+                (time.time(),),
+            ).fetchall()
+        return [Job.model_validate_json(row[0]) for row in rows]
+
+    def claim(self, job_id: str, owner: str, lease: float) -> Optional[Job]:
+        now = time.time()
+        with self._lock, self._connection:
+            # a single statement, so two processes never both claim the job
+            cursor = self._connection.execute(
+                "UPDATE jobs SET status = 'running', owner = ?, expires_at = ? "
+                f"WHERE id = ? AND {self._CLAIMABLE}",
+                (owner, now + lease, job_id, now),
+            )
+            if cursor.rowcount == 0:
+                return None
+            row = self._connection.execute(
+                "SELECT value FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        job = Job.model_validate_json(row[0])
+        job.status = JobStatus.RUNNING
+        return job
+
+    def renew(self, job_id: str, owner: str, lease: float) -> bool:
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "UPDATE jobs SET expires_at = ? "
+                "WHERE id = ? AND owner = ? AND status = 'running'",
+                (time.time() + lease, job_id, owner),
+            )
+        return cursor.rowcount > 0
+
+
+def make_job_store(
+    backend_name: str,
+    path: Union[str, Path] = "jobs.sqlite3",
+    max_finished: int = 1000,
+    ttl: Optional[float] = None,
+) -> JobStore:
+    """Create a job store.
+
+    Args:
+        backend_name (str): backend of the store, one of "memory" or "sqlite".
+        path (Union[str, Path], optional): SQLite database file. Defaults to "jobs.sqlite3".
+        max_finished (int, optional): maximum number of finished jobs kept in memory. Defaults to 1000.
+        ttl (Optional[float], optional): seconds finished jobs are kept in memory. Defaults to None.
+
+    Returns:
+        JobStore: job store.
+    """
+    if backend_name == "memory":
+        return InMemoryJobStore(max_finished=max_finished, ttl=ttl)
+    if backend_name == "sqlite":
+        return SQLiteJobStore(path)
+
+    raise ValueError(f"Unknown job store backend: {backend_name}")
+
+
+class JobQueue:
+    """Runs summarization jobs in the background with a bounded number of workers.
+
+    Jobs are independent of the HTTP request that submitted them, so they keep running
+    when the client disconnects. Submitting parameters identical to a job that is still
+    pending or running returns that job instead of starting a new one.
+
+    Queues of several processes can share a store: a job is claimed before it runs, and
+    its lease is renewed while it runs. Every ``lease`` seconds, each queue also takes
+    over the jobs of the queues that died.
+    """
+
+    def __init__(
+        self,
+        store: JobStore,
+        max_concurrent_jobs: int = 4,
+        summarize: SummarizeFunction = summarize_file,
+        lease: float = 60.0,
+    ) -> None:
+        """Create a new JobQueue instance.
+
+        Args:
+            store (JobStore): store keeping the jobs.
+            max_concurrent_jobs (int, optional): number of jobs running at the same time. Defaults to 4.
+            summarize (SummarizeFunction, optional): runs a single job. Defaults to ``summarize_file``.
+            lease (float, optional): seconds a running job is held without renewing its lease. Defaults to 60.
+        """
+        self.store = store
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.summarize = summarize
+        self.lease = lease
+        # holds the leases of the jobs run by this queue
+        self._owner = uuid.uuid4().hex
+        self._queue: "asyncio.Queue[str]" = asyncio.Queue()
+        # ids of the jobs in the queue
+        self._queued: Set[str] = set()
+        self._in_flight: Dict[str, str] = {}
+        self._workers: List[asyncio.Task] = []
+
+    @staticmethod
+    def _dedup_key(summary_parameters: SummaryParameters) -> str:
+        # every parameter, e.g. the summary mode, changes the summary
+        return hashlib.sha256(summary_parameters.model_dump_json().encode()).hexdigest()
+
+    def _enqueue(self, job: Job) -> None:
+        if job.id in self._queued:
+            return
+        self._queued.add(job.id)
+        self._in_flight[self._dedup_key(job.summary_parameters)] = job.id
+        self._queue.put_nowait(job.id)
+
+    async def _resume(self) -> None:
+        while True:
+            for job in self.store.claimable():
+                self._enqueue(job)
+            await asyncio.sleep(self.lease)
+
+    async def start(self) -> None:
+        """Start the workers and resume the unfinished jobs no other queue is running."""
+        self._workers = [
+            asyncio.create_task(self._work()) for _ in range(self.max_concurrent_jobs)
+        ]
+        self._workers.append(asyncio.create_task(self._resume()))
+
+    async def stop(self) -> None:
+        """Stop the workers, running jobs are pending again and resume on the next start."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def submit(self, summary_parameters: SummaryParameters) -> Job:
+        """Queue a summarization job.
+
+        Args:
+            summary_parameters (SummaryParameters): parameters for summarization.
+
+        Returns:
+            Job: the new job, or the unfinished job with identical parameters.
+        """
+        dedup_key = self._dedup_key(summary_parameters)
+        if dedup_key in self._in_flight:
+            job = self.store.get(self._in_flight[dedup_key])
+            # the job may have been run to completion by another queue
+            if job is not None and job.status in (JobStatus.PENDING, JobStatus.RUNNING):
+                return job
+
+        now = time.time()
+        job = Job(
+            id=uuid.uuid4().hex,
+            summary_parameters=summary_parameters,
+            created_at=now,
+            updated_at=now,
+        )
+        self.store.save(job)
+        self._enqueue(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.store.get(job_id)
+
+    def _update(self, job: Job, **changes) -> None:
+        for name, value in changes.items():
+            setattr(job, name, value)
+        job.updated_at = time.time()
+        self.store.save(job)
+
+    def _on_event(self, job: Job, event: ProgressEvent) -> None:
+        progress = job.progress.model_copy(update={"stage": event.event})
+        if event.event == "chunk":
+            progress.n_chunks = event.data["n_chunks"]
+            progress.n_chunks_done = event.data["n_chunks_done"]
+        self._update(job, progress=progress)
+
+    async def _work(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                # None if another queue runs or ran the job
+                job = self.store.claim(job_id, self._owner, self.lease)
+                if job is not None:
+                    await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _hold(self, job: Job, summary: asyncio.Task) -> None:
+        """Renew the lease of a running job, stop running it once the lease is lost."""
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            if not self.store.renew(job.id, self._owner, self.lease):
+                logger.warning(f"Job {job.id} was taken over by another queue.")
+                summary.cancel()
+                return
+
+    async def _run(self, job: Job) -> None:
+        self._update(job, status=JobStatus.RUNNING)
+        summary = asyncio.create_task(
+            self.summarize(
+                job.summary_parameters, lambda event: self._on_event(job, event)
+            )
+        )
+        holder = asyncio.create_task(self._hold(job, summary))
+        try:
+            result = await summary
+        except asyncio.CancelledError:
+            if holder.done():
+                # the lease was lost, the job is run by another queue
+                return
+            # the queue is stopping, any queue resumes the job
+            self._update(job, status=JobStatus.PENDING)
+            raise
+        except HTTPException as e:
+            self._update(job, status=JobStatus.FAILED, error=e.detail)
+        except Exception as e:
+            logger.exception(f"Job {job.id} failed.")
+            self._update(job, status=JobStatus.FAILED, error=str(e))
+        else:
+            self._update(job, status=JobStatus.SUCCEEDED, result=result)
+        finally:
+            holder.cancel()
+            if job.status in (JobStatus.SUCCEEDED, JobStatus.FAILED):
+                self._in_flight.pop(self._dedup_key(job.summary_parameters), None)
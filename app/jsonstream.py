@@ -0,0 +1,82 @@
+import json
+from typing import Any, List
+
+
+class JSONArrayParser:
+    """Incremental parser of a JSON array, decoding each element as soon as it is complete.
+
+    Text is fed piece by piece, e.g. as a model generates it. Anything before the opening
+    bracket, such as a markdown code fence, is skipped.
+
+    Attributes:
+        items: decoded elements of the array so far.
+        is_done: whether the closing bracket of the array was reached.
+    """
+
+    def __init__(self) -> None:
+        self.items: List[Any] = []
+        self.is_done = False
+        # 0 before the array, 1 between its elements, more inside an element
+        self._depth = 0
+        self._in_string = False
+        self._is_escaped = False
+        self._element: List[str] = []
+
+    def _end_element(self) -> None:
+        element = "".join(self._element).strip()
+        self._element = []
+        if element:
+            # raises json.JSONDecodeError on malformed elements
+            self.items.append(json.loads(element))
+
+    def feed(self, text: str) -> List[Any]:
+        """Parse the next piece of text.
+
+        Args:
+            text (str): text following the previously fed text.
+
+        Raises:
+            json.JSONDecodeError: if a complete element is not valid JSON.
+
+        Returns:
+            List[Any]: elements completed by this piece of text.
+        """
+        n_items = len(self.items)
+        for char in text:
+            if self.is_done:
+                break
+
+            if self._depth == 0:
+                if char == "[":
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                self._element.append(char)
+                if self._is_escaped:
+                    self._is_escaped = False
+                elif char == "\\":
+                    self._is_escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 1 and char in ",]":
+                self._end_element()
+                if char == "]":
+                    self._depth = 0
+                    self.is_done = True
+                continue
+
+            self._element.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+                if self._depth == 1:
+                    # an object or array element is complete without waiting for the comma
+                    self._end_element()
+
+        return self.items[n_items:]
@@ -0,0 +1,87 @@
+import json
+import logging
+import sys
+from typing import Optional
+
+from .config import LOG_FORMAT, LOG_LEVEL, RICH_CONSOLE
+
+# attributes of every log record, anything else was passed with ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as one JSON object per line, with the fields passed in ``extra``."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def make_handler(
+    log_format: str = LOG_FORMAT, rich: bool = RICH_CONSOLE
+) -> logging.Handler:
+    """Create the handler of the app logs.
+
+    Args:
+        log_format (str, optional): one of "text" or "json". Defaults to ``LOG_FORMAT``.
+        rich (bool, optional): render records with rich instead, for development.
+            Defaults to ``RICH_CONSOLE``.
+
+    Returns:
+        logging.Handler: log handler.
+    """
+    if rich:
+        # imported here, rich is only needed for the development sink
+        from rich.logging import RichHandler
+
+        return RichHandler(rich_tracebacks=True, markup=False)
+
+    handler = logging.StreamHandler(sys.stderr)
+    if log_format == "json":
+        handler.setFormatter(JSONFormatter())
+    elif log_format == "text":
+        handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s")
+        )
+    else:
+        raise ValueError(f"Unknown log format: {log_format}")
+    return handler
+
+
+def configure_logging(
+    level: str = LOG_LEVEL,
+    log_format: str = LOG_FORMAT,
+    rich: bool = RICH_CONSOLE,
+    handler: Optional[logging.Handler] = None,
+) -> None:
+    """Send the logs of the app to a single handler, at the given level.
+
+    Call once at startup, after the modules of the app are imported.
+
+    Args:
+        level (str, optional): minimum level of the logs, e.g. "INFO". Defaults to ``LOG_LEVEL``.
+        log_format (str, optional): one of "text" or "json". Defaults to ``LOG_FORMAT``.
+        rich (bool, optional): render logs with rich, for development. Defaults to ``RICH_CONSOLE``.
+        handler (Optional[logging.Handler], optional): handler replacing the default one.
+            Defaults to None.
+    """
+    app_logger = logging.getLogger("app")
+    for handler_ in list(app_logger.handlers):
+        app_logger.removeHandler(handler_)
+    app_logger.addHandler(handler or make_handler(log_format, rich))
+    app_logger.propagate = False
+
+    # modules set their own level, the configured level applies to all of them
+    for name in list(logging.root.manager.loggerDict):
+        if name == "app" or name.startswith("app."):
+            logging.getLogger(name).setLevel(level)
@@ -1,22 +1,64 @@
+import asyncio
 import os
-from typing import List
+from typing import AsyncIterator, Optional
 
 import openai
-import requests
-import tiktoken
-from dotenv import load_dotenv
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from fastapi.exceptions import HTTPException
+from fastapi.responses import StreamingResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+from .config import (
+    JOB_LEASE,
+    JOB_STORE,
+    JOB_STORE_MAX_FINISHED,
+    JOB_STORE_PATH,
+    JOB_TTL,
+    MAX_CONCURRENT_JOBS,
+    STREAM_KEEP_ALIVE_INTERVAL,
+)
+from .file.extract import shutdown_extraction_pool
+from .http_client import close_http_client
+from .jobs import JobQueue, make_job_store
+from .logs import configure_logging
+from .pipeline import plan_file, summarize_batch, summarize_file
+from .prompts import SummaryLength, SummaryMode
+from .providers import AIModel, get_provider
+from .schema import (
+    BatchRequest,
+    BatchResponse,
+    Job,
+    ProgressEvent,
+    SummaryParameters,
+    SummaryPlan,
+    SummaryResponse,
+)
 
-from .display import print_to_console
-from .file.remote import RemoteFile
-from .prompts import ChainOfDensityPrompt, JoinSummariesPrompt, Summary, SummaryLength
-from .schema import SummaryParameters, SummaryResponse
-from .summarizer import AIModel, AITextSummarizer
-
-load_dotenv(".env")
 openai.api_key = os.environ["OPENAI_API_KEY"]
+configure_logging()
 app = FastAPI()
+job_queue = JobQueue(
+    make_job_store(
+        JOB_STORE,
+        path=JOB_STORE_PATH,
+        max_finished=JOB_STORE_MAX_FINISHED,
+        ttl=JOB_TTL,
+    ),
+    max_concurrent_jobs=MAX_CONCURRENT_JOBS,
+    lease=JOB_LEASE,
+)
+
+
+@app.on_event("startup")
+async def startup() -> None:
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    await job_queue.stop()
+    await close_http_client()
+    shutdown_extraction_pool()
 
 
 @app.get("/")
@@ -24,147 +66,203 @@ async def root():
     return {"message": "Hey, I'm Brevity!"}
 
 
-def split_into_chunks(
-    text: str, max_tokens_per_chunk: int, model_name: str
-) -> List[str]:
-    chunks = []
-    tokenizer = tiktoken.encoding_for_model(model_name=model_name)
-    tokens = tokenizer.encode(text)
-    for i in range(0, len(tokens), max_tokens_per_chunk):
-        chunks.append(tokenizer.decode(tokens[i : i + max_tokens_per_chunk]))
-    return chunks
+@app.get("/metrics")
+async def metrics() -> Response:
+    """Prometheus metrics: time spent in each stage, model calls, tokens and cache hits."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
 
 
-def chunk_and_summarize(
-    text: str, summarizer: AITextSummarizer, max_tokens_per_chunk: int
-) -> Summary:
-    """Summarize text over the context length of the model.
+@app.get("/api/v1/summarize/file")
+async def summarize_file_at_url(
+    url: str = "https://arxiv.org/pdf/2309.10668.pdf",
+    model: AIModel = AIModel.gpt_3_5_turbo,
+    summary_length: SummaryLength = SummaryLength.MEDIUM,
+    summary_mode: SummaryMode = SummaryMode.DENSE,
+    incremental: bool = False,
+    include_timings: bool = False,
+) -> SummaryResponse:
+    """Given a URL pointing to a file, fetch the file and return a summary of the content.
 
     Args:
-        text (str): _description_
-        summarizer (AITextSummarizer): _description_
-        max_chunk_length (int): _description_
+        summary_parameters (SummaryParameters): parameters for summarization.
+        summary_mode (SummaryMode): "fast" or "final" generate fewer densification rounds,
+            for lower latency and cost.
+        incremental (bool): reuse the summaries of the chunks that did not change since the
+            document was last summarized.
+        include_timings (bool): add the seconds spent in each stage to the response.
+    """
+    summary_parameters = SummaryParameters(
+        url=url,
+        model_name=model.value,
+        summary_length=summary_length,
+        summary_mode=summary_mode,
+        incremental=incremental,
+    )
+    return await summarize_file(summary_parameters, include_timings=include_timings)
 
-    Raises:
-        HTTPException: _description_
-        HTTPException: _description_
 
-    Returns:
-        Summary: _description_
+@app.get("/api/v1/summarize/plan")
+async def plan_summary_of_file_at_url(
+    url: str = "https://arxiv.org/pdf/2309.10668.pdf",
+    model: AIModel = AIModel.gpt_3_5_turbo,
+    summary_length: SummaryLength = SummaryLength.MEDIUM,
+    summary_mode: SummaryMode = SummaryMode.DENSE,
+    incremental: bool = False,
+) -> SummaryPlan:
+    """Dry run of ``/api/v1/summarize/file``: fetch the file and plan its summary without any model call.
+
+    The plan holds the size of each chunk, the shape of the reduce tree, the projected tokens
+    and cost, and the estimated duration at the configured concurrency.
+
+    Args:
+        summary_parameters (SummaryParameters): parameters for summarization.
+        summary_mode (SummaryMode): "fast" or "final" generate fewer densification rounds,
+            for lower latency and cost.
+        incremental (bool): plan content-defined chunks, see ``/api/v1/summarize/file``.
     """
-    # split the text into chunks
-    chunks = split_into_chunks(text, max_tokens_per_chunk, summarizer.model.value)
-
-    # summarize each chunk
-    summaries = []
-    for chunk_index, chunk in enumerate(chunks):
-        if os.environ.get("GLOBAL_DEBUG", False):
-            n_chunk_tokens = summarizer.count_tokens(chunk)
-            with open(f"chunk-{chunk_index}-{n_chunk_tokens}.txt", "w") as f:
-                f.write(chunk)
-
-        summary = summarizer.summarize(chunk, temperature=0.5)
-        if os.environ.get("GLOBAL_DEBUG", False):
-            print_to_console(
-                content=summary.content, heading=f"Summary of chunk {chunk_index + 1}"
-            )
+    summary_parameters = SummaryParameters(
+        url=url,
+        model_name=model.value,
+        summary_length=summary_length,
+        summary_mode=summary_mode,
+        incremental=incremental,
+    )
+    return await plan_file(summary_parameters)
 
-        summaries.append(summary)
 
-    # write summaries to file
-    if os.environ.get("GLOBAL_DEBUG", False):
-        with open("summaries.txt", "w") as f:
-            f.write("\n***\n".join([summary.content for summary in summaries]))
+@app.post("/api/v1/summarize/batch")
+async def summarize_batch_of_files(batch_request: BatchRequest) -> BatchResponse:
+    """Summarize many files in one request, optimizing the throughput of the whole batch.
 
-    # join individual summaries into a single summary
-    join_summarizer = AITextSummarizer(
-        model=summarizer.model, prompt=JoinSummariesPrompt()
-    )
-    joined_summary = join_summarizer.summarize(
-        "\n***\n".join([summary.content for summary in summaries])
-    )
+    Each item gets either a result or an error, a failing item does not abort the batch.
+
+    Args:
+        batch_request (BatchRequest): parameters of each summarization.
+    """
+    return BatchResponse(items=await summarize_batch(batch_request.items))
 
-    if os.environ.get("GLOBAL_DEBUG", False):
-        print_to_console(joined_summary.content, heading="Joined summary", color="blue")
 
-    return joined_summary
+def _format_server_sent_event(event: ProgressEvent) -> str:
+    return f"event: {event.event}\ndata: {event.model_dump_json()}\n\n"
 
 
-@app.get("/api/v1/summarize/file")
-async def summarize_file_at_url(
+async def _stream_summary_events(
+    summary_parameters: SummaryParameters, include_timings: bool = False
+) -> AsyncIterator[str]:
+    events: "asyncio.Queue[ProgressEvent]" = asyncio.Queue()
+    task = asyncio.create_task(
+        summarize_file(
+            summary_parameters, events.put_nowait, include_timings=include_timings
+        )
+    )
+
+    getter: "Optional[asyncio.Task[ProgressEvent]]" = None
+    try:
+        while True:
+            if getter is None:
+                getter = asyncio.create_task(events.get())
+            # wakes up on the next event or as soon as the summary is done
+            done, _ = await asyncio.wait(
+                {task, getter},
+                timeout=STREAM_KEEP_ALIVE_INTERVAL,
+                return_when=asyncio.FIRST_COMPLETED,
+            )
+            if getter in done:
+                yield _format_server_sent_event(getter.result())
+                getter = None
+            elif task in done:
+                break
+            else:
+                # SSE comment, keeps proxies from closing an idle connection
+                yield ": keep-alive\n\n"
+
+        # events sent right before the summary was done and not taken by the getter yet
+        getter.cancel()
+        getter = None
+        while not events.empty():
+            yield _format_server_sent_event(events.get_nowait())
+
+        if task.exception() is not None:
+            error = task.exception()
+            status_code = getattr(error, "status_code", 500)
+            detail = getattr(error, "detail", "A server error occurred.")
+            yield _format_server_sent_event(
+                ProgressEvent(
+                    event="error", data={"status_code": status_code, "detail": detail}
+                )
+            )
+    finally:
+        # the client went away, stop spending tokens on its summary
+        task.cancel()
+        if getter is not None:
+            getter.cancel()
+
+
+@app.get("/api/v1/summarize/file/stream")
+async def stream_summary_of_file_at_url(
     url: str = "https://arxiv.org/pdf/2309.10668.pdf",
     model: AIModel = AIModel.gpt_3_5_turbo,
     summary_length: SummaryLength = SummaryLength.MEDIUM,
-) -> SummaryResponse:
-    """Given a URL pointing to a file, fetch the file and return a summary of the content.
+    summary_mode: SummaryMode = SummaryMode.DENSE,
+    incremental: bool = False,
+    include_timings: bool = False,
+) -> StreamingResponse:
+    """Same as ``/api/v1/summarize/file``, streaming progress as Server-Sent Events.
+
+    Events are "downloaded", "extracted", "chunk" (one per chunk summary, with the partial
+    summary), then either "summary" with the ``SummaryResponse`` or "error".
 
     Args:
         summary_parameters (SummaryParameters): parameters for summarization.
+        summary_mode (SummaryMode): "fast" or "final" generate fewer densification rounds,
+            for lower latency and cost.
+        incremental (bool): reuse the summaries of the chunks that did not change since the
+            document was last summarized.
+        include_timings (bool): add the seconds spent in each stage to the response.
     """
     summary_parameters = SummaryParameters(
-        url=url, model_name=model.value, summary_length=summary_length
+        url=url,
+        model_name=model.value,
+        summary_length=summary_length,
+        summary_mode=summary_mode,
+        incremental=incremental,
     )
+    return StreamingResponse(
+        _stream_summary_events(summary_parameters, include_timings),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 
-    remote_file = RemoteFile(summary_parameters.url)
+@app.post("/api/v1/jobs", status_code=202)
+async def submit_summary_job(summary_parameters: SummaryParameters) -> Job:
+    """Queue the summarization of the file at a URL and return the job right away.
 
+    Poll ``/api/v1/jobs/{job_id}`` for its status, progress and result. Submitting the same
+    parameters as an unfinished job returns that job.
+
+    Args:
+        summary_parameters (SummaryParameters): parameters for summarization.
+    """
     try:
-        remote_file.download()
-    except requests.exceptions.HTTPError as e:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Unable to download file at URL: {summary_parameters.url}. An HTTP error occurred.",
-        )
-    except Exception as e:
+        get_provider(summary_parameters.model_name)
+    except ValueError:
         raise HTTPException(
-            status_code=500,
-            detail=f"Unable to download file at URL: {summary_parameters.url}. A server error occurred.",
+            status_code=422,
+            detail=f"Unknown model: {summary_parameters.model_name}.",
         )
 
-    file_text_content = remote_file.extract_text()
-
-    prompt = ChainOfDensityPrompt(summary_length=summary_parameters.summary_length)
+    return job_queue.submit(summary_parameters)
 
-    summarizer = AITextSummarizer(model=model, prompt=prompt)
 
-    # input.len + output.len must be <= context.len, lower buffer means more room for output
-    # gpt-3.5-turbo can fail even at 0.75, so we use 0.65
-    # Also, https://arxiv.org/abs/2307.03172 shows performance drops when key info in middle
-    # reducing size of input text chunks may yield better summaries
-    model_context_length = AIModel.get_context_length(model, buffer_fraction=0.65)
-    prompt_n_tokens = summarizer.count_tokens(prompt.make(file_text_content))
+@app.get("/api/v1/jobs/{job_id}")
+async def get_summary_job(job_id: str) -> Job:
+    """Get the status, progress and, once done, the result of a summarization job.
 
-    print_to_console(f"Number of tokens in prompt: {prompt_n_tokens}")
-    print_to_console(f"Model context length: {model_context_length}")
-
-    if prompt_n_tokens >= model_context_length:
-        summary = chunk_and_summarize(
-            text=file_text_content,
-            summarizer=summarizer,
-            max_tokens_per_chunk=model_context_length,
-        )
-    else:
-        summary = summarizer.summarize(file_text_content)
-
-    # get an idea of how much the summary cost
-    input_cost = summarizer.estimate_cost(file_text_content)
-    output_cost = summarizer.estimate_cost(summary.content, type="output")
-
-    # remove the downloaded file
-    remote_file.delete()
-
-    # other potentially useful metadata
-    n_input_tokens = summarizer.count_tokens(prompt.make(file_text_content))
-    n_output_tokens = summarizer.count_tokens(summary.content)
-
-    print_to_console(summary.content, heading=summary.title, color="blue")
-
-    return SummaryResponse(
-        summary_parameters=summary_parameters,
-        summary=summary,
-        input_cost=input_cost,
-        output_cost=output_cost,
-        total_cost=input_cost + output_cost,
-        currency="USD",
-        num_input_tokens=n_input_tokens,
-        num_output_tokens=n_output_tokens,
-    )
+    Args:
+        job_id (str): id of the job returned by ``/api/v1/jobs``.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}.")
+    return job
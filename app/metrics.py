@@ -0,0 +1,47 @@
+from prometheus_client import Counter, Histogram
+
+STAGE_SECONDS = Histogram(
+    "brevity_stage_seconds",
+    "Time spent in each stage of a summarization.",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300),
+)
+
+LLM_CALLS = Counter("brevity_llm_calls_total", "Number of calls to a model.", ["model"])
+LLM_CALL_SECONDS = Histogram(
+    "brevity_llm_call_seconds",
+    "Duration of a single call to a model.",
+    ["model"],
+    buckets=(0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120),
+)
+LLM_INPUT_TOKENS = Counter(
+    "brevity_llm_input_tokens_total", "Number of tokens sent to a model.", ["model"]
+)
+LLM_OUTPUT_TOKENS = Counter(
+    "brevity_llm_output_tokens_total",
+    "Number of tokens generated by a model.",
+    ["model"],
+)
+LLM_RETRIES = Counter(
+    "brevity_llm_retries_total",
+    "Number of retried model calls, by reason of the retry.",
+    ["model", "reason"],
+)
+LLM_HEDGED_CALLS = Counter(
+    "brevity_llm_hedged_calls_total",
+    "Number of straggling model calls duplicated by a hedged request.",
+    ["model"],
+)
+LLM_UNNATURAL_STOPS = Counter(
+    "brevity_llm_unnatural_stops_total",
+    "Number of model calls that did not finish with a natural stop.",
+    ["model", "finish_reason"],
+)
+
+# level is "call" for a single model call (e.g. a chunk) and "document" for a whole document
+CACHE_HITS = Counter(
+    "brevity_summary_cache_hits_total", "Number of summary cache hits.", ["level"]
+)
+CACHE_MISSES = Counter(
+    "brevity_summary_cache_misses_total", "Number of summary cache misses.", ["level"]
+)
@@ -0,0 +1,1154 @@
+import asyncio
+import hashlib
+import math
+from collections import Counter
+from dataclasses import dataclass
+from logging import INFO, getLogger
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+import openai
+import tiktoken
+from fastapi.exceptions import HTTPException
+
+from .cache import make_summary_cache
+from .config import (
+    ARTIFACT_STORE,
+    ARTIFACT_STORE_DIR,
+    ARTIFACT_STORE_MAX_BYTES,
+    ARTIFACT_STORE_PIN_LEASE,
+    BATCH_MAX_CONCURRENT_CALLS,
+    BATCH_MAX_CONCURRENT_DOWNLOADS,
+    BATCH_MAX_DOCUMENTS,
+    CHUNK_OVERLAP_TOKENS,
+    DEBUG,
+    DOWNLOAD_TIMEOUT,
+    FILTER_NEAR_DUPLICATES,
+    FILTER_REPEATED_LINES,
+    LLM_HEDGE_AFTER,
+    MAP_MODEL,
+    MAX_CONCURRENT_CHUNKS,
+    MAX_DOWNLOAD_BYTES,
+    NEAR_DUPLICATE_SIMILARITY,
+    PLAN_CALL_LATENCY,
+    PLAN_OUTPUT_TOKENS_PER_SECOND,
+    REDUCE_FAN_IN,
+    SINGLE_FLIGHT,
+    SINGLE_FLIGHT_PATH,
+    STRIP_SECTIONS,
+    SUMMARY_CACHE,
+    SUMMARY_CACHE_MAX_SIZE,
+    SUMMARY_CACHE_PATH,
+    SUMMARY_CACHE_TTL,
+    TOPIC_CLUSTERING,
+    TOPIC_NEIGHBORS,
+    TOPIC_PASSAGE_TOKENS,
+    TOPIC_RESOLUTION,
+)
+from .file.remote import FileTooLargeError, RemoteFile
+from .file.store import make_artifact_store
+from .filtering import filter_pages
+from .http_client import get_http_client
+from .metrics import CACHE_HITS, CACHE_MISSES
+from .prompts import ChainOfDensityPrompt, JoinSummariesPrompt, Summary, SummaryMode
+from .ratelimit import RateLimiter
+from .schema import (
+    BatchItemResult,
+    ProgressEvent,
+    SummaryParameters,
+    SummaryPlan,
+    SummaryResponse,
+)
+from .singleflight import make_single_flight
+from .summarizer import AITextSummarizer
+from .timing import get_timings, start_timing, timed
+from .tokens import TokenizedDocument
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+SUMMARY_SEPARATOR = "\n***\n"
+# joins the passages of a topic, which are not necessarily consecutive in the document
+PASSAGE_SEPARATOR = "\n\n[...]\n\n"
+
+summary_cache = make_summary_cache(
+    SUMMARY_CACHE,
+    max_size=SUMMARY_CACHE_MAX_SIZE,
+    ttl=SUMMARY_CACHE_TTL,
+    path=SUMMARY_CACHE_PATH,
+)
+
+artifact_store = make_artifact_store(
+    ARTIFACT_STORE,
+    ARTIFACT_STORE_DIR,
+    max_bytes=ARTIFACT_STORE_MAX_BYTES,
+    pin_lease=ARTIFACT_STORE_PIN_LEASE,
+)
+
+# identical summaries requested at the same time are computed once
+single_flight = make_single_flight(SINGLE_FLIGHT, path=SINGLE_FLIGHT_PATH)
+
+# receives the progress events of a summarization, see ``ProgressEvent``
+EventCallback = Callable[[ProgressEvent], None]
+
+
+def _emit(on_event: Optional[EventCallback], event: str, **data) -> None:
+    if on_event is not None:
+        on_event(ProgressEvent(event=event, data=data))
+
+
+@dataclass
+class ChunkedSummary:
+    summary: Summary
+    n_chunks: int
+    # chunks whose summary was found in the cache instead of calling the model
+    n_chunks_reused: int
+
+
+def filter_document(
+    document: TokenizedDocument,
+    repeated_lines: bool = FILTER_REPEATED_LINES,
+    near_duplicates: bool = FILTER_NEAR_DUPLICATES,
+    strip_section_titles: Optional[List[str]] = STRIP_SECTIONS,
+    min_similarity: float = NEAR_DUPLICATE_SIMILARITY,
+) -> Tuple[TokenizedDocument, int]:
+    """Remove the text of a document that does not need summarizing, see ``filter_pages``.
+
+    Args:
+        document (TokenizedDocument): document to filter, with a piece of text per page.
+        repeated_lines (bool, optional): remove lines repeated at the top or bottom of many pages.
+            Defaults to ``FILTER_REPEATED_LINES``.
+        near_duplicates (bool, optional): remove near-duplicate paragraphs.
+            Defaults to ``FILTER_NEAR_DUPLICATES``.
+        strip_section_titles (Optional[List[str]], optional): drop everything from the last
+            heading with one of these titles. Defaults to ``STRIP_SECTIONS``.
+        min_similarity (float, optional): similarity above which a paragraph is a duplicate.
+            Defaults to ``NEAR_DUPLICATE_SIMILARITY``.
+
+    Returns:
+        Tuple[TokenizedDocument, int]: filtered document and the number of tokens removed.
+    """
+    pages = filter_pages(
+        document.pages,
+        repeated_lines=repeated_lines,
+        near_duplicates=near_duplicates,
+        strip_section_titles=strip_section_titles,
+        min_similarity=min_similarity,
+    )
+    if "".join(pages) == document.text:
+        return document, 0
+
+    # the tokens of the kept text are reused, the document is not encoded again
+    filtered_document = document.filter_pages(pages)
+    return filtered_document, document.n_tokens - filtered_document.n_tokens
+
+
+def split_into_chunks(
+    text: str,
+    max_tokens_per_chunk: int,
+    model_name: str,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+) -> List[str]:
+    return TokenizedDocument(text, model_name).chunks(
+        max_tokens_per_chunk, overlap_tokens
+    )
+
+
+async def split_into_topics(
+    document: TokenizedDocument,
+    max_tokens_per_chunk: int,
+    passage_tokens: int = TOPIC_PASSAGE_TOKENS,
+    n_neighbors: int = TOPIC_NEIGHBORS,
+    resolution: float = TOPIC_RESOLUTION,
+    stable: bool = False,
+) -> List[Tuple[str, int]]:
+    """Split a document into chunks of passages about the same topic.
+
+    The document is cut into short passages, which are embedded, linked to their most
+    similar passages and grouped into topics by community detection, see ``find_topics``.
+    The passages of a topic are then packed together in document order.
+
+    Args:
+        document (TokenizedDocument): tokenized text to split.
+        max_tokens_per_chunk (int): maximum number of tokens in a chunk.
+        passage_tokens (int, optional): maximum number of tokens in a passage, at most half
+            of a chunk. Defaults to ``TOPIC_PASSAGE_TOKENS``.
+        n_neighbors (int, optional): number of neighbors of each passage in the similarity graph.
+            Defaults to ``TOPIC_NEIGHBORS``.
+        resolution (float, optional): resolution of the community detection.
+            Defaults to ``TOPIC_RESOLUTION``.
+        stable (bool, optional): cut passages at boundaries chosen by content.
+            Defaults to False.
+
+    Returns:
+        List[Tuple[str, int]]: text of each chunk and its number of tokens, at most.
+    """
+    # imported here, numpy and networkx are only needed for topic clustering
+    from .topics import aembed, find_topics, pack_topics
+
+    passage_tokens = max(1, min(passage_tokens, max_tokens_per_chunk // 2))
+    with timed("chunking"):
+        passage_slices = await asyncio.to_thread(
+            document.chunk_slices, passage_tokens, 0, stable
+        )
+        passages = [
+            document.tokenizer.decode(document.tokens[start:end])
+            for start, end in passage_slices
+        ]
+    n_passage_tokens = [end - start for start, end in passage_slices]
+
+    with timed("embedding"):
+        embeddings = await aembed(passages)
+    with timed("clustering"):
+        topics = await asyncio.to_thread(
+            find_topics, embeddings, n_neighbors, resolution
+        )
+
+    n_separator_tokens = len(document.tokenizer.encode(PASSAGE_SEPARATOR))
+    chunks = pack_topics(
+        topics, n_passage_tokens, max_tokens_per_chunk, n_separator_tokens
+    )
+    logger.debug(
+        "%d passages in %d topics, packed into %d chunks",
+        len(passages),
+        len(topics),
+        len(chunks),
+        extra={"n_topics": len(topics)},
+    )
+    return [
+        (
+            PASSAGE_SEPARATOR.join(passages[i] for i in chunk),
+            sum(n_passage_tokens[i] + n_separator_tokens for i in chunk),
+        )
+        for chunk in chunks
+    ]
+
+
+def group_summaries(
+    n_summary_tokens: List[int], max_tokens_per_group: int, fan_in: int
+) -> List[List[int]]:
+    """Group consecutive summaries so that each group can be joined by a single call.
+
+    Groups are packed greedily up to ``max_tokens_per_group`` tokens and ``fan_in`` summaries,
+    a summary that does not fit with the previous ones starts a new group. Summaries of at
+    most half of ``max_tokens_per_group`` tokens always pair up, so every group but the last
+    holds at least two of them, every level of the reduce tree shrinks and the reduction
+    terminates, see ``truncate_summary``.
+
+    Args:
+        n_summary_tokens (List[int]): number of tokens of each summary, in document order.
+        max_tokens_per_group (int): maximum number of tokens in a group.
+        fan_in (int): maximum number of summaries in a group.
+
+    Returns:
+        List[List[int]]: indices of the summaries in each group, in document order.
+    """
+    groups: List[List[int]] = []
+    group: List[int] = []
+    n_group_tokens = 0
+    for summary_index, n_tokens in enumerate(n_summary_tokens):
+        if group and (
+            len(group) >= max(2, fan_in)
+            or n_group_tokens + n_tokens > max_tokens_per_group
+        ):
+            groups.append(group)
+            group, n_group_tokens = [], 0
+        group.append(summary_index)
+        n_group_tokens += n_tokens
+
+    if group:
+        groups.append(group)
+    return groups
+
+
+def truncate_summary(
+    summary: Summary, max_tokens: int, tokenizer: tiktoken.Encoding
+) -> Summary:
+    """Cut a summary to at most ``max_tokens`` tokens.
+
+    Args:
+        summary (Summary): summary to cut.
+        max_tokens (int): maximum number of tokens of its content.
+        tokenizer (tiktoken.Encoding): tokenizer of the model joining the summary.
+
+    Returns:
+        Summary: the summary, or a copy with its content cut.
+    """
+    tokens = tokenizer.encode(summary.content)
+    if len(tokens) <= max_tokens:
+        return summary
+
+    logger.warning(
+        "Summary of %d tokens does not fit a join call, cut to %d tokens",
+        len(tokens),
+        max_tokens,
+        extra={"n_tokens": len(tokens), "max_tokens": max_tokens},
+    )
+    return Summary(
+        title=summary.title, content=tokenizer.decode(tokens[: max(0, max_tokens)])
+    )
+
+
+def estimate_reduce_tree(
+    n_summaries: int,
+    n_summary_tokens: int,
+    max_tokens_per_group: int,
+    fan_in: int,
+    n_joined_summary_tokens: Optional[int] = None,
+) -> List[List[int]]:
+    """Estimate the join calls of ``reduce_summaries`` from the typical length of a summary.
+
+    Args:
+        n_summaries (int): number of summaries to join.
+        n_summary_tokens (int): number of tokens of each summary, with its separator.
+        max_tokens_per_group (int): maximum number of tokens joined by a single call.
+        fan_in (int): maximum number of summaries joined by a single call.
+        n_joined_summary_tokens (Optional[int], optional): number of tokens of a joined summary,
+            with its separator. Defaults to None, i.e. ``n_summary_tokens``.
+
+    Returns:
+        List[List[int]]: number of summaries joined by each call, for each level of the tree.
+    """
+    if n_joined_summary_tokens is None:
+        n_joined_summary_tokens = n_summary_tokens
+    # longer summaries are cut, see ``reduce_summaries``
+    n_summary_tokens = min(n_summary_tokens, max(1, max_tokens_per_group // 2))
+    n_joined_summary_tokens = min(
+        n_joined_summary_tokens, max(1, max_tokens_per_group // 2)
+    )
+
+    levels: List[List[int]] = []
+    summary_tokens = [n_summary_tokens] * n_summaries
+    while not levels or len(summary_tokens) > 1:
+        groups = group_summaries(summary_tokens, max_tokens_per_group, fan_in)
+        is_last_level = len(groups) == 1
+        # a lone summary is carried over to the next level without a call
+        levels.append(
+            [len(group) for group in groups if len(group) > 1 or is_last_level]
+        )
+        summary_tokens = [
+            n_joined_summary_tokens if len(group) > 1 else summary_tokens[group[0]]
+            for group in groups
+        ]
+    return levels
+
+
+async def reduce_summaries(
+    summaries: List[Summary],
+    join_summarizer: AITextSummarizer,
+    max_tokens_per_group: int,
+    fan_in: int = REDUCE_FAN_IN,
+    semaphore: Optional[asyncio.Semaphore] = None,
+) -> Summary:
+    """Join summaries into a single summary with a tree of join calls.
+
+    Each level groups the summaries so that every group fits the context budget, and joins
+    the groups concurrently. Levels repeat until a single summary remains, so the number of
+    levels grows logarithmically with the number of summaries. Summaries of more than half
+    of the budget are cut, so that any two of them can be joined.
+
+    Args:
+        summaries (List[Summary]): summaries to join, in document order.
+        join_summarizer (AITextSummarizer): summarizer joining a group of summaries.
+        max_tokens_per_group (int): maximum number of tokens joined by a single call.
+        fan_in (int, optional): maximum number of summaries joined by a single call.
+            Defaults to ``REDUCE_FAN_IN``.
+        semaphore (Optional[asyncio.Semaphore], optional): bounds the number of concurrent calls.
+            Defaults to None, i.e. no bound.
+
+    Returns:
+        Summary: summary of all the summaries.
+    """
+    semaphore = semaphore or asyncio.Semaphore(len(summaries))
+    n_separator_tokens = join_summarizer.count_tokens(SUMMARY_SEPARATOR)
+    max_summary_tokens = max(1, max_tokens_per_group // 2 - n_separator_tokens)
+
+    async def join_group(group: List[Summary], is_last_level: bool) -> Summary:
+        # a lone summary is carried over to the next level as is
+        if len(group) == 1 and not is_last_level:
+            return group[0]
+
+        async with semaphore:
+            return await join_summarizer.asummarize(
+                SUMMARY_SEPARATOR.join([summary.content for summary in group])
+            )
+
+    # the last level always runs, even on a single summary, as it generates the title
+    level = 0
+    while level == 0 or len(summaries) > 1:
+        summaries = [
+            truncate_summary(summary, max_summary_tokens, join_summarizer.tokenizer)
+            for summary in summaries
+        ]
+        n_summary_tokens = [
+            join_summarizer.count_tokens(summary.content) + n_separator_tokens
+            for summary in summaries
+        ]
+        groups = group_summaries(n_summary_tokens, max_tokens_per_group, fan_in)
+        summaries = await asyncio.gather(
+            *(
+                join_group(
+                    [summaries[i] for i in group], is_last_level=len(groups) == 1
+                )
+                for group in groups
+            )
+        )
+        level += 1
+
+        logger.debug(
+            "Reduce level %d: %d summaries", level, len(groups), extra={"level": level}
+        )
+
+    return summaries[0]
+
+
+async def chunk_and_summarize(
+    document: TokenizedDocument,
+    summarizer: AITextSummarizer,
+    max_tokens_per_chunk: int,
+    max_concurrency: int = MAX_CONCURRENT_CHUNKS,
+    reduce_fan_in: int = REDUCE_FAN_IN,
+    on_event: Optional[EventCallback] = None,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    join_model_name: Optional[str] = None,
+    incremental: bool = False,
+    topic_clustering: bool = TOPIC_CLUSTERING,
+    summary_mode: SummaryMode = SummaryMode.DENSE,
+) -> ChunkedSummary:
+    """Summarize text over the context length of the model.
+
+    Chunks are summarized concurrently, at most ``max_concurrency`` at a time and within
+    the rate limits of the summarizer. Chunk summaries are then joined in document order
+    by a tree of join calls, see ``reduce_summaries``. Chunks and join groups with a cached
+    summary are not sent to the model again.
+
+    With topic clustering, chunks hold the passages of a topic instead of consecutive text,
+    see ``split_into_topics``, and chunk summaries are joined in the order of the topics.
+
+    Args:
+        document (TokenizedDocument): tokenized text to summarize.
+        summarizer (AITextSummarizer): summarizer used for each chunk.
+        max_tokens_per_chunk (int): maximum number of tokens in a single chunk.
+        max_concurrency (int, optional): maximum number of calls running at the same time.
+            Defaults to ``MAX_CONCURRENT_CHUNKS``.
+        reduce_fan_in (int, optional): maximum number of summaries joined by a single call.
+            Defaults to ``REDUCE_FAN_IN``.
+        on_event (Optional[EventCallback], optional): called with a "chunk" event every time
+            a chunk summary is done. Defaults to None.
+        semaphore (Optional[asyncio.Semaphore], optional): bounds the number of concurrent calls,
+            replacing ``max_concurrency``. Defaults to None.
+        overlap_tokens (int, optional): number of tokens a chunk repeats from the previous one.
+            Defaults to ``CHUNK_OVERLAP_TOKENS``.
+        join_model_name (Optional[str], optional): model joining the chunk summaries.
+            Defaults to None, i.e. the model of ``summarizer``.
+        incremental (bool, optional): chunk by content, so that after an edit only the chunks
+            around it miss the cache, see ``TokenizedDocument.chunk_slices``. Defaults to False.
+        topic_clustering (bool, optional): summarize a chunk per topic, falls back on consecutive
+            chunks if the passages can not be embedded. Defaults to ``TOPIC_CLUSTERING``.
+        summary_mode (SummaryMode, optional): number of rounds of the join calls.
+            Defaults to ``SummaryMode.DENSE``.
+
+    Returns:
+        ChunkedSummary: summary of the joined chunk summaries, with the number of chunks.
+    """
+    chunks: List[Tuple[str, int]] = []
+    if topic_clustering:
+        try:
+            chunks = await split_into_topics(
+                document, max_tokens_per_chunk, stable=incremental
+            )
+        except (openai.error.OpenAIError, asyncio.TimeoutError) as e:
+            logger.warning(
+                "Unable to embed passages, summarizing consecutive chunks: %r", e
+            )
+
+    if not chunks:
+        # split the already tokenized text at headings, paragraphs and sentences,
+        # scanning for them and decoding runs in a worker thread
+        with timed("chunking"):
+            chunk_slices = await asyncio.to_thread(
+                document.chunk_slices, max_tokens_per_chunk, overlap_tokens, incremental
+            )
+            chunks = [
+                (document.tokenizer.decode(document.tokens[start:end]), end - start)
+                for start, end in chunk_slices
+            ]
+    semaphore = semaphore or asyncio.Semaphore(max_concurrency)
+    n_chunks_done = 0
+    n_chunks_reused = 0
+
+    async def summarize_chunk(
+        chunk_index: int, chunk: str, n_chunk_tokens: int
+    ) -> Summary:
+        if DEBUG:
+            with open(f"chunk-{chunk_index}-{n_chunk_tokens}.txt", "w") as f:
+                f.write(chunk)
+
+        nonlocal n_chunks_done, n_chunks_reused
+        summary = await summarizer.aget_cached_summary(chunk)
+        if summary is not None:
+            n_chunks_reused += 1
+        else:
+            async with semaphore:
+                summary = await summarizer.asummarize(
+                    chunk,
+                    n_text_tokens=n_chunk_tokens,
+                    hedge_after=LLM_HEDGE_AFTER,
+                    read_cache=False,
+                    temperature=0.5,
+                )
+
+        logger.debug(
+            "Summary of chunk %d: %s",
+            chunk_index + 1,
+            summary.content,
+            extra={"chunk_index": chunk_index, "n_chunk_tokens": n_chunk_tokens},
+        )
+
+        n_chunks_done += 1
+        _emit(
+            on_event,
+            "chunk",
+            chunk_index=chunk_index,
+            n_chunks=len(chunks),
+            n_chunks_done=n_chunks_done,
+            summary=summary,
+        )
+
+        return summary
+
+    # summarize each chunk, gather returns the summaries in chunk order
+    with timed("map"):
+        summaries = await asyncio.gather(
+            *(
+                summarize_chunk(chunk_index, chunk, n_chunk_tokens)
+                for chunk_index, (chunk, n_chunk_tokens) in enumerate(chunks)
+            )
+        )
+
+    # write summaries to file
+    if DEBUG:
+        with open("summaries.txt", "w") as f:
+            f.write(SUMMARY_SEPARATOR.join([summary.content for summary in summaries]))
+
+    # join individual summaries into a single summary
+    join_summarizer = AITextSummarizer(
+        model=join_model_name or summarizer.model_name,
+        prompt=JoinSummariesPrompt(summary_mode=summary_mode),
+        cache=summarizer.cache,
+    )
+    with timed("reduce"):
+        joined_summary = await reduce_summaries(
+            list(summaries),
+            join_summarizer,
+            max_tokens_per_group=join_summarizer.max_text_tokens,
+            fan_in=reduce_fan_in,
+            semaphore=semaphore,
+        )
+
+    logger.debug(
+        "Joined summary: %s",
+        joined_summary.content,
+        extra={"n_chunks": len(chunks), "n_chunks_reused": n_chunks_reused},
+    )
+
+    return ChunkedSummary(
+        summary=joined_summary, n_chunks=len(chunks), n_chunks_reused=n_chunks_reused
+    )
+
+
+def estimate_seconds_of_calls(
+    n_calls_input_tokens: List[int],
+    n_output_tokens: int,
+    max_concurrency: int,
+    rate_limiter: Optional[RateLimiter] = None,
+    call_latency: float = PLAN_CALL_LATENCY,
+    output_tokens_per_second: float = PLAN_OUTPUT_TOKENS_PER_SECOND,
+) -> float:
+    """Estimate the wall time of concurrent model calls.
+
+    Calls run in waves of ``max_concurrency``, each taking the latency of a call and the time
+    to generate its output. Past the initial budget of the rate limiter, calls are further
+    held back by the rate at which requests and tokens are refilled.
+
+    Args:
+        n_calls_input_tokens (List[int]): number of prompt tokens of each call.
+        n_output_tokens (int): number of output tokens of a call.
+        max_concurrency (int): maximum number of calls running at the same time.
+        rate_limiter (Optional[RateLimiter], optional): rate limits of the model.
+            Defaults to None, i.e. no limits.
+        call_latency (float, optional): seconds before the first output token.
+            Defaults to ``PLAN_CALL_LATENCY``.
+        output_tokens_per_second (float, optional): output tokens generated per second.
+            Defaults to ``PLAN_OUTPUT_TOKENS_PER_SECOND``.
+
+    Returns:
+        float: estimated seconds until the last call is done.
+    """
+    n_calls = len(n_calls_input_tokens)
+    if n_calls == 0:
+        return 0.0
+
+    call_seconds = call_latency + n_output_tokens / output_tokens_per_second
+    seconds = math.ceil(n_calls / max_concurrency) * call_seconds
+    if rate_limiter is not None:
+        # the buckets start full, the remaining calls wait for them to refill
+        limits = [(n_calls, rate_limiter.requests_per_minute)]
+        if rate_limiter.tokens_per_minute:
+            limits.append((sum(n_calls_input_tokens), rate_limiter.tokens_per_minute))
+        for amount, per_minute in limits:
+            seconds = max(
+                seconds, (amount - per_minute) / (per_minute / 60) + call_seconds
+            )
+    return seconds
+
+
+async def fetch_document(
+    url: str,
+    model_name: str,
+    http_client: Optional[httpx.AsyncClient] = None,
+    on_event: Optional[EventCallback] = None,
+) -> TokenizedDocument:
+    """Download the file at the URL and tokenize its text.
+
+    Args:
+        url (str): URL of the file.
+        model_name (str): name of the model whose tokenizer is used.
+        http_client (Optional[httpx.AsyncClient], optional): client to download the file with.
+            Defaults to None, i.e. the HTTP client shared by the app.
+        on_event (Optional[EventCallback], optional): called with the "downloaded" and "extracted"
+            events. Defaults to None.
+
+    Raises:
+        HTTPException: if the file can not be downloaded.
+
+    Returns:
+        TokenizedDocument: text of the file.
+    """
+    # the downloaded file is deleted as soon as the text is extracted, even on errors,
+    # unless it is kept in the artifact store
+    async with RemoteFile(
+        url,
+        max_size=MAX_DOWNLOAD_BYTES,
+        timeout=DOWNLOAD_TIMEOUT,
+        store=artifact_store,
+    ) as remote_file:
+        try:
+            with timed("download"):
+                await remote_file.download(client=http_client or get_http_client())
+        except httpx.HTTPStatusError as e:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unable to download file at URL: {url}. An HTTP error occurred.",
+            )
+        except FileTooLargeError as e:
+            raise HTTPException(
+                status_code=413,
+                detail=f"Unable to download file at URL: {url}. The file exceeds {MAX_DOWNLOAD_BYTES} bytes.",
+            )
+        except httpx.TimeoutException as e:
+            raise HTTPException(
+                status_code=504,
+                detail=f"Unable to download file at URL: {url}. The download timed out.",
+            )
+        except Exception as e:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Unable to download file at URL: {url}. A server error occurred.",
+            )
+
+        _emit(
+            on_event,
+            "downloaded",
+            n_bytes=remote_file.bytes_downloaded,
+            from_store=remote_file.is_from_store,
+        )
+
+        # pages are tokenized as soon as they are extracted, while later pages are still parsed
+        # the document is encoded exactly once and shared by chunking, context checks and costs
+        document = TokenizedDocument("", model_name)
+        page_separator = ""
+        pages = remote_file.aiter_pages()
+        while True:
+            with timed("extraction"):
+                page = await anext(pages, None)
+            if page is None:
+                break
+
+            with timed("tokenization"):
+                await asyncio.to_thread(document.append, page_separator + page)
+            page_separator = "\n"
+
+    _emit(on_event, "extracted", n_tokens=document.n_tokens)
+
+    return document
+
+
+def _check_context_budgets(
+    summary_parameters: SummaryParameters, *summarizers: AITextSummarizer
+) -> None:
+    # template + text + output must fit the context window of the model
+    for summarizer in summarizers:
+        if summarizer.max_text_tokens <= 0:
+            raise HTTPException(
+                status_code=422,
+                detail=f"{summary_parameters.summary_length.value} summaries do not fit "
+                f"the context window of {summarizer.model_name}.",
+            )
+
+
+async def summarize_document(
+    document: TokenizedDocument,
+    summary_parameters: SummaryParameters,
+    semaphore: Optional[asyncio.Semaphore] = None,
+    on_event: Optional[EventCallback] = None,
+) -> SummaryResponse:
+    """Summarize the text of a document.
+
+    Args:
+        document (TokenizedDocument): text to summarize, tokenized for the model of the parameters.
+        summary_parameters (SummaryParameters): parameters for summarization.
+        semaphore (Optional[asyncio.Semaphore], optional): bounds the number of concurrent model calls,
+            pass the same semaphore to share the bound across documents.
+            Defaults to None, i.e. ``MAX_CONCURRENT_CHUNKS`` calls for this document.
+        on_event (Optional[EventCallback], optional): called with the "chunk" and "summary" events.
+            Defaults to None.
+
+    Returns:
+        SummaryResponse: summary of the document and its metadata.
+    """
+    model_name = summary_parameters.model_name
+    # chunks of long documents can go to a cheaper model, e.g. a local one
+    map_model_name = MAP_MODEL or model_name
+    semaphore = semaphore or asyncio.Semaphore(MAX_CONCURRENT_CHUNKS)
+
+    # headers, duplicates and stripped sections never reach the model
+    with timed("filtering"):
+        document, n_pruned_tokens = await asyncio.to_thread(filter_document, document)
+    file_text_content = document.text
+
+    prompt = ChainOfDensityPrompt(
+        summary_length=summary_parameters.summary_length,
+        summary_mode=summary_parameters.summary_mode,
+    )
+
+    summarizer = AITextSummarizer(model=model_name, prompt=prompt, cache=summary_cache)
+    map_summarizer = AITextSummarizer(
+        model=map_model_name, prompt=prompt, cache=summary_cache
+    )
+
+    _check_context_budgets(summary_parameters, summarizer, map_summarizer)
+    max_tokens_per_chunk = map_summarizer.max_text_tokens
+    is_chunked = document.n_tokens > summarizer.max_text_tokens
+    prompt_n_tokens = document.n_tokens + summarizer.n_prompt_template_tokens
+
+    logger.debug(
+        "Number of tokens in prompt: %d, maximum number of tokens per chunk: %d",
+        prompt_n_tokens,
+        max_tokens_per_chunk,
+    )
+
+    # the whole document is cached separately from its chunks,
+    # so repeat documents skip chunking and the join step altogether
+    document_prompt_key = f"document:{map_model_name}:{prompt.cache_key()}"
+    if summary_parameters.incremental:
+        # content-defined chunks summarize differently than the default ones
+        document_prompt_key += ":incremental"
+    summary = None
+    if summary_cache is not None:
+        summary = await asyncio.to_thread(
+            summary_cache.get, file_text_content, model_name, document_prompt_key
+        )
+        (CACHE_MISSES if summary is None else CACHE_HITS).labels("document").inc()
+    is_cached = summary is not None
+    n_chunks, n_chunks_reused = 0, 0
+
+    if not is_cached:
+        if is_chunked:
+            chunked_summary = await chunk_and_summarize(
+                document=document,
+                summarizer=map_summarizer,
+                max_tokens_per_chunk=max_tokens_per_chunk,
+                on_event=on_event,
+                semaphore=semaphore,
+                join_model_name=model_name,
+                incremental=summary_parameters.incremental,
+                summary_mode=summary_parameters.summary_mode,
+            )
+            summary = chunked_summary.summary
+            n_chunks = chunked_summary.n_chunks
+            n_chunks_reused = chunked_summary.n_chunks_reused
+        else:
+            with timed("map"):
+                async with semaphore:
+                    summary = await summarizer.asummarize(
+                        file_text_content, n_text_tokens=document.n_tokens
+                    )
+
+        if summary_cache is not None:
+            await asyncio.to_thread(
+                summary_cache.set,
+                file_text_content,
+                model_name,
+                document_prompt_key,
+                summary,
+            )
+
+    # other potentially useful metadata
+    n_input_tokens = prompt_n_tokens
+    n_output_tokens = summarizer.count_tokens(summary.content)
+
+    # get an idea of how much the summary cost, the text goes to the map model when chunked
+    input_cost = (map_summarizer if is_chunked else summarizer).estimate_cost_of_tokens(
+        document.n_tokens
+    )
+    output_cost = summarizer.estimate_cost_of_tokens(n_output_tokens, type="output")
+
+    logger.info(
+        "Summarized %s",
+        summary_parameters.url,
+        extra={
+            "model": model_name,
+            "n_input_tokens": n_input_tokens,
+            "n_output_tokens": n_output_tokens,
+            "cached": is_cached,
+            "n_chunks": n_chunks,
+            "n_chunks_reused": n_chunks_reused,
+            "n_pruned_tokens": n_pruned_tokens,
+        },
+    )
+    logger.debug("%s: %s", summary.title, summary.content)
+
+    summary_response = SummaryResponse(
+        summary_parameters=summary_parameters,
+        summary=summary,
+        input_cost=input_cost,
+        output_cost=output_cost,
+        total_cost=input_cost + output_cost,
+        currency="USD",
+        num_input_tokens=n_input_tokens,
+        num_output_tokens=n_output_tokens,
+        cached=is_cached,
+        num_chunks=n_chunks,
+        num_chunks_reused=n_chunks_reused,
+        num_pruned_tokens=n_pruned_tokens,
+        timings=get_timings(),
+    )
+    _emit(on_event, "summary", response=summary_response)
+
+    return summary_response
+
+
+async def plan_document(
+    document: TokenizedDocument,
+    summary_parameters: SummaryParameters,
+    max_concurrency: int = MAX_CONCURRENT_CHUNKS,
+    reduce_fan_in: int = REDUCE_FAN_IN,
+) -> SummaryPlan:
+    """Plan the summarization of a document without calling the model.
+
+    The document is filtered and chunked exactly as ``summarize_document`` would, the
+    reduce tree and output tokens are projected from the summary length of the prompts,
+    and costs from the prices of the models, see ``MODEL_PRICES``. The cache is not looked
+    up, so the plan is that of a first summarization. With topic clustering, the chunks
+    are those of consecutive slicing, which ``pack_topics`` keeps close in number.
+
+    Args:
+        document (TokenizedDocument): text to summarize, tokenized for the model of the parameters.
+        summary_parameters (SummaryParameters): parameters for summarization.
+        max_concurrency (int, optional): maximum number of calls running at the same time.
+            Defaults to ``MAX_CONCURRENT_CHUNKS``.
+        reduce_fan_in (int, optional): maximum number of summaries joined by a single call.
+            Defaults to ``REDUCE_FAN_IN``.
+
+    Raises:
+        HTTPException: if summaries of the requested length do not fit the context window.
+
+    Returns:
+        SummaryPlan: chunks, reduce tree, tokens, cost and duration of the summarization.
+    """
+    model_name = summary_parameters.model_name
+    map_model_name = MAP_MODEL or model_name
+
+    document, n_pruned_tokens = await asyncio.to_thread(filter_document, document)
+
+    prompt = ChainOfDensityPrompt(
+        summary_length=summary_parameters.summary_length,
+        summary_mode=summary_parameters.summary_mode,
+    )
+    summarizer = AITextSummarizer(model=model_name, prompt=prompt)
+    map_summarizer = AITextSummarizer(model=map_model_name, prompt=prompt)
+    _check_context_budgets(summary_parameters, summarizer, map_summarizer)
+
+    if document.n_tokens <= summarizer.max_text_tokens:
+        n_input_tokens = document.n_tokens + summarizer.n_prompt_template_tokens
+        n_output_tokens = prompt.estimate_output_tokens()
+        input_cost = summarizer.estimate_cost_of_tokens(n_input_tokens, precision=4)
+        output_cost = summarizer.estimate_cost_of_tokens(
+            n_output_tokens, type="output", precision=4
+        )
+        return SummaryPlan(
+            summary_parameters=summary_parameters,
+            num_document_tokens=document.n_tokens,
+            num_pruned_tokens=n_pruned_tokens,
+            num_calls=1,
+            num_input_tokens=n_input_tokens,
+            num_output_tokens=n_output_tokens,
+            input_cost=input_cost,
+            output_cost=output_cost,
+            total_cost=round(input_cost + output_cost, 4),
+            currency="USD",
+            estimated_seconds=estimate_seconds_of_calls(
+                [n_input_tokens], n_output_tokens, 1, summarizer.rate_limiter
+            ),
+            max_concurrency=max_concurrency,
+        )
+
+    # the same chunks as ``chunk_and_summarize``, without decoding them
+    chunk_slices = await asyncio.to_thread(
+        document.chunk_slices,
+        map_summarizer.max_text_tokens,
+        CHUNK_OVERLAP_TOKENS,
+        summary_parameters.incremental,
+    )
+    chunk_tokens = [end - start for start, end in chunk_slices]
+    map_input_tokens = [
+        n_chunk_tokens + map_summarizer.n_prompt_template_tokens
+        for n_chunk_tokens in chunk_tokens
+    ]
+    map_output_tokens = prompt.estimate_output_tokens()
+
+    join_prompt = JoinSummariesPrompt(summary_mode=summary_parameters.summary_mode)
+    join_summarizer = AITextSummarizer(model=model_name, prompt=join_prompt)
+    n_separator_tokens = join_summarizer.count_tokens(SUMMARY_SEPARATOR)
+    n_summary_tokens = prompt.estimate_summary_tokens() + n_separator_tokens
+    n_joined_summary_tokens = join_prompt.estimate_summary_tokens() + n_separator_tokens
+    reduce_levels = estimate_reduce_tree(
+        len(chunk_slices),
+        n_summary_tokens,
+        join_summarizer.max_text_tokens,
+        reduce_fan_in,
+        n_joined_summary_tokens,
+    )
+    join_output_tokens = join_prompt.estimate_output_tokens()
+
+    # the input of a join call is made of map summaries on the first level only
+    estimated_seconds = estimate_seconds_of_calls(
+        map_input_tokens,
+        map_output_tokens,
+        max_concurrency,
+        map_summarizer.rate_limiter,
+    )
+    join_input_tokens: List[int] = []
+    for level_index, level in enumerate(reduce_levels):
+        n_group_summary_tokens = (
+            n_summary_tokens if level_index == 0 else n_joined_summary_tokens
+        )
+        level_input_tokens = [
+            n_summaries * n_group_summary_tokens
+            + join_summarizer.n_prompt_template_tokens
+            for n_summaries in level
+        ]
+        join_input_tokens.extend(level_input_tokens)
+        estimated_seconds += estimate_seconds_of_calls(
+            level_input_tokens,
+            join_output_tokens,
+            max_concurrency,
+            join_summarizer.rate_limiter,
+        )
+
+    n_map_output_tokens = len(map_input_tokens) * map_output_tokens
+    n_join_output_tokens = len(join_input_tokens) * join_output_tokens
+    input_cost = map_summarizer.estimate_cost_of_tokens(
+        sum(map_input_tokens), precision=4
+    ) + join_summarizer.estimate_cost_of_tokens(sum(join_input_tokens), precision=4)
+    output_cost = map_summarizer.estimate_cost_of_tokens(
+        n_map_output_tokens, type="output", precision=4
+    ) + join_summarizer.estimate_cost_of_tokens(
+        n_join_output_tokens, type="output", precision=4
+    )
+
+    return SummaryPlan(
+        summary_parameters=summary_parameters,
+        num_document_tokens=document.n_tokens,
+        num_pruned_tokens=n_pruned_tokens,
+        num_chunks=len(chunk_tokens),
+        chunk_tokens=chunk_tokens,
+        reduce_levels=reduce_levels,
+        num_calls=len(map_input_tokens) + len(join_input_tokens),
+        num_input_tokens=sum(map_input_tokens) + sum(join_input_tokens),
+        num_output_tokens=n_map_output_tokens + n_join_output_tokens,
+        input_cost=round(input_cost, 4),
+        output_cost=round(output_cost, 4),
+        total_cost=round(input_cost + output_cost, 4),
+        currency="USD",
+        estimated_seconds=round(estimated_seconds, 1),
+        max_concurrency=max_concurrency,
+    )
+
+
+async def plan_file(summary_parameters: SummaryParameters) -> SummaryPlan:
+    """Fetch the file at the URL of the parameters and plan its summarization, see ``plan_document``.
+
+    The file and its text are kept in the artifact store, so the summarization that follows
+    does not download or extract it again.
+
+    Args:
+        summary_parameters (SummaryParameters): parameters for summarization.
+
+    Raises:
+        HTTPException: if the file can not be downloaded.
+
+    Returns:
+        SummaryPlan: plan of the summarization of the file.
+    """
+    document = await fetch_document(
+        summary_parameters.url, summary_parameters.model_name
+    )
+    return await plan_document(document, summary_parameters)
+
+
+async def summarize_file(
+    summary_parameters: SummaryParameters,
+    on_event: Optional[EventCallback] = None,
+    include_timings: bool = False,
+) -> SummaryResponse:
+    """Fetch the file at the URL of the parameters and summarize its content.
+
+    Progress is reported to ``on_event`` in order: "downloaded" once the file is on disk,
+    "extracted" once its text is tokenized, "chunk" every time a chunk summary is done and
+    "summary" with the final response.
+
+    Requests with the same parameters as a summary already being computed, by this process
+    or another one sharing the single flight, wait for its result instead, with only the
+    "summary" event.
+
+    Args:
+        summary_parameters (SummaryParameters): parameters for summarization.
+        on_event (Optional[EventCallback], optional): called with each progress event. Defaults to None.
+        include_timings (bool, optional): add the seconds spent in each stage to the response.
+            Defaults to False.
+
+    Raises:
+        HTTPException: if the file can not be downloaded.
+
+    Returns:
+        SummaryResponse: summary of the file and its metadata.
+    """
+    if include_timings:
+        start_timing()
+
+    async def summarize() -> SummaryResponse:
+        document = await fetch_document(
+            summary_parameters.url, summary_parameters.model_name, on_event=on_event
+        )
+        return await summarize_document(document, summary_parameters, on_event=on_event)
+
+    if single_flight is None:
+        return await summarize()
+
+    summary_response: Optional[SummaryResponse] = None
+
+    async def summarize_once() -> str:
+        nonlocal summary_response
+        summary_response = await summarize()
+        return summary_response.model_dump_json()
+
+    # the URL, model, summary length and every other parameter
+    flight_key = hashlib.sha256(
+        summary_parameters.model_dump_json().encode()
+    ).hexdigest()
+    result = await single_flight.run(flight_key, summarize_once)
+    if summary_response is None:
+        # computed by another request
+        summary_response = SummaryResponse.model_validate_json(result)
+        _emit(on_event, "summary", response=summary_response)
+    return summary_response
+
+
+async def summarize_batch(
+    items: List[SummaryParameters],
+    max_concurrent_calls: int = BATCH_MAX_CONCURRENT_CALLS,
+    max_concurrent_downloads: int = BATCH_MAX_CONCURRENT_DOWNLOADS,
+    max_documents: int = BATCH_MAX_DOCUMENTS,
+) -> List[BatchItemResult]:
+    """Summarize many files, maximizing the throughput of the whole batch.
+
+    Files are downloaded concurrently over the pooled HTTP client of the app, each distinct
+    URL only once per model. The model calls of all documents share one concurrency bound, so
+    chunks from every document compete for the same slots and keep the rate limit saturated.
+    A failing item is reported in its result and does not affect the others.
+
+    At most ``max_documents`` documents are downloaded or held in memory at the same time, a
+    document is dropped once the last item using it is done.
+
+    Args:
+        items (List[SummaryParameters]): parameters of each summarization.
+        max_concurrent_calls (int, optional): maximum number of model calls running at the same time.
+            Defaults to ``BATCH_MAX_CONCURRENT_CALLS``.
+        max_concurrent_downloads (int, optional): maximum number of downloads running at the same time.
+            Defaults to ``BATCH_MAX_CONCURRENT_DOWNLOADS``.
+        max_documents (int, optional): maximum number of documents held at the same time.
+            Defaults to ``BATCH_MAX_DOCUMENTS``.
+
+    Returns:
+        List[BatchItemResult]: result or error of each item, in the order of ``items``.
+    """
+    call_semaphore = asyncio.Semaphore(max_concurrent_calls)
+    download_semaphore = asyncio.Semaphore(max_concurrent_downloads)
+    # released once a document is dropped
+    document_semaphore = asyncio.Semaphore(max_documents)
+    documents: Dict[Tuple[str, str], "asyncio.Task[TokenizedDocument]"] = {}
+    # number of items not done yet with each document
+    n_remaining_items = Counter((item.url, item.model_name) for item in items)
+
+    http_client = get_http_client()
+
+    async def fetch(url: str, model_name: str) -> TokenizedDocument:
+        await document_semaphore.acquire()
+        try:
+            async with download_semaphore:
+                return await fetch_document(url, model_name, http_client=http_client)
+        except BaseException:
+            document_semaphore.release()
+            raise
+
+    def drop(document_key: Tuple[str, str]) -> None:
+        n_remaining_items[document_key] -= 1
+        if n_remaining_items[document_key] > 0:
+            return
+        task = documents.pop(document_key)
+        if not task.done():
+            # the batch was cancelled, releases the document semaphore if it was taken
+            task.cancel()
+        elif not task.cancelled() and task.exception() is None:
+            document_semaphore.release()
+
+    async def summarize_item(
+        summary_parameters: SummaryParameters,
+    ) -> BatchItemResult:
+        document_key = (summary_parameters.url, summary_parameters.model_name)
+        if document_key not in documents:
+            documents[document_key] = asyncio.create_task(fetch(*document_key))
+
+        try:
+            document = await documents[document_key]
+            summary_response = await summarize_document(
+                document, summary_parameters, semaphore=call_semaphore
+            )
+        except HTTPException as e:
+            return BatchItemResult(
+                summary_parameters=summary_parameters, error=e.detail
+            )
+        except Exception as e:
+            logger.exception(f"Unable to summarize {summary_parameters.url}.")
+            return BatchItemResult(summary_parameters=summary_parameters, error=str(e))
+        finally:
+            drop(document_key)
+
+        return BatchItemResult(
+            summary_parameters=summary_parameters, result=summary_response
+        )
+
+    return await asyncio.gather(*(summarize_item(item) for item in items))
@@ -1,16 +1,26 @@
+import hashlib
 import json
 from dataclasses import dataclass
 from enum import Enum
-from typing import Any
+from logging import INFO, getLogger
+from typing import Any, Optional
 
-from .display import print_to_console
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+# conservative number of tokens per generated English word
+TOKENS_PER_WORD = 1.5
+# tokens of the JSON syntax and missing entities of a single densification round
+TOKENS_PER_ROUND = 40
+# tokens of a generated title
+TOKENS_PER_TITLE = 20
 
 _DEFAULT_COD_TEMPLATE = """
 Article: {text}
 
 You will generate increasingly concise, entity-dense summaries of the above article.
 
-Repeat the following 2 steps 5 times.
+Repeat the following 2 steps {n_repeats}.
 
 Step 1. Identify 1-3 informative entities (";" delimited) from the article which are missing from the previously generated summary.
 
@@ -30,7 +40,7 @@ A missing entity is:
 
 Guidelines:
 
-- The first summary should be long ({n_sentences} sentences, ~{n_words} words) yet highly non-specific, containing little information beyond the entities marked as missing. Use overly verbose language and fillers (e.g., "this article discusses") to reach ~{n_words} words.
+- {first_summary_guideline}
 
 - Make every word count: rewrite the previous summary to improve flow and make space for additional entities.
 
@@ -42,7 +52,7 @@ Guidelines:
 
 - Never drop entities from the previous summary. If space cannot be made, add fewer new entities.
 
-Remember, use the exact same number of words for each summary. Answer in complete and valid JSON. The JSON should be a correctly formatted list (length 5) of dictionaries whose keys are "Missing_Entities" and "Denser_Summary".
+Remember, use the exact same number of words for each summary. Answer in complete and valid JSON. The JSON should be a correctly formatted list (length {n_rounds}) of dictionaries whose keys are "Missing_Entities" and "Denser_Summary".
 """
 
 
@@ -51,7 +61,7 @@ Article chunk summaries: {text}
 
 You will generate an increasingly coherent complete summary of an article by joining the above article chunk summaries.
 
-Repeat the following 3 steps 5 times.
+Repeat the following 3 steps {n_repeats}.
 
 Step 1. Identify 1-3 informative entities (";" delimited) from the chunk summaries which are missing from the previously generated summary.
 
@@ -73,7 +83,7 @@ A missing entity is:
 
 Guidelines:
 
-- The first summary should be long ({n_sentences} sentences, ~{n_words} words) yet highly non-specific, containing little information beyond the entities marked as missing. Use overly verbose language and fillers (e.g., "this article discusses") to reach ~{n_words} words.
+- {first_summary_guideline}
 
 - Make every word count: rewrite the previous summary to improve flow and make space for additional entities.
 
@@ -83,10 +93,14 @@ Guidelines:
 
 - Never drop entities from the previous summary. If space cannot be made, add fewer new entities.
 
-Remember, use the exact same number of words for each summary. Answer in complete and valid JSON. The JSON should be a correctly formatted list (length 5) of dictionaries whose keys are "Missing_Entities", "Denser_Summary" and "Title".
+Remember, use the exact same number of words for each summary. Answer in complete and valid JSON. The JSON should be a correctly formatted list (length {n_rounds}) of dictionaries whose keys are "Missing_Entities", "Denser_Summary" and "Title".
 """
 
 
+class SummaryParseError(ValueError):
+    """The output of a model is not a summary in the format asked by the prompt."""
+
+
 @dataclass
 class Summary:
     title: str
@@ -114,6 +128,53 @@ class SummaryLength(str, Enum):
         return n_words
 
 
+class SummaryMode(str, Enum):
+    # five densification rounds, the densest summaries
+    DENSE = "dense"
+    # two rounds, a fraction of the output tokens and latency
+    FAST = "fast"
+    # a single summary, written dense from the start
+    FINAL = "final"
+
+    @staticmethod
+    def get_n_rounds(summary_mode: "SummaryMode") -> int:
+        mode_to_rounds = {
+            SummaryMode.DENSE: 5,
+            SummaryMode.FAST: 2,
+            SummaryMode.FINAL: 1,
+        }
+
+        return mode_to_rounds[summary_mode]
+
+
+def _format_densification_template(
+    template: str, text: str, summary_length: "SummaryLength", n_rounds: int
+) -> str:
+    n_words = SummaryLength.estimate_length_in_words(summary_length)
+    if n_rounds == 1:
+        first_summary_guideline = (
+            f"The summary should be {summary_length.value} (~{n_words} words) long, "
+            "highly dense and specific, covering the most informative entities."
+        )
+    else:
+        first_summary_guideline = (
+            f"The first summary should be long ({summary_length.value}, ~{n_words} words) "
+            "yet highly non-specific, containing little information beyond the entities "
+            'marked as missing. Use overly verbose language and fillers (e.g., "this '
+            f'article discusses") to reach ~{n_words} words.'
+        )
+    n_repeats = {1: "once", 2: "twice"}.get(n_rounds, f"{n_rounds} times")
+
+    return template.format(
+        text=text,
+        n_sentences=summary_length.value,
+        n_words=n_words,
+        n_rounds=n_rounds,
+        n_repeats=n_repeats,
+        first_summary_guideline=first_summary_guideline,
+    )
+
+
 class SummarizationPrompt:
     def __call__(self, text: str) -> Any:
         return text
@@ -124,39 +185,78 @@ class SummarizationPrompt:
     def extract_summary(self, text: str) -> Summary:
         return Summary(title="Title", content=text)
 
+    def estimate_output_tokens(self) -> int:
+        """Number of tokens to reserve in the context window for the model output."""
+        return 0
+
+    def estimate_summary_tokens(self) -> int:
+        """Number of tokens of the summary extracted from the model output."""
+        return 0
+
+    def get_n_output_items(self) -> Optional[int]:
+        """Number of elements of the JSON list the model answers with, None if not a list.
+
+        The answer is complete as soon as that many elements are, so generation can stop.
+        """
+        return None
+
+    def cache_key(self) -> str:
+        """String identifying the prompt in summary cache keys.
+
+        Two prompts with the same cache key must produce the same model input for a given text.
+        """
+        return type(self).__name__
+
 
 class ChainOfDensityPrompt(SummarizationPrompt):
     def __init__(
         self,
         summary_length: SummaryLength = SummaryLength.SHORT,
         template: str = _DEFAULT_COD_TEMPLATE,
+        summary_mode: SummaryMode = SummaryMode.DENSE,
     ) -> None:
         self.template = template
         self.summary_length = summary_length
+        self.summary_mode = summary_mode
+        # number of densification rounds the template asks for
+        self.n_rounds = SummaryMode.get_n_rounds(summary_mode)
 
     def __call__(
         self,
         text: str,
     ) -> str:
-        return self.template.format(
-            text=text,
-            n_sentences=self.summary_length.value,
-            n_words=SummaryLength.estimate_length_in_words(self.summary_length),
+        return _format_densification_template(
+            self.template, text, self.summary_length, self.n_rounds
         )
 
+    def cache_key(self) -> str:
+        template_hash = hashlib.sha256(self.template.encode()).hexdigest()
+        return f"{type(self).__name__}:{self.summary_length.value}:{self.n_rounds}:{template_hash}"
+
+    def get_n_output_items(self) -> Optional[int]:
+        return self.n_rounds
+
+    def estimate_summary_tokens(self) -> int:
+        n_words = int(SummaryLength.estimate_length_in_words(self.summary_length))
+        return int(n_words * TOKENS_PER_WORD)
+
+    def estimate_output_tokens(self) -> int:
+        n_words = int(SummaryLength.estimate_length_in_words(self.summary_length))
+        return int(self.n_rounds * (n_words * TOKENS_PER_WORD + TOKENS_PER_ROUND))
+
     def extract_summary(self, model_response: str) -> Summary:
         """ """
         # expected output format is a dictionary with keys "Missing_Entities" and "Denser_Summary"
         # we want the last output
-        print_to_console(model_response)
+        logger.debug("Model response: %s", model_response)
 
         try:
             model_response = json.loads(model_response)
             summary = model_response[-1]["Denser_Summary"]
         except json.JSONDecodeError as e:
-            raise RuntimeError("Model output could not be decoded.") from e
-        except KeyError as e:
-            raise KeyError(
+            raise SummaryParseError("Model output could not be decoded.") from e
+        except (KeyError, IndexError, TypeError) as e:
+            raise SummaryParseError(
                 "Model output does is missing ``Denser_Summary`` key."
             ) from e
 
@@ -168,18 +268,38 @@ class JoinSummariesPrompt(SummarizationPrompt):
         self,
         summary_length: SummaryLength = SummaryLength.MEDIUM,
         template: str = _DEFUAULT_JOIN_SUMMARIES_TEMPLATE,
+        summary_mode: SummaryMode = SummaryMode.DENSE,
     ) -> None:
         self.template = template
         self.summary_length = summary_length
+        self.summary_mode = summary_mode
+        # number of summary and title rounds the template asks for
+        self.n_rounds = SummaryMode.get_n_rounds(summary_mode)
 
     def __call__(
         self,
         text: str,
     ) -> str:
-        return self.template.format(
-            text=text,
-            n_sentences=self.summary_length.value,
-            n_words=SummaryLength.estimate_length_in_words(self.summary_length),
+        return _format_densification_template(
+            self.template, text, self.summary_length, self.n_rounds
+        )
+
+    def cache_key(self) -> str:
+        template_hash = hashlib.sha256(self.template.encode()).hexdigest()
+        return f"{type(self).__name__}:{self.summary_length.value}:{self.n_rounds}:{template_hash}"
+
+    def get_n_output_items(self) -> Optional[int]:
+        return self.n_rounds
+
+    def estimate_summary_tokens(self) -> int:
+        n_words = int(SummaryLength.estimate_length_in_words(self.summary_length))
+        return int(n_words * TOKENS_PER_WORD)
+
+    def estimate_output_tokens(self) -> int:
+        n_words = int(SummaryLength.estimate_length_in_words(self.summary_length))
+        return int(
+            self.n_rounds
+            * (n_words * TOKENS_PER_WORD + TOKENS_PER_ROUND + TOKENS_PER_TITLE)
         )
 
     def extract_summary(self, model_response: str) -> Summary:
@@ -191,9 +311,9 @@ class JoinSummariesPrompt(SummarizationPrompt):
             summary = model_response[-1]["Denser_Summary"]
             title = model_response[-1]["Title"]
         except json.JSONDecodeError as e:
-            raise json.JSONDecodeError("Model output could not be decoded.") from e
-        except KeyError as e:
-            raise KeyError(
+            raise SummaryParseError("Model output could not be decoded.") from e
+        except (KeyError, IndexError, TypeError) as e:
+            raise SummaryParseError(
                 "Model output does is missing ``Denser_Summary`` or ``Title`` key."
             ) from e
 
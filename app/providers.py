@@ -0,0 +1,353 @@
+import asyncio
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from enum import Enum
+from typing import Callable, Dict, Optional, Tuple
+
+import openai
+import tiktoken
+
+from .config import (
+    LOCAL_LLM_API_BASE,
+    LOCAL_LLM_CONTEXT_LENGTH,
+    LOCAL_LLM_MODEL,
+    LOCAL_LLM_TOKENIZER,
+    RATE_LIMITER,
+    RATE_LIMITER_PATH,
+)
+from .ratelimit import RateLimiter, make_rate_limiter
+
+
+class AIModel(Enum):
+    gpt_3_5_turbo = "gpt-3.5-turbo"
+    gpt_3_5_turbo_16k = "gpt-3.5-turbo-16k"
+    gpt_4 = "gpt-4"
+    gpt_4_32k = "gpt-4-32k"
+
+    @staticmethod
+    def get_context_length(model: "AIModel", buffer_fraction: float = 1.00) -> int:
+        """Get the context length of the given model.
+
+        Args:
+            model (AIModel): model to get the context length of.
+            buffer_fraction (float, optional): fraction of the context length to use as a buffer. Defaults to 1.0.
+                This is included to avoid exceeding context length accidentally.
+
+        Returns:
+            int: context length of the given model.
+        """
+
+        model_to_context_length = {
+            AIModel.gpt_3_5_turbo: buffer_fraction * 4096,
+            AIModel.gpt_3_5_turbo_16k: buffer_fraction * 16384,
+            AIModel.gpt_4: buffer_fraction * 8192,
+            AIModel.gpt_4_32k: buffer_fraction * 32768,
+        }
+
+        return int(model_to_context_length[model])
+
+    @staticmethod
+    def get_rate_limits(model: "AIModel") -> Tuple[int, int]:
+        """Get the account rate limits of the given model.
+
+        Args:
+            model (AIModel): model to get the rate limits of.
+
+        Returns:
+            Tuple[int, int]: requests per minute and tokens per minute.
+        """
+
+        model_to_rate_limits = {
+            AIModel.gpt_3_5_turbo: (3500, 90000),
+            AIModel.gpt_3_5_turbo_16k: (3500, 180000),
+            AIModel.gpt_4: (200, 40000),
+            AIModel.gpt_4_32k: (200, 80000),
+        }
+
+        return model_to_rate_limits[model]
+
+    @staticmethod
+    def get_prices(model: "AIModel") -> Tuple[float, float]:
+        """Get the price of the given model.
+
+        Args:
+            model (AIModel): model to get the price of.
+
+        Returns:
+            Tuple[float, float]: price of 1000 input tokens and of 1000 output tokens, in USD.
+        """
+
+        model_to_prices = {
+            AIModel.gpt_3_5_turbo: (0.0015, 0.002),
+            AIModel.gpt_3_5_turbo_16k: (0.003, 0.004),
+            AIModel.gpt_4: (0.03, 0.06),
+            AIModel.gpt_4_32k: (0.06, 0.12),
+        }
+
+        return model_to_prices[model]
+
+
+@dataclass
+class Completion:
+    content: str
+    finish_reason: Optional[str]
+    # token usage reported by the backend, None if it does not report it
+    n_input_tokens: Optional[int] = None
+    n_output_tokens: Optional[int] = None
+
+
+class LLMProvider(ABC):
+    """Backend serving chat models.
+
+    Providers are registered for the names of their models with ``register_provider``.
+
+    Attributes:
+        model_names: names of the models served by the provider.
+    """
+
+    model_names: Tuple[str, ...] = ()
+
+    @abstractmethod
+    def complete(
+        self, model_name: str, prompt: str, timeout: float, **kwargs
+    ) -> Completion:
+        """Complete a single user message, failing after ``timeout`` seconds."""
+
+    @abstractmethod
+    async def acomplete(
+        self, model_name: str, prompt: str, timeout: float, **kwargs
+    ) -> Completion:
+        """Complete a single user message without blocking the event loop."""
+
+    async def astream(
+        self,
+        model_name: str,
+        prompt: str,
+        timeout: float,
+        on_delta: Callable[[str], bool],
+        **kwargs,
+    ) -> Completion:
+        """Complete a single user message, passing the output to ``on_delta`` as it is generated.
+
+        Generation stops as soon as ``on_delta`` returns True. Providers that can not stream
+        pass the whole output at once.
+        """
+        completion = await self.acomplete(model_name, prompt, timeout, **kwargs)
+        on_delta(completion.content)
+        return completion
+
+    @abstractmethod
+    def get_tokenizer(self, model_name: str) -> tiktoken.Encoding:
+        """Get the tokenizer of the model, or the closest approximation of it."""
+
+    @abstractmethod
+    def get_context_length(self, model_name: str) -> int:
+        """Get the number of tokens of the context window of the model."""
+
+    @abstractmethod
+    def get_prices(self, model_name: str) -> Tuple[float, float]:
+        """Get the price of 1000 input tokens and of 1000 output tokens, in USD."""
+
+    def get_rate_limiter(self, model_name: str) -> Optional[RateLimiter]:
+        """Get the rate limiter shared by all calls to the model, None if unlimited."""
+        return None
+
+
+# rate limits apply to the whole account, so all calls to a model share a limiter
+_rate_limiters: Dict[str, RateLimiter] = {}
+
+
+class OpenAIProvider(LLMProvider):
+    """Models of the OpenAI API, or of any server implementing its chat completions.
+
+    Attributes:
+        api_key: API key, None to use ``openai.api_key``.
+        api_base: base URL of the API, None to use ``openai.api_base``.
+    """
+
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        api_base: Optional[str] = None,
+        model_names: Tuple[str, ...] = tuple(model.value for model in AIModel),
+    ) -> None:
+        self.api_key = api_key
+        self.api_base = api_base
+        self.model_names = model_names
+
+    def _make_request(self, model_name: str, prompt: str, **kwargs) -> dict:
+        request = dict(
+            model=model_name, messages=[{"role": "user", "content": prompt}], **kwargs
+        )
+        if self.api_key is not None:
+            request["api_key"] = self.api_key
+        if self.api_base is not None:
+            request["api_base"] = self.api_base
+        return request
+
+    @staticmethod
+    def _make_completion(openai_response) -> Completion:
+        choice = openai_response.choices[0]
+        usage = getattr(openai_response, "usage", None)
+        return Completion(
+            content=choice.message.content,
+            finish_reason=choice.finish_reason,
+            n_input_tokens=usage.prompt_tokens if usage is not None else None,
+            n_output_tokens=usage.completion_tokens if usage is not None else None,
+        )
+
+    def complete(
+        self, model_name: str, prompt: str, timeout: float, **kwargs
+    ) -> Completion:
+        openai_response = openai.ChatCompletion.create(
+            **self._make_request(model_name, prompt, request_timeout=timeout, **kwargs)
+        )
+        return self._make_completion(openai_response)
+
+    async def acomplete(
+        self, model_name: str, prompt: str, timeout: float, **kwargs
+    ) -> Completion:
+        openai_response = await asyncio.wait_for(
+            openai.ChatCompletion.acreate(
+                **self._make_request(model_name, prompt, **kwargs)
+            ),
+            timeout=timeout,
+        )
+        return self._make_completion(openai_response)
+
+    async def astream(
+        self,
+        model_name: str,
+        prompt: str,
+        timeout: float,
+        on_delta: Callable[[str], bool],
+        **kwargs,
+    ) -> Completion:
+        async def stream() -> Completion:
+            chunks = await openai.ChatCompletion.acreate(
+                **self._make_request(model_name, prompt, stream=True, **kwargs)
+            )
+            parts = []
+            finish_reason = None
+            try:
+                async for chunk in chunks:
+                    choice = chunk.choices[0]
+                    delta = getattr(choice.delta, "content", None)
+                    if delta:
+                        parts.append(delta)
+                        if on_delta(delta):
+                            # the output is complete, the rest is not worth waiting for
+                            finish_reason = "stop"
+                            break
+                    if choice.finish_reason is not None:
+                        finish_reason = choice.finish_reason
+            finally:
+                # closes the connection, which stops the generation
+                await chunks.aclose()
+            # streamed responses do not report token usage
+            return Completion(content="".join(parts), finish_reason=finish_reason)
+
+        return await asyncio.wait_for(stream(), timeout=timeout)
+
+    def get_tokenizer(self, model_name: str) -> tiktoken.Encoding:
+        return tiktoken.encoding_for_model(model_name=model_name)
+
+    def get_context_length(self, model_name: str) -> int:
+        return AIModel.get_context_length(AIModel(model_name))
+
+    def get_prices(self, model_name: str) -> Tuple[float, float]:
+        return AIModel.get_prices(AIModel(model_name))
+
+    def get_rate_limiter(self, model_name: str) -> Optional[RateLimiter]:
+        if model_name not in _rate_limiters:
+            requests_per_minute, tokens_per_minute = AIModel.get_rate_limits(
+                AIModel(model_name)
+            )
+            _rate_limiters[model_name] = make_rate_limiter(
+                RATE_LIMITER,
+                model_name,
+                requests_per_minute,
+                tokens_per_minute,
+                path=RATE_LIMITER_PATH,
+            )
+        return _rate_limiters[model_name]
+
+
+class LocalProvider(OpenAIProvider):
+    """A model served on the local machine by an OpenAI-compatible server, e.g. llama.cpp or vLLM.
+
+    Local models are free and not rate limited. Their tokenizer is approximated with a
+    tiktoken encoding, so keep some margin in ``context_length``.
+
+    Attributes:
+        model_name: name of the model, as expected by the server.
+        context_length: number of tokens of the context window the server was started with.
+        tokenizer_name: tiktoken encoding approximating the tokenizer of the model.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        api_base: str = "http://localhost:8080/v1",
+        context_length: int = 4096,
+        tokenizer_name: str = "cl100k_base",
+    ) -> None:
+        # local servers ignore the key, the client requires one
+        super().__init__(api_key="local", api_base=api_base, model_names=(model_name,))
+        self.model_name = model_name
+        self.context_length = context_length
+        self.tokenizer_name = tokenizer_name
+
+    def get_tokenizer(self, model_name: str) -> tiktoken.Encoding:
+        return tiktoken.get_encoding(self.tokenizer_name)
+
+    def get_context_length(self, model_name: str) -> int:
+        return self.context_length
+
+    def get_prices(self, model_name: str) -> Tuple[float, float]:
+        return 0.0, 0.0
+
+    def get_rate_limiter(self, model_name: str) -> Optional[RateLimiter]:
+        return None
+
+
+_providers: Dict[str, LLMProvider] = {}
+
+
+def register_provider(provider: LLMProvider) -> None:
+    """Register a provider for the names of its models, replacing previous ones.
+
+    Args:
+        provider (LLMProvider): provider to register.
+    """
+    for model_name in provider.model_names:
+        _providers[model_name] = provider
+
+
+def get_provider(model_name: str) -> LLMProvider:
+    """Get the provider serving a model.
+
+    Args:
+        model_name (str): name of the model, e.g. "gpt-3.5-turbo".
+
+    Raises:
+        ValueError: if no provider serves the model.
+
+    Returns:
+        LLMProvider: provider of the model.
+    """
+    if model_name not in _providers:
+        raise ValueError(f"Unknown model: {model_name}")
+    return _providers[model_name]
+
+
+register_provider(OpenAIProvider())
+if LOCAL_LLM_MODEL:
+    register_provider(
+        LocalProvider(
+            LOCAL_LLM_MODEL,
+            api_base=LOCAL_LLM_API_BASE,
+            context_length=LOCAL_LLM_CONTEXT_LENGTH,
+            tokenizer_name=LOCAL_LLM_TOKENIZER,
+        )
+    )
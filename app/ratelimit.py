@@ -0,0 +1,243 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Optional, Union
+
+
+class TokenBucket:
+    """Continuously refilling token bucket.
+
+    Attributes:
+        capacity: maximum number of units the bucket can hold.
+        refill_rate: number of units added to the bucket per second.
+    """
+
+    def __init__(self, capacity: float, refill_rate: float) -> None:
+        """Create a new TokenBucket instance. The bucket starts full.
+
+        Args:
+            capacity (float): maximum number of units the bucket can hold.
+            refill_rate (float): number of units added to the bucket per second.
+        """
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self._level = capacity
+        self._last_refill = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._last_refill
+        self._level = min(self.capacity, self._level + elapsed * self.refill_rate)
+        self._last_refill = now
+
+    def time_until_available(self, amount: float) -> float:
+        """Number of seconds until ``amount`` units can be taken from the bucket.
+
+        Args:
+            amount (float): number of units requested. Clamped to the bucket capacity.
+
+        Returns:
+            float: seconds to wait, 0.0 if the units are available right away.
+        """
+        self._refill()
+        amount = min(amount, self.capacity)
+        if self._level >= amount:
+            return 0.0
+        return (amount - self._level) / self.refill_rate
+
+    def take(self, amount: float) -> None:
+        """Remove ``amount`` units from the bucket, clamped to the bucket capacity."""
+        self._refill()
+        self._level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """Async limiter for requests per minute and tokens per minute.
+
+    Every call to ``acquire`` consumes one request and the given number of tokens,
+    waiting until both budgets allow it.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int,
+        tokens_per_minute: Optional[int] = None,
+    ) -> None:
+        """Create a new RateLimiter instance.
+
+        Args:
+            requests_per_minute (int): maximum number of requests per minute.
+            tokens_per_minute (Optional[int], optional): maximum number of tokens per minute.
+                Defaults to None, in which case tokens are not limited.
+        """
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests = TokenBucket(requests_per_minute, requests_per_minute / 60)
+        self._tokens = (
+            TokenBucket(tokens_per_minute, tokens_per_minute / 60)
+            if tokens_per_minute
+            else None
+        )
+        self._lock = asyncio.Lock()
+        # the buckets are shared by the event loop and blocking calls in other threads
+        self._buckets_lock = threading.Lock()
+        self._blocking_lock = threading.Lock()
+
+    def _try_take(self, n_tokens: int) -> float:
+        """Take a request and ``n_tokens`` tokens if available, else get the seconds to wait."""
+        with self._buckets_lock:
+            wait = self._requests.time_until_available(1)
+            if self._tokens is not None:
+                wait = max(wait, self._tokens.time_until_available(n_tokens))
+            if wait > 0:
+                return wait
+
+            self._requests.take(1)
+            if self._tokens is not None:
+                self._tokens.take(n_tokens)
+            return 0.0
+
+    async def acquire(self, n_tokens: int = 0) -> None:
+        """Wait until a request using ``n_tokens`` tokens fits the rate limits.
+
+        Args:
+            n_tokens (int, optional): estimated number of tokens the request will use. Defaults to 0.
+        """
+        # the lock keeps waiters in FIFO order, so large requests are not starved
+        async with self._lock:
+            wait = self._try_take(n_tokens)
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._try_take(n_tokens)
+
+    def acquire_blocking(self, n_tokens: int = 0) -> None:
+        """Blocking version of ``acquire``."""
+        with self._blocking_lock:
+            wait = self._try_take(n_tokens)
+            while wait > 0:
+                time.sleep(wait)
+                wait = self._try_take(n_tokens)
+
+
+class SQLiteRateLimiter(RateLimiter):
+    """Limiter whose buckets are stored in a SQLite database, shared by every process using it.
+
+    Worker processes of the same server share the rate limits of the account, so each of them
+    must see the requests and tokens taken by the others. Instead of polling, a request takes
+    its budget right away, even beyond what the buckets hold, and waits until the debt is
+    refilled. Requests are thus spaced at the refill rate across all processes, rather than
+    all retrying at once whenever the buckets refill.
+
+    Attributes:
+        name: name of the limited resource, e.g. the model, the key of its buckets.
+        path: path of the SQLite database file.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        requests_per_minute: int,
+        tokens_per_minute: Optional[int] = None,
+        path: Union[str, Path] = "rate_limits.sqlite3",
+    ) -> None:
+        """Create a new SQLiteRateLimiter instance. Buckets start full if not stored yet.
+
+        Args:
+            name (str): name of the limited resource, e.g. "gpt-3.5-turbo".
+            requests_per_minute (int): maximum number of requests per minute.
+            tokens_per_minute (Optional[int], optional): maximum number of tokens per minute.
+                Defaults to None, in which case tokens are not limited.
+            path (Union[str, Path], optional): SQLite database file.
+                Defaults to "rate_limits.sqlite3".
+        """
+        super().__init__(requests_per_minute, tokens_per_minute)
+        self.name = name
+        self.path = Path(path)
+        # transactions are started explicitly, see ``_reserve``
+        self._connection = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            "key TEXT PRIMARY KEY, level REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+
+    def _reserve(self, n_tokens: int) -> float:
+        """Take a request and ``n_tokens`` tokens, and get the seconds until they are refilled."""
+        # (bucket, capacity, amount), amounts are clamped to the capacity like ``TokenBucket``
+        buckets = [(f"{self.name}:requests", self.requests_per_minute, 1)]
+        if self.tokens_per_minute:
+            buckets.append(
+                (
+                    f"{self.name}:tokens",
+                    self.tokens_per_minute,
+                    min(n_tokens, self.tokens_per_minute),
+                )
+            )
+
+        wait = 0.0
+        with self._buckets_lock:
+            # a write lock from the start, so no other process reads the buckets meanwhile
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                # wall clock time, the monotonic clock is not shared between processes
+                now = time.time()
+                for key, capacity, amount in buckets:
+                    refill_rate = capacity / 60
+                    row = self._connection.execute(
+                        "SELECT level, updated_at FROM buckets WHERE key = ?", (key,)
+                    ).fetchone()
+                    level, updated_at = row if row is not None else (capacity, now)
+                    level = min(
+                        capacity, level + max(0.0, now - updated_at) * refill_rate
+                    )
+                    level -= amount
+                    if level < 0:
+                        wait = max(wait, -level / refill_rate)
+                    self._connection.execute(
+                        "INSERT OR REPLACE INTO buckets VALUES (?, ?, ?)",
+                        (key, level, now),
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return wait
+
+    async def acquire(self, n_tokens: int = 0) -> None:
+        await asyncio.sleep(await asyncio.to_thread(self._reserve, n_tokens))
+
+    def acquire_blocking(self, n_tokens: int = 0) -> None:
+        time.sleep(self._reserve(n_tokens))
+
+
+def make_rate_limiter(
+    backend_name: str,
+    name: str,
+    requests_per_minute: int,
+    tokens_per_minute: Optional[int] = None,
+    path: Union[str, Path] = "rate_limits.sqlite3",
+) -> RateLimiter:
+    """Create a rate limiter.
+
+    Args:
+        backend_name (str): backend of the limiter, one of "memory" for a limiter of the current
+            process or "sqlite" for a limiter shared by the processes using the same file.
+        name (str): name of the limited resource, e.g. "gpt-3.5-turbo".
+        requests_per_minute (int): maximum number of requests per minute.
+        tokens_per_minute (Optional[int], optional): maximum number of tokens per minute.
+            Defaults to None, in which case tokens are not limited.
+        path (Union[str, Path], optional): SQLite database file. Defaults to "rate_limits.sqlite3".
+
+    Returns:
+        RateLimiter: rate limiter.
+    """
+    if backend_name == "memory":
+        return RateLimiter(requests_per_minute, tokens_per_minute)
+    if backend_name == "sqlite":
+        return SQLiteRateLimiter(name, requests_per_minute, tokens_per_minute, path)
+
+    raise ValueError(f"Unknown rate limiter backend: {backend_name}")
@@ -0,0 +1,180 @@
+import asyncio
+import random
+import time
+from logging import INFO, getLogger
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+
+logger = getLogger(__name__)
+logger.setLevel(INFO)
+
+T = TypeVar("T")
+
+
+def get_retry_reason(error: BaseException) -> Optional[str]:
+    """Get the reason to retry a failed model call, None if retrying would not help.
+
+    Args:
+        error (BaseException): error raised by the call.
+
+    Returns:
+        Optional[str]: one of "timeout", "rate_limit", "server_error" or "connection".
+    """
+    if isinstance(error, (asyncio.TimeoutError, openai.error.Timeout)):
+        return "timeout"
+    if isinstance(error, openai.error.RateLimitError):
+        return "rate_limit"
+    if isinstance(error, (openai.error.ServiceUnavailableError, openai.error.TryAgain)):
+        return "server_error"
+    if isinstance(error, openai.error.APIError) and (
+        error.http_status is None or error.http_status >= 500
+    ):
+        return "server_error"
+    if isinstance(error, openai.error.APIConnectionError):
+        return "connection"
+    return None
+
+
+def get_backoff_delay(
+    error: BaseException, attempt: int, base_delay: float, max_delay: float
+) -> float:
+    """Get the delay before retrying a call, exponential with full jitter.
+
+    A ``Retry-After`` header sent with the error is honored if it asks for a longer delay.
+
+    Args:
+        error (BaseException): error raised by the call.
+        attempt (int): number of the failed attempt, starting at 0.
+        base_delay (float): maximum delay after the first attempt, in seconds.
+        max_delay (float): upper bound of the delay, in seconds.
+
+    Returns:
+        float: delay in seconds.
+    """
+    delay = random.uniform(0, min(max_delay, base_delay * 2**attempt))
+
+    headers = getattr(error, "headers", None) or {}
+    try:
+        retry_after = float(headers.get("retry-after", 0))
+    except (TypeError, ValueError):
+        retry_after = 0
+    return max(delay, min(retry_after, max_delay))
+
+
+async def aretry(
+    call: Callable[[], Awaitable[T]],
+    max_retries: int,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    on_retry: Optional[Callable[[str], None]] = None,
+) -> T:
+    """Await ``call``, retrying with exponential backoff on rate limits and transient errors.
+
+    Args:
+        call (Callable[[], Awaitable[T]]): makes a new attempt of the call.
+        max_retries (int): maximum number of retries after the first attempt.
+        base_delay (float, optional): maximum delay after the first attempt, in seconds. Defaults to 1.0.
+        max_delay (float, optional): upper bound of the delay, in seconds. Defaults to 60.0.
+        on_retry (Optional[Callable[[str], None]], optional): called with the reason of each retry.
+            Defaults to None.
+
+    Returns:
+        T: result of the first successful attempt.
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            return await call()
+        except Exception as e:
+            reason = get_retry_reason(e)
+            if reason is None or attempt == max_retries:
+                raise
+
+            delay = get_backoff_delay(e, attempt, base_delay, max_delay)
+            logger.warning(
+                "Model call failed (%s), retrying in %.1fs: %r",
+                reason,
+                delay,
+                e,
+                extra={"reason": reason, "attempt": attempt},
+            )
+            if on_retry is not None:
+                on_retry(reason)
+            await asyncio.sleep(delay)
+
+
+def retry(
+    call: Callable[[], T],
+    max_retries: int,
+    base_delay: float = 1.0,
+    max_delay: float = 60.0,
+    on_retry: Optional[Callable[[str], None]] = None,
+) -> T:
+    """Blocking version of ``aretry``."""
+    for attempt in range(max_retries + 1):
+        try:
+            return call()
+        except Exception as e:
+            reason = get_retry_reason(e)
+            if reason is None or attempt == max_retries:
+                raise
+
+            delay = get_backoff_delay(e, attempt, base_delay, max_delay)
+            logger.warning(
+                "Model call failed (%s), retrying in %.1fs: %r",
+                reason,
+                delay,
+                e,
+                extra={"reason": reason, "attempt": attempt},
+            )
+            if on_retry is not None:
+                on_retry(reason)
+            time.sleep(delay)
+
+
+async def ahedge(
+    call: Callable[[], Awaitable[T]],
+    hedge_after: Optional[float],
+    on_hedge: Optional[Callable[[], None]] = None,
+) -> T:
+    """Await ``call``, starting a duplicate if it is still running after ``hedge_after`` seconds.
+
+    The first attempt to succeed wins and the other is cancelled, so a straggling request
+    costs at most ``hedge_after`` seconds more than a typical one.
+
+    Args:
+        call (Callable[[], Awaitable[T]]): makes a new attempt of the call.
+        hedge_after (Optional[float]): seconds to wait before the duplicate, None to never hedge.
+        on_hedge (Optional[Callable[[], None]], optional): called when the duplicate starts.
+            Defaults to None.
+
+    Returns:
+        T: result of the first successful attempt.
+    """
+    if hedge_after is None:
+        return await call()
+
+    first = asyncio.ensure_future(call())
+    attempts = [first]
+    # attempts still running when this returns or is cancelled are cancelled too
+    try:
+        done, _ = await asyncio.wait({first}, timeout=hedge_after)
+        if done:
+            return first.result()
+
+        if on_hedge is not None:
+            on_hedge()
+        attempts.append(asyncio.ensure_future(call()))
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(
+                pending, return_when=asyncio.FIRST_COMPLETED
+            )
+            for attempt in done:
+                if attempt.exception() is None:
+                    return attempt.result()
+        # both attempts failed, report the error of the original one
+        return first.result()
+    finally:
+        for attempt in attempts:
+            attempt.cancel()
@@ -1,6 +1,10 @@
-from pydantic import BaseModel
+from enum import Enum
+from typing import Any, Dict, List, Optional
 
-from .prompts import Summary, SummaryLength
+from pydantic import BaseModel, Field
+
+from .config import BATCH_MAX_ITEMS
+from .prompts import Summary, SummaryLength, SummaryMode
 
 
 # model_name is string to avoid circular imports
@@ -10,6 +14,11 @@ class SummaryParameters(BaseModel):
     url: str
     model_name: str = "gpt-3.5-turbo"
     summary_length: SummaryLength = SummaryLength.SHORT
+    # number of densification rounds, fewer rounds generate fewer output tokens
+    summary_mode: SummaryMode = SummaryMode.DENSE
+    # chunk by content and reuse the cached summaries of unchanged chunks,
+    # for documents summarized again after small edits
+    incremental: bool = False
 
 
 class SummaryResponse(BaseModel):
@@ -21,3 +30,81 @@ class SummaryResponse(BaseModel):
     currency: str
     num_input_tokens: int
     num_output_tokens: int
+    # True when the summary was served from the summary cache without calling the model
+    cached: bool = False
+    # number of chunks of a long document, and how many had a cached summary
+    num_chunks: int = 0
+    num_chunks_reused: int = 0
+    # tokens removed before summarizing, e.g. repeated headers or stripped references
+    num_pruned_tokens: int = 0
+    # seconds spent in each stage, e.g. "download" or "map", only when requested
+    timings: Optional[Dict[str, float]] = None
+
+
+class SummaryPlan(BaseModel):
+    summary_parameters: SummaryParameters
+    # tokens of the document once filtered, and tokens removed by the filters
+    num_document_tokens: int
+    num_pruned_tokens: int = 0
+    # chunks of a long document and their number of tokens, none if summarized in one call
+    num_chunks: int = 0
+    chunk_tokens: List[int] = []
+    # number of summaries joined by each call, for each level of the reduce tree
+    reduce_levels: List[List[int]] = []
+    # projected model calls and their tokens, including the prompt templates
+    num_calls: int
+    num_input_tokens: int
+    num_output_tokens: int
+    input_cost: float
+    output_cost: float
+    total_cost: float
+    currency: str
+    # projected seconds of model calls, at ``max_concurrency`` calls at a time
+    estimated_seconds: float
+    max_concurrency: int
+
+
+class ProgressEvent(BaseModel):
+    # one of "downloaded", "extracted", "chunk", "summary" or "error"
+    event: str
+    data: Dict[str, Any] = {}
+
+
+class JobStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+
+class JobProgress(BaseModel):
+    # last progress event of the job, see ``ProgressEvent``
+    stage: Optional[str] = None
+    n_chunks: int = 0
+    n_chunks_done: int = 0
+
+
+class Job(BaseModel):
+    id: str
+    status: JobStatus = JobStatus.PENDING
+    summary_parameters: SummaryParameters
+    progress: JobProgress = JobProgress()
+    result: Optional[SummaryResponse] = None
+    error: Optional[str] = None
+    created_at: float
+    updated_at: float
+
+
+class BatchRequest(BaseModel):
+    items: List[SummaryParameters] = Field(max_length=BATCH_MAX_ITEMS)
+
+
+class BatchItemResult(BaseModel):
+    summary_parameters: SummaryParameters
+    # exactly one of result and error is set
+    result: Optional[SummaryResponse] = None
+    error: Optional[str] = None
+
+
+class BatchResponse(BaseModel):
+    items: List[BatchItemResult]
@@ -0,0 +1,192 @@
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from contextlib import suppress
+from pathlib import Path
+from typing import Awaitable, Callable, Dict, Optional, Tuple, Union
+
+
+class SingleFlight(ABC):
+    """Runs at most one call per key at a time, concurrent callers of a key share its result.
+
+    If the running call fails or is cancelled, one of the waiting callers runs it again.
+    """
+
+    @abstractmethod
+    async def run(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        """Await ``call``, or the result of the call already running for ``key``.
+
+        Args:
+            key (str): key of the call, identical calls have identical keys.
+            call (Callable[[], Awaitable[str]]): makes the call.
+
+        Returns:
+            str: result of the call.
+        """
+
+
+class InMemorySingleFlight(SingleFlight):
+    """Single flight of the calls of the current process."""
+
+    def __init__(self) -> None:
+        self._flights: Dict[str, "asyncio.Future[str]"] = {}
+
+    async def run(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        while key in self._flights:
+            flight = self._flights[key]
+            # shielded, a cancelled caller does not cancel the call of the others
+            with suppress(asyncio.CancelledError):
+                return await asyncio.shield(flight)
+            if not flight.cancelled():
+                # this caller was cancelled, not the call
+                raise asyncio.CancelledError()
+
+        flight: "asyncio.Future[str]" = asyncio.get_running_loop().create_future()
+        self._flights[key] = flight
+        try:
+            result = await call()
+        except BaseException:
+            # waiting callers take over
+            flight.cancel()
+            raise
+        finally:
+            del self._flights[key]
+
+        flight.set_result(result)
+        return result
+
+
+class SQLiteSingleFlight(SingleFlight):
+    """Single flight of the calls of every process using the same SQLite database.
+
+    The process running a call holds a lease on its key, renewed while the call runs, so
+    the call of a process that died is taken over once its lease expires. Results are kept
+    for ``result_ttl`` seconds for the callers polling for them.
+
+    Attributes:
+        path: path of the SQLite database file.
+        lease: seconds a call holds its key without renewing it.
+        poll_interval: seconds between two checks of a running call by waiting callers.
+        result_ttl: seconds a result is kept once the call is done.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, Path] = "single_flight.sqlite3",
+        lease: float = 30.0,
+        poll_interval: float = 0.5,
+        result_ttl: float = 10.0,
+    ) -> None:
+        self.path = Path(path)
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.result_ttl = result_ttl
+        self._lock = threading.Lock()
+        # transactions are started explicitly, see ``_try_lead``
+        self._connection = sqlite3.connect(
+            self.path, timeout=60, isolation_level=None, check_same_thread=False
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS flights ("
+            "key TEXT PRIMARY KEY, owner TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, result TEXT)"
+        )
+
+    def _try_lead(self, key: str, owner: str) -> Tuple[bool, Optional[str]]:
+        """Take the key if no call holds it, else get the result of the call if done."""
+        with self._lock:
+            # a write lock from the start, so two processes never both take the key
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                self._connection.execute(
+                    "DELETE FROM flights WHERE expires_at < ?", (now,)
+                )
+                row = self._connection.execute(
+                    "SELECT result FROM flights WHERE key = ?", (key,)
+                ).fetchone()
+                if row is None:
+                    self._connection.execute(
+                        "INSERT INTO flights VALUES (?, ?, ?, NULL)",
+                        (key, owner, now + self.lease),
+                    )
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        if row is None:
+            return True, None
+        return False, row[0]
+
+    def _renew(self, key: str, owner: str) -> None:
+        with self._lock:
+            self._connection.execute(
+                "UPDATE flights SET expires_at = ? WHERE key = ? AND owner = ?",
+                (time.time() + self.lease, key, owner),
+            )
+
+    def _finish(self, key: str, owner: str, result: Optional[str]) -> None:
+        with self._lock:
+            if result is None:
+                self._connection.execute(
+                    "DELETE FROM flights WHERE key = ? AND owner = ?", (key, owner)
+                )
+            else:
+                self._connection.execute(
+                    "UPDATE flights SET expires_at = ?, result = ? "
+                    "WHERE key = ? AND owner = ?",
+                    (time.time() + self.result_ttl, result, key, owner),
+                )
+
+    async def _keep_lease(self, key: str, owner: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            await asyncio.to_thread(self._renew, key, owner)
+
+    async def run(self, key: str, call: Callable[[], Awaitable[str]]) -> str:
+        owner = uuid.uuid4().hex
+        while True:
+            is_leader, result = await asyncio.to_thread(self._try_lead, key, owner)
+            if result is not None:
+                return result
+            if is_leader:
+                break
+            await asyncio.sleep(self.poll_interval)
+
+        lease_keeper = asyncio.create_task(self._keep_lease(key, owner))
+        result = None
+        try:
+            result = await call()
+        finally:
+            lease_keeper.cancel()
+            # releases the key on errors too, so waiting callers take over
+            await asyncio.shield(asyncio.to_thread(self._finish, key, owner, result))
+        return result
+
+
+def make_single_flight(
+    backend_name: str, path: Union[str, Path] = "single_flight.sqlite3"
+) -> Optional[SingleFlight]:
+    """Create a single flight.
+
+    Args:
+        backend_name (str): backend of the single flight, one of "memory" for the calls of the
+            current process, "sqlite" for the calls of all the processes using the same file,
+            or "none".
+        path (Union[str, Path], optional): SQLite database file. Defaults to "single_flight.sqlite3".
+
+    Returns:
+        Optional[SingleFlight]: single flight, None if disabled.
+    """
+    if backend_name == "none":
+        return None
+    if backend_name == "memory":
+        return InMemorySingleFlight()
+    if backend_name == "sqlite":
+        return SQLiteSingleFlight(path)
+
+    raise ValueError(f"Unknown single flight backend: {backend_name}")
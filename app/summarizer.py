@@ -1,75 +1,221 @@
-import os
+import asyncio
+import json
+import time
 from dataclasses import dataclass
-from enum import Enum
 from logging import INFO, getLogger
+from typing import Optional, Tuple, Union
 
-import openai
-import tiktoken
-
-from .display import print_to_console
-from .prompts import SummarizationPrompt, Summary
+from .cache import SummaryCache
+from .config import (
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_CALL_TIMEOUT,
+    LLM_MAX_PARSE_RETRIES,
+    LLM_MAX_RETRIES,
+    LLM_STREAMING,
+    MODEL_PRICES,
+)
+from .jsonstream import JSONArrayParser
+from .metrics import (
+    CACHE_HITS,
+    CACHE_MISSES,
+    LLM_CALL_SECONDS,
+    LLM_CALLS,
+    LLM_HEDGED_CALLS,
+    LLM_INPUT_TOKENS,
+    LLM_OUTPUT_TOKENS,
+    LLM_RETRIES,
+    LLM_UNNATURAL_STOPS,
+)
+from .prompts import SummarizationPrompt, Summary, SummaryParseError
+from .providers import AIModel, Completion, LLMProvider, get_provider
+from .ratelimit import RateLimiter
+from .retry import ahedge, aretry, retry
+from .tokens import get_encoder
 
 logger = getLogger(__name__)
 logger.setLevel(INFO)
 
+# tokens the chat format adds around a single user message and the reply
+CHAT_FORMAT_TOKENS = 8
 
-class AIModel(Enum):
-    gpt_3_5_turbo = "gpt-3.5-turbo"
-    gpt_3_5_turbo_16k = "gpt-3.5-turbo-16k"
-    gpt_4 = "gpt-4"
-    gpt_4_32k = "gpt-4-32k"
 
-    @staticmethod
-    def get_context_length(model: "AIModel", buffer_fraction: float = 1.00) -> int:
-        """Get the context length of the given model.
+class AITextSummarizer:
+    def __init__(
+        self,
+        model: Union[AIModel, str],
+        prompt: SummarizationPrompt,
+        rate_limiter: Optional[RateLimiter] = None,
+        cache: Optional[SummaryCache] = None,
+        timeout: float = LLM_CALL_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        max_parse_retries: int = LLM_MAX_PARSE_RETRIES,
+        provider: Optional[LLMProvider] = None,
+        streaming: bool = LLM_STREAMING,
+    ) -> None:
+        # any model of a registered provider, not only the OpenAI models of ``AIModel``
+        self.model_name = model.value if isinstance(model, AIModel) else model
+        self.provider = provider or get_provider(self.model_name)
+        self.tokenizer = get_encoder(self.model_name)
+        self.prompt = prompt
+        self._n_prompt_template_tokens: Optional[int] = None
+        self.rate_limiter = rate_limiter or self.provider.get_rate_limiter(
+            self.model_name
+        )
+        self.cache = cache
+        # timeout of a single attempt, retries on transient errors and re-asks on bad output
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.max_parse_retries = max_parse_retries
+        # parse JSON answers while they are generated and stop once they are complete
+        self.streaming = streaming
+
+    def _warn_if_not_natural_stop(self, completion: Completion) -> None:
+        """Raises a warning if the model did not come to a natural stop.
 
         Args:
-            model (AIModel): model to get the context length of.
-            buffer_fraction (float, optional): fraction of the context length to use as a buffer. Defaults to 1.0.
-                This is included to avoid exceeding context length accidentally.
+            completion (Completion): completion of the model.
+        """
+        finish_reason = completion.finish_reason
+        if finish_reason != "stop":
+            LLM_UNNATURAL_STOPS.labels(self.model_name, str(finish_reason)).inc()
+            logger.warning(
+                "Model did not come to a natural stop. Reason: %s",
+                finish_reason,
+                extra={"model": self.model_name, "finish_reason": finish_reason},
+            )
 
-        Returns:
-            int: context length of the given model.
+    def _record_call(
+        self, completion: Completion, duration: float, n_prompt_tokens: int
+    ) -> None:
+        """Export the number of calls, their duration and their token usage as metrics.
+
+        Args:
+            completion (Completion): completion of the model.
+            duration (float): duration of the call in seconds.
+            n_prompt_tokens (int): estimated number of prompt tokens, used if the
+                provider does not report its usage.
         """
+        LLM_CALLS.labels(self.model_name).inc()
+        LLM_CALL_SECONDS.labels(self.model_name).observe(duration)
 
-        model_to_context_length = {
-            AIModel.gpt_3_5_turbo: buffer_fraction * 4000,  # 4097
-            AIModel.gpt_3_5_turbo_16k: buffer_fraction * 16000,
-            AIModel.gpt_4: buffer_fraction * 1024,
-            AIModel.gpt_4_32k: buffer_fraction * 1024,
-        }
+        n_input_tokens = completion.n_input_tokens
+        if n_input_tokens is None:
+            n_input_tokens = n_prompt_tokens
+        n_output_tokens = completion.n_output_tokens
+        if n_output_tokens is None:
+            n_output_tokens = self.count_tokens(completion.content)
+        LLM_INPUT_TOKENS.labels(self.model_name).inc(n_input_tokens)
+        LLM_OUTPUT_TOKENS.labels(self.model_name).inc(n_output_tokens)
 
-        return int(model_to_context_length[model])
+    def _on_retry(self, reason: str) -> None:
+        LLM_RETRIES.labels(self.model_name, reason).inc()
 
+    def _complete(self, prompt: str, n_prompt_tokens: int, **kwargs) -> Completion:
+        """Call the model within its rate limits, retrying on rate limits and transient errors."""
 
-class AITextSummarizer:
-    def __init__(self, model: AIModel, prompt: SummarizationPrompt) -> None:
-        self.model = model
-        self.tokenizer = tiktoken.encoding_for_model(model_name=self.model.value)
-        self.prompt = prompt
+        def attempt():
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire_blocking(n_prompt_tokens)
+            start = time.perf_counter()
+            completion = self.provider.complete(
+                self.model_name, prompt, self.timeout, **kwargs
+            )
+            self._record_call(completion, time.perf_counter() - start, n_prompt_tokens)
+            return completion
 
-    def _warn_if_not_natural_stop(
-        self,
-        # openai_response can be a lot of options so hard to type for now
-        openai_response,
-    ) -> None:
-        """Raises a warning if the model did not come to a natural stop.
+        return retry(
+            attempt,
+            self.max_retries,
+            base_delay=LLM_BACKOFF_BASE,
+            max_delay=LLM_BACKOFF_MAX,
+            on_retry=self._on_retry,
+        )
 
-        Args:
-            openai_response: response from OpenAI API.
-        """
-        global_debug = os.environ.get("GLOBAL_DEBUG", False)
+    async def _acomplete(
+        self,
+        prompt: str,
+        n_prompt_tokens: int,
+        hedge_after: Optional[float] = None,
+        **kwargs,
+    ) -> Completion:
+        """Call the model within its rate limits, retrying and hedging the call."""
 
-        finish_reason = openai_response.choices[0].finish_reason
-        if finish_reason != "stop":
-            if global_debug:
-                print_to_console(
-                    "WARNING: Model did not come to a natural stop.", color="yellow"
+        async def attempt():
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire(n_prompt_tokens)
+            start = time.perf_counter()
+            n_output_items = self.prompt.get_n_output_items()
+            if self.streaming and n_output_items is not None:
+                completion = await self._astream(prompt, n_output_items, **kwargs)
+            else:
+                completion = await self.provider.acomplete(
+                    self.model_name, prompt, self.timeout, **kwargs
                 )
-            logger.warning(
-                f"WARNING: Model did not come to a natural stop. Reason: {finish_reason}"
+            self._record_call(completion, time.perf_counter() - start, n_prompt_tokens)
+            return completion
+
+        def call():
+            return aretry(
+                attempt,
+                self.max_retries,
+                base_delay=LLM_BACKOFF_BASE,
+                max_delay=LLM_BACKOFF_MAX,
+                on_retry=self._on_retry,
             )
 
+        return await ahedge(
+            call,
+            hedge_after,
+            on_hedge=LLM_HEDGED_CALLS.labels(self.model_name).inc,
+        )
+
+    async def _astream(self, prompt: str, n_output_items: int, **kwargs) -> Completion:
+        """Stream the JSON list answered by the model, stopping once it has all its items."""
+        parser = JSONArrayParser()
+        is_malformed = False
+
+        def on_delta(delta: str) -> bool:
+            nonlocal is_malformed
+            if is_malformed:
+                return False
+            try:
+                parser.feed(delta)
+            except ValueError:
+                # let the whole output be parsed and reported as usual
+                is_malformed = True
+                return False
+            return len(parser.items) >= n_output_items
+
+        completion = await self.provider.astream(
+            self.model_name, prompt, self.timeout, on_delta, **kwargs
+        )
+        if len(parser.items) >= n_output_items:
+            # the output may have been cut before its closing bracket
+            completion.content = json.dumps(parser.items[:n_output_items])
+        return completion
+
+    def _get_cached_summary(self, text: str) -> Optional[Summary]:
+        cached_summary = self.cache.get(text, self.model_name, self.prompt.cache_key())
+        if cached_summary is None:
+            CACHE_MISSES.labels("call").inc()
+        else:
+            CACHE_HITS.labels("call").inc()
+        return cached_summary
+
+    async def aget_cached_summary(self, text: str) -> Optional[Summary]:
+        """Get the cached summary of the given text without calling the API.
+
+        Args:
+            text (str): text to summarize.
+
+        Returns:
+            Optional[Summary]: cached summary, None if not cached or if the summarizer has no cache.
+        """
+        if self.cache is None:
+            return None
+        return await asyncio.to_thread(self._get_cached_summary, text)
+
     def count_tokens(self, text: str) -> int:
         """Count the number of tokens in the given text.
 
@@ -81,6 +227,35 @@ class AITextSummarizer:
         """
         return len(self.tokenizer.encode(text))
 
+    @property
+    def n_prompt_template_tokens(self) -> int:
+        """Number of tokens the prompt adds around the summarized text."""
+        if self._n_prompt_template_tokens is None:
+            self._n_prompt_template_tokens = self.count_tokens(self.prompt.make(""))
+        return self._n_prompt_template_tokens
+
+    @property
+    def max_text_tokens(self) -> int:
+        """Maximum number of tokens of text summarized by a single call.
+
+        The context window of the model holds the prompt template, the text and the output,
+        so the budget of the text is what remains after the template, the chat format and
+        the output reserved for the summary length of the prompt.
+        """
+        return (
+            self.provider.get_context_length(self.model_name)
+            - CHAT_FORMAT_TOKENS
+            - self.n_prompt_template_tokens
+            - self.prompt.estimate_output_tokens()
+        )
+
+    @property
+    def prices(self) -> Tuple[float, float]:
+        """Price of 1000 input tokens and of 1000 output tokens in USD, see ``MODEL_PRICES``."""
+        return MODEL_PRICES.get(self.model_name) or self.provider.get_prices(
+            self.model_name
+        )
+
     def estimate_cost(
         self, text: str, type: str = "input", precision: int = 2
     ) -> float:
@@ -95,14 +270,28 @@ class AITextSummarizer:
         Returns:
             float: cost of generating a summary of the given text.
         """
-        cost_per_input_token = 0.001
-        cost_per_output_token = 0.002
-        cost_per_token = (
-            cost_per_input_token if type == "input" else cost_per_output_token
+        return self.estimate_cost_of_tokens(
+            self.count_tokens(text), type=type, precision=precision
         )
 
-        n_tokens = self.count_tokens(text)
-        return round(cost_per_token * n_tokens, precision)
+    def estimate_cost_of_tokens(
+        self, n_tokens: int, type: str = "input", precision: int = 2
+    ) -> float:
+        """Estimate the cost of the given number of tokens.
+
+        Args:
+            n_tokens (int): number of tokens.
+            type (str, optional): type of the tokens. Defaults to "input".
+                Can be one of "input" or "output".
+            precision (int, optional): number of decimal places to round to. Defaults to 2.
+
+        Returns:
+            float: cost of the tokens.
+        """
+        input_price, output_price = self.prices
+        price_per_1k_tokens = input_price if type == "input" else output_price
+
+        return round(price_per_1k_tokens * n_tokens / 1000, precision)
 
     def summarize(self, text: str, **kwargs) -> Summary:
         """Create a summary of the given text.
@@ -113,16 +302,101 @@ class AITextSummarizer:
         Returns:
             Summary: summary of the text.
         """
+        if self.cache is not None:
+            cached_summary = self._get_cached_summary(text)
+            if cached_summary is not None:
+                return cached_summary
+
         prompt = self.prompt.make(text)
-        openai_response = openai.ChatCompletion.create(
-            model=self.model.value,
-            messages=[{"role": "user", "content": prompt}],
-            **kwargs,
-        )
+        n_prompt_tokens = self.count_tokens(text) + self.n_prompt_template_tokens
+
+        # only this text is asked again when the output can not be parsed
+        for attempt in range(self.max_parse_retries + 1):
+            completion = self._complete(prompt, n_prompt_tokens, **kwargs)
+
+            # check reason for stopping and warn if not natural stop
+            # TODO: may be worth raising an exception here instead to communicate the error to the user
+            self._warn_if_not_natural_stop(completion)
 
-        # check reason for stopping and warn if not natural stop
-        # TODO: may be worth raising an exception here instead to communicate the error to the user
-        self._warn_if_not_natural_stop(openai_response)
+            try:
+                summary = self.prompt.extract_summary(completion.content)
+                break
+            except SummaryParseError as e:
+                if attempt == self.max_parse_retries:
+                    raise
+                self._on_retry("parse")
+                logger.warning(
+                    "Could not parse model output, asking again: %s",
+                    e,
+                    extra={"model": self.model_name, "attempt": attempt},
+                )
+
+        if self.cache is not None:
+            self.cache.set(text, self.model_name, self.prompt.cache_key(), summary)
+
+        return summary
+
+    async def asummarize(
+        self,
+        text: str,
+        n_text_tokens: Optional[int] = None,
+        hedge_after: Optional[float] = None,
+        read_cache: bool = True,
+        **kwargs,
+    ) -> Summary:
+        """Create a summary of the given text without blocking the event loop.
+
+        The call waits for the model's rate limiter before reaching the API.
+        Cached summaries are returned without calling the API at all.
+        Attempts time out after ``timeout`` seconds and are retried with exponential backoff
+        on rate limits and server errors. Output that can not be parsed is asked for again.
+
+        Args:
+            text (str): text to summarize.
+            n_text_tokens (Optional[int], optional): number of tokens in the text, if already known.
+                Defaults to None, in which case the text is tokenized.
+            hedge_after (Optional[float], optional): seconds after which a duplicate request is sent
+                if the model has not answered yet, the first answer wins. Defaults to None, never.
+            read_cache (bool, optional): look up the cache first, pass False when it was just
+                looked up with ``aget_cached_summary``. The summary is cached either way.
+                Defaults to True.
+
+        Returns:
+            Summary: summary of the text.
+        """
+        if read_cache:
+            cached_summary = await self.aget_cached_summary(text)
+            if cached_summary is not None:
+                return cached_summary
+
+        if n_text_tokens is None:
+            n_text_tokens = await asyncio.to_thread(self.count_tokens, text)
+        n_prompt_tokens = n_text_tokens + self.n_prompt_template_tokens
+        prompt = self.prompt.make(text)
+
+        # only this text is asked again when the output can not be parsed
+        for attempt in range(self.max_parse_retries + 1):
+            completion = await self._acomplete(
+                prompt, n_prompt_tokens, hedge_after=hedge_after, **kwargs
+            )
+            self._warn_if_not_natural_stop(completion)
+
+            try:
+                summary = self.prompt.extract_summary(completion.content)
+                break
+            except SummaryParseError as e:
+                if attempt == self.max_parse_retries:
+                    raise
+                self._on_retry("parse")
+                logger.warning(
+                    "Could not parse model output, asking again: %s",
+                    e,
+                    extra={"model": self.model_name, "attempt": attempt},
+                )
+
+        if self.cache is not None:
+            await asyncio.to_thread(
+                self.cache.set, text, self.model_name, self.prompt.cache_key(), summary
+            )
 
-        content = openai_response.choices[0].message.content
-        return self.prompt.extract_summary(content)
+        return summary
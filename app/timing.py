@@ -0,0 +1,60 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+
+from .metrics import STAGE_SECONDS
+
+# seconds spent in each stage of the current summarization, shared with its child tasks
+_stage_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar(
+    "stage_timings", default=None
+)
+_timing_start: ContextVar[Optional[float]] = ContextVar("timing_start", default=None)
+
+
+def get_timings() -> Optional[Dict[str, float]]:
+    """Get the stage timings recorded so far in the current context.
+
+    Returns:
+        Optional[Dict[str, float]]: copy of the seconds spent in each stage, with the
+            seconds elapsed since ``start_timing`` under "total". None if not recording.
+    """
+    timings = _stage_timings.get()
+    if timings is None:
+        return None
+    return {**timings, "total": time.perf_counter() - _timing_start.get()}
+
+
+def start_timing() -> Dict[str, float]:
+    """Start recording stage timings in the current context.
+
+    Tasks and threads started from the current context afterwards record into the same
+    dictionary, so a whole summarization is covered.
+
+    Returns:
+        Dict[str, float]: seconds spent in each stage, filled in as stages complete.
+    """
+    timings: Dict[str, float] = {}
+    _stage_timings.set(timings)
+    _timing_start.set(time.perf_counter())
+    return timings
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Add the time spent in the block to ``stage``, if timings are being recorded.
+
+    The time is also exported as the ``brevity_stage_seconds`` metric.
+
+    Args:
+        stage (str): name of the stage, e.g. "download".
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage).observe(elapsed)
+        timings = _stage_timings.get()
+        if timings is not None:
+            timings[stage] = timings.get(stage, 0.0) + elapsed
@@ -0,0 +1,237 @@
+import difflib
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+import tiktoken
+
+from .chunking import Boundary, find_boundaries, pack_chunks
+from .providers import get_provider
+
+# tokens on each side of a boundary that its key is computed from, see ``boundary_key``
+BOUNDARY_KEY_TOKENS = 8
+
+
+@lru_cache(maxsize=None)
+def get_encoder(model_name: str) -> tiktoken.Encoding:
+    """Get the tokenizer of the given model, shared by the whole process.
+
+    Args:
+        model_name (str): name of the model, e.g. "gpt-3.5-turbo".
+
+    Returns:
+        tiktoken.Encoding: tokenizer of the model, as given by its provider.
+    """
+    return get_provider(model_name).get_tokenizer(model_name)
+
+
+class TokenizedDocument:
+    """Text encoded once with a model's tokenizer.
+
+    Token counts and chunks are derived from the stored tokens, so a document is never
+    re-encoded while it is being chunked, checked against the context length or priced.
+    Chunks are cut at headings, paragraphs and sentences where possible, see ``pack_chunks``.
+    Text can be appended piece by piece, e.g. page by page while a file is still being parsed.
+
+    Attributes:
+        text: original text of the document.
+        model_name: name of the model whose tokenizer encoded the text.
+        tokens: tokens of the text.
+    """
+
+    def __init__(self, text: str, model_name: str) -> None:
+        """Create a new TokenizedDocument instance, encoding the text.
+
+        Args:
+            text (str): text of the document.
+            model_name (str): name of the model whose tokenizer is used.
+        """
+        self.model_name = model_name
+        self.tokenizer = get_encoder(model_name)
+        self.tokens: List[int] = []
+        self._parts: List[str] = []
+        self._text: Optional[str] = None
+        # character and token offsets of each appended piece of text, e.g. of each page
+        self._page_starts: List[int] = []
+        self._page_token_starts: List[int] = []
+        self._n_chars = 0
+        self._boundaries: Optional[List[Tuple[int, Boundary]]] = None
+        self.append(text)
+
+    def append(self, text: str, tokens: Optional[List[int]] = None) -> None:
+        """Encode ``text`` and append it to the end of the document.
+
+        Args:
+            text (str): text to append.
+            tokens (Optional[List[int]], optional): tokens of the text, if already known.
+                Defaults to None, in which case the text is encoded.
+        """
+        self._parts.append(text)
+        self._text = None
+        self._page_starts.append(self._n_chars)
+        self._page_token_starts.append(len(self.tokens))
+        self._n_chars += len(text)
+        self._boundaries = None
+        self.tokens.extend(self.tokenizer.encode(text) if tokens is None else tokens)
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = "".join(self._parts)
+            self._parts = [self._text]
+        return self._text
+
+    @property
+    def pages(self) -> List[str]:
+        """Pieces of text in the order they were appended, e.g. the pages of a file."""
+        text = self.text
+        ends = self._page_starts[1:] + [len(text)]
+        return [text[start:end] for start, end in zip(self._page_starts, ends)]
+
+    def _reuse_tokens(
+        self, page: str, tokens: List[int], filtered_page: str
+    ) -> List[int]:
+        """Tokens of a filtered page, reusing the tokens of the lines it kept from the page."""
+        if filtered_page == page:
+            return tokens
+
+        _, token_starts = self.tokenizer.decode_with_offsets(tokens)
+        token_starts = list(token_starts) + [len(page)]
+        lines = page.splitlines(keepends=True)
+        line_starts = [0]
+        for line in lines:
+            line_starts.append(line_starts[-1] + len(line))
+        filtered_lines = filtered_page.splitlines(keepends=True)
+
+        filtered_tokens: List[int] = []
+        # text between the reused runs of tokens, encoded in one piece
+        unmatched: List[str] = []
+
+        def encode_unmatched() -> None:
+            filtered_tokens.extend(self.tokenizer.encode("".join(unmatched)))
+            unmatched.clear()
+
+        matcher = difflib.SequenceMatcher(None, lines, filtered_lines, autojunk=False)
+        for tag, start, end, filtered_start, filtered_end in matcher.get_opcodes():
+            if tag == "equal":
+                start_char, end_char = line_starts[start], line_starts[end]
+                # tokens within the kept lines, the ones straddling a cut are encoded again
+                first = bisect_left(token_starts, start_char)
+                last = bisect_right(token_starts, end_char) - 1
+                if first < last:
+                    unmatched.append(page[start_char : token_starts[first]])
+                    encode_unmatched()
+                    filtered_tokens.extend(tokens[first:last])
+                    unmatched.append(page[token_starts[last] : end_char])
+                else:
+                    unmatched.append(page[start_char:end_char])
+            elif tag in ("replace", "insert"):
+                unmatched.append("".join(filtered_lines[filtered_start:filtered_end]))
+        encode_unmatched()
+
+        # tokens of multi-byte characters do not always start at a character
+        if self.tokenizer.decode(filtered_tokens) != filtered_page:
+            return self.tokenizer.encode(filtered_page)
+        return filtered_tokens
+
+    def filter_pages(self, filtered_pages: Sequence[str]) -> "TokenizedDocument":
+        """Create the document of filtered pages, e.g. by ``filtering.filter_pages``.
+
+        The filtered pages are the first pages of the document with some of their lines or
+        paragraphs removed. The tokens of the kept lines are reused, only the text around
+        the removed ones is encoded again. Tokens at a cut may differ from those of the
+        filtered text encoded from scratch, the text they decode to does not.
+
+        Args:
+            filtered_pages (Sequence[str]): filtered text of each page.
+
+        Returns:
+            TokenizedDocument: document of the filtered pages.
+        """
+        page_token_ends = self._page_token_starts[1:] + [self.n_tokens]
+        document = TokenizedDocument("", self.model_name)
+        for page, token_start, token_end, filtered_page in zip(
+            self.pages, self._page_token_starts, page_token_ends, filtered_pages
+        ):
+            document.append(
+                filtered_page,
+                self._reuse_tokens(
+                    page, self.tokens[token_start:token_end], filtered_page
+                ),
+            )
+        return document
+
+    @property
+    def n_tokens(self) -> int:
+        return len(self.tokens)
+
+    @property
+    def boundaries(self) -> List[Tuple[int, Boundary]]:
+        """Headings, paragraphs, sentences and words of the document, see ``find_boundaries``."""
+        if self._boundaries is None:
+            text, token_offsets = self.tokenizer.decode_with_offsets(self.tokens)
+            self._boundaries = find_boundaries(text, token_offsets)
+        return self._boundaries
+
+    def boundary_key(self, token_index: int) -> int:
+        """Hash of the tokens around the boundary before ``token_index``.
+
+        Args:
+            token_index (int): index of the token following the boundary.
+
+        Returns:
+            int: key of the boundary, the same wherever the surrounding text is in the document.
+        """
+        window = self.tokens[
+            max(0, token_index - BOUNDARY_KEY_TOKENS) : token_index
+            + BOUNDARY_KEY_TOKENS
+        ]
+        return zlib.crc32(array("q", window).tobytes())
+
+    def chunk_slices(
+        self, max_tokens_per_chunk: int, overlap_tokens: int = 0, stable: bool = False
+    ) -> List[Tuple[int, int]]:
+        """Split the tokens into slices of at most ``max_tokens_per_chunk``.
+
+        Args:
+            max_tokens_per_chunk (int): maximum number of tokens in a slice.
+            overlap_tokens (int, optional): number of tokens a slice repeats from the previous one.
+                Defaults to 0.
+            stable (bool, optional): end slices at boundaries chosen by content, so that an edit
+                only changes the slices around it. Slices are somewhat shorter on average.
+                Defaults to False.
+
+        Returns:
+            List[Tuple[int, int]]: start (inclusive) and end (exclusive) token index of each slice.
+        """
+        return pack_chunks(
+            self.n_tokens,
+            self.boundaries,
+            max_tokens_per_chunk,
+            overlap_tokens,
+            boundary_key=self.boundary_key if stable else None,
+        )
+
+    def chunks(
+        self, max_tokens_per_chunk: int, overlap_tokens: int = 0, stable: bool = False
+    ) -> List[str]:
+        """Split the document into chunks of at most ``max_tokens_per_chunk`` tokens.
+
+        Args:
+            max_tokens_per_chunk (int): maximum number of tokens in a chunk.
+            overlap_tokens (int, optional): number of tokens a chunk repeats from the previous one.
+                Defaults to 0.
+            stable (bool, optional): end chunks at boundaries chosen by content, see ``chunk_slices``.
+                Defaults to False.
+
+        Returns:
+            List[str]: decoded text of each chunk.
+        """
+        return [
+            self.tokenizer.decode(self.tokens[start:end])
+            for start, end in self.chunk_slices(
+                max_tokens_per_chunk, overlap_tokens, stable
+            )
+        ]
@@ -0,0 +1,184 @@
+import asyncio
+from typing import List
+
+import networkx as nx
+import numpy as np
+import openai
+
+from .config import (
+    EMBEDDING_API_BASE,
+    EMBEDDING_BATCH_SIZE,
+    EMBEDDING_MODEL,
+    LLM_BACKOFF_BASE,
+    LLM_BACKOFF_MAX,
+    LLM_CALL_TIMEOUT,
+    LLM_MAX_RETRIES,
+)
+from .retry import aretry
+
+
+async def aembed(
+    texts: List[str],
+    model_name: str = EMBEDDING_MODEL,
+    api_base: str = EMBEDDING_API_BASE,
+    batch_size: int = EMBEDDING_BATCH_SIZE,
+) -> np.ndarray:
+    """Embed texts with an OpenAI-compatible embeddings endpoint, e.g. a local llama.cpp server.
+
+    Args:
+        texts (List[str]): texts to embed.
+        model_name (str, optional): name of the embedding model. Defaults to ``EMBEDDING_MODEL``.
+        api_base (str, optional): base URL of the server. Defaults to ``EMBEDDING_API_BASE``.
+        batch_size (int, optional): number of texts embedded by a single request.
+            Defaults to ``EMBEDDING_BATCH_SIZE``.
+
+    Returns:
+        np.ndarray: one embedding per row, in the order of the texts.
+    """
+
+    async def embed_batch(batch: List[str]) -> List[List[float]]:
+        response = await aretry(
+            lambda: asyncio.wait_for(
+                openai.Embedding.acreate(
+                    input=batch,
+                    model=model_name,
+                    # local servers ignore the key, the client requires one
+                    api_key="local",
+                    api_base=api_base,
+                ),
+                timeout=LLM_CALL_TIMEOUT,
+            ),
+            max_retries=LLM_MAX_RETRIES,
+            base_delay=LLM_BACKOFF_BASE,
+            max_delay=LLM_BACKOFF_MAX,
+        )
+        data = sorted(response["data"], key=lambda item: item["index"])
+        return [item["embedding"] for item in data]
+
+    batches = await asyncio.gather(
+        *(
+            embed_batch(texts[start : start + batch_size])
+            for start in range(0, len(texts), batch_size)
+        )
+    )
+    return np.array(
+        [embedding for batch in batches for embedding in batch], dtype=np.float32
+    )
+
+
+def similarity_graph(
+    embeddings: np.ndarray, n_neighbors: int, block_size: int = 1024
+) -> nx.Graph:
+    """Link each embedding to its ``n_neighbors`` most similar ones by cosine similarity.
+
+    Similarities are computed a block of rows at a time, so memory stays bounded by
+    ``block_size`` rows of the similarity matrix. Only positive similarities make edges.
+
+    Args:
+        embeddings (np.ndarray): one embedding per row.
+        n_neighbors (int): number of edges of each node, at most.
+        block_size (int, optional): number of rows compared at once. Defaults to 1024.
+
+    Returns:
+        nx.Graph: graph with a node per row and similarities as "weight" of the edges.
+    """
+    n_nodes = len(embeddings)
+    graph = nx.Graph()
+    graph.add_nodes_from(range(n_nodes))
+    n_neighbors = min(n_neighbors, n_nodes - 1)
+    if n_neighbors <= 0:
+        return graph
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit_embeddings = embeddings / np.maximum(norms, 1e-12)
+    for start in range(0, n_nodes, block_size):
+        similarities = unit_embeddings[start : start + block_size] @ unit_embeddings.T
+        rows = np.arange(len(similarities))
+        # a node is not its own neighbor
+        similarities[rows, rows + start] = -np.inf
+
+        neighbors = np.argpartition(-similarities, n_neighbors - 1, axis=1)[
+            :, :n_neighbors
+        ]
+        weights = np.take_along_axis(similarities, neighbors, axis=1).ravel()
+        sources = np.repeat(rows + start, n_neighbors)
+        targets = neighbors.ravel()
+        is_similar = weights > 0
+        graph.add_weighted_edges_from(
+            zip(
+                sources[is_similar].tolist(),
+                targets[is_similar].tolist(),
+                weights[is_similar].tolist(),
+            )
+        )
+    return graph
+
+
+def find_topics(
+    embeddings: np.ndarray, n_neighbors: int, resolution: float = 1.0, seed: int = 0
+) -> List[List[int]]:
+    """Group embeddings into topics with Louvain community detection on their similarity graph.
+
+    Args:
+        embeddings (np.ndarray): one embedding per row, e.g. of each passage of a document.
+        n_neighbors (int): number of neighbors of each embedding in the graph.
+        resolution (float, optional): higher values give more and smaller topics. Defaults to 1.0.
+        seed (int, optional): seed of the detection, so a document always gets the same topics.
+            Defaults to 0.
+
+    Returns:
+        List[List[int]]: indices of the rows of each topic in increasing order, topics ordered
+            by their first row.
+    """
+    graph = similarity_graph(embeddings, n_neighbors)
+    communities = nx.community.louvain_communities(
+        graph, weight="weight", resolution=resolution, seed=seed
+    )
+    return sorted(sorted(community) for community in communities)
+
+
+def pack_topics(
+    topics: List[List[int]],
+    n_passage_tokens: List[int],
+    max_tokens_per_chunk: int,
+    n_separator_tokens: int = 0,
+) -> List[List[int]]:
+    """Pack the passages of each topic into chunks of at most ``max_tokens_per_chunk`` tokens.
+
+    A topic is only split across chunks when it does not fit a chunk on its own. Small topics
+    share a chunk, so the number of chunks stays close to that of consecutive slicing.
+
+    Args:
+        topics (List[List[int]]): indices of the passages of each topic, see ``find_topics``.
+        n_passage_tokens (List[int]): number of tokens of each passage.
+        max_tokens_per_chunk (int): maximum number of tokens in a chunk.
+        n_separator_tokens (int, optional): number of tokens between two passages of a chunk.
+            Defaults to 0.
+
+    Returns:
+        List[List[int]]: indices of the passages of each chunk.
+    """
+    chunks: List[List[int]] = []
+    chunk: List[int] = []
+    n_chunk_tokens = 0
+    for topic in topics:
+        n_topic_tokens = sum(
+            n_passage_tokens[passage_index] + n_separator_tokens
+            for passage_index in topic
+        )
+        # start a new chunk rather than splitting a topic that fits one
+        if chunk and n_chunk_tokens + n_topic_tokens > max_tokens_per_chunk:
+            chunks.append(chunk)
+            chunk, n_chunk_tokens = [], 0
+
+        for passage_index in topic:
+            n_tokens = n_passage_tokens[passage_index] + n_separator_tokens
+            if chunk and n_chunk_tokens + n_tokens > max_tokens_per_chunk:
+                chunks.append(chunk)
+                chunk, n_chunk_tokens = [], 0
+            chunk.append(passage_index)
+            n_chunk_tokens += n_tokens
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
@@ -0,0 +1,62 @@
+"""Synthetic documents of increasing size with headings, paragraphs and sentences."""
+
+import random
+from pathlib import Path
+from typing import Dict, List, Union
+
+_VOCABULARY = (
+    "model data method result analysis system performance network training "
+    "learning evaluation baseline dataset accuracy latency throughput memory "
+    "parameter gradient attention layer token sequence context summary document "
+    "experiment benchmark architecture optimization inference retrieval language"
+).split()
+
+
+def make_document(n_words: int, seed: int = 0) -> str:
+    """Make a synthetic document of roughly ``n_words`` words.
+
+    Args:
+        n_words (int): number of words of the document.
+        seed (int, optional): seed of the random generator. Defaults to 0.
+
+    Returns:
+        str: text of the document.
+    """
+    rng = random.Random(seed)
+    lines: List[str] = []
+    n_written = 0
+    section_index = 0
+    while n_written < n_words:
+        section_index += 1
+        lines.append(f"{section_index}. Section {section_index}")
+        for _ in range(rng.randint(3, 8)):
+            sentences = []
+            for _ in range(rng.randint(3, 7)):
+                words = rng.choices(_VOCABULARY, k=rng.randint(8, 24))
+                sentences.append(" ".join(words).capitalize() + ".")
+                n_written += len(words)
+            lines.append(" ".join(sentences))
+            lines.append("")
+    return "\n".join(lines)
+
+
+def write_corpus(
+    directory: Union[str, Path], sizes: List[int], seed: int = 0
+) -> Dict[int, str]:
+    """Write one plain-text document per size to ``directory``.
+
+    Args:
+        directory (Union[str, Path]): directory to write the documents to.
+        sizes (List[int]): number of words of each document.
+        seed (int, optional): seed of the random generator. Defaults to 0.
+
+    Returns:
+        Dict[int, str]: file name of the document of each size.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    names = {}
+    for size in sizes:
+        names[size] = f"doc-{size}.txt"
+        (directory / names[size]).write_text(make_document(size, seed=seed + size))
+    return names
@@ -0,0 +1,165 @@
+"""OpenAI-compatible chat completion server returning canned Chain-of-Density answers.
+
+Point the ``openai`` client at it with ``openai.api_base = server.api_base`` to run the
+pipeline without network access or API costs.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+
+class FakeLLMServer:
+    """Fake LLM served from a background thread.
+
+    Every request sleeps ``latency`` seconds plus ``latency_per_token`` seconds per generated
+    token, scaled by a random factor in ``[1 - jitter, 1 + jitter]``, then answers with a
+    valid Chain-of-Density JSON list. Streamed requests get the answer as Server-Sent Events,
+    generated at ``latency_per_token`` seconds per token after the base latency.
+
+    Attributes:
+        latency: base latency of a request in seconds.
+        latency_per_token: additional latency per generated token in seconds.
+        jitter: relative spread of the latency.
+        n_summary_words: number of words of each generated summary.
+        n_requests: number of requests served so far.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.5,
+        latency_per_token: float = 0.0,
+        jitter: float = 0.2,
+        n_summary_words: int = 80,
+        address: Tuple[str, int] = ("127.0.0.1", 0),
+    ) -> None:
+        self.latency = latency
+        self.latency_per_token = latency_per_token
+        self.jitter = jitter
+        self.n_summary_words = n_summary_words
+        self.n_requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(address, self._make_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def api_base(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeLLMServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def make_completion(self) -> Tuple[str, int]:
+        """Make the content of a completion and its approximate number of tokens."""
+        with self._lock:
+            self.n_requests += 1
+            request_index = self.n_requests
+
+        words = " ".join(f"entity{i}" for i in range(self.n_summary_words))
+        rounds = [
+            {
+                "Missing_Entities": f"entity{round_index}",
+                "Denser_Summary": f"Summary {request_index}.{round_index}: {words}",
+                "Title": f"Title {request_index}",
+            }
+            for round_index in range(5)
+        ]
+        content = json.dumps(rounds)
+        # roughly 4 characters per token
+        return content, len(content) // 4
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                request = json.loads(body or b"{}")
+                prompt = "".join(
+                    message.get("content", "")
+                    for message in request.get("messages", [])
+                )
+
+                content, n_completion_tokens = server.make_completion()
+                scale = random.uniform(1 - server.jitter, 1 + server.jitter)
+                if request.get("stream"):
+                    self._stream(request, content, scale)
+                    return
+
+                latency = (
+                    server.latency + server.latency_per_token * n_completion_tokens
+                )
+                time.sleep(max(0.0, latency * scale))
+
+                response = json.dumps(
+                    {
+                        "id": f"chatcmpl-fake-{server.n_requests}",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request.get("model", "fake"),
+                        "choices": [
+                            {
+                                "index": 0,
+                                "message": {"role": "assistant", "content": content},
+                                "finish_reason": "stop",
+                            }
+                        ],
+                        "usage": {
+                            "prompt_tokens": len(prompt) // 4,
+                            "completion_tokens": n_completion_tokens,
+                            "total_tokens": len(prompt) // 4 + n_completion_tokens,
+                        },
+                    }
+                ).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def _stream(self, request: dict, content: str, scale: float) -> None:
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                time.sleep(max(0.0, server.latency * scale))
+
+                # about 4 tokens per event
+                deltas = [content[i : i + 16] for i in range(0, len(content), 16)]
+                try:
+                    for index, delta in enumerate(deltas):
+                        time.sleep(max(0.0, server.latency_per_token * 4 * scale))
+                        is_last = index == len(deltas) - 1
+                        chunk = {
+                            "id": f"chatcmpl-fake-{server.n_requests}",
+                            "object": "chat.completion.chunk",
+                            "created": int(time.time()),
+                            "model": request.get("model", "fake"),
+                            "choices": [
+                                {
+                                    "index": 0,
+                                    "delta": {"content": delta},
+                                    "finish_reason": "stop" if is_last else None,
+                                }
+                            ],
+                        }
+                        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                        self.wfile.flush()
+                    self.wfile.write(b"data: [DONE]\n\n")
+                except (BrokenPipeError, ConnectionResetError):
+                    # the client stopped reading, i.e. cut the generation short
+                    pass
+
+            def log_message(self, *args) -> None:
+                pass
+
+        return Handler
@@ -0,0 +1,170 @@
+"""Offline benchmark of the summarization pipeline.
+
+Serves a synthetic corpus from a local file server, answers model calls with a fake LLM
+and reports latency percentiles, throughput and the time spent in each stage:
+
+    python -m benchmarks.run --sizes 2000 20000 100000 --requests 8 --concurrency 4
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from typing import Dict, List
+
+from .corpus import write_corpus
+from .fake_llm import FakeLLMServer
+from .file_server import FileServer
+
+STAGES = ["download", "extraction", "tokenization", "chunking", "map", "reduce"]
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_size(
+    url: str, model_name: str, n_requests: int, concurrency: int, summary_mode: str
+) -> Dict[str, object]:
+    # imported here so that the environment set up in ``main`` applies to the app
+    from app.pipeline import summarize_file
+    from app.schema import SummaryParameters
+    from app.timing import start_timing
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    stage_timings: List[Dict[str, float]] = []
+
+    async def run_request() -> None:
+        async with semaphore:
+            timings = start_timing()
+            start = time.perf_counter()
+            await summarize_file(
+                SummaryParameters(
+                    url=url, model_name=model_name, summary_mode=summary_mode
+                )
+            )
+            latencies.append(time.perf_counter() - start)
+            stage_timings.append(timings)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_request() for _ in range(n_requests)))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "p50": percentile(latencies, 0.50),
+        "p90": percentile(latencies, 0.90),
+        "p99": percentile(latencies, 0.99),
+        "throughput": n_requests / elapsed,
+        "stages": {
+            stage: statistics.mean(timings.get(stage, 0.0) for timings in stage_timings)
+            for stage in STAGES
+        },
+    }
+
+
+async def run_sizes(
+    urls: Dict[int, str],
+    model_name: str,
+    n_requests: int,
+    concurrency: int,
+    summary_mode: str,
+) -> Dict[int, Dict[str, object]]:
+    from app.http_client import close_http_client
+
+    try:
+        return {
+            size: await run_size(url, model_name, n_requests, concurrency, summary_mode)
+            for size, url in urls.items()
+        }
+    finally:
+        await close_http_client()
+
+
+def print_report(results: Dict[int, Dict[str, object]]) -> None:
+    header = ["words", "p50 s", "p90 s", "p99 s", "docs/s"] + [
+        f"{stage} s" for stage in STAGES
+    ]
+    print(" | ".join(f"{column:>12}" for column in header))
+    for size, result in results.items():
+        row = [f"{size:>12}"]
+        row += [f"{result[key]:>12.3f}" for key in ("p50", "p90", "p99", "throughput")]
+        row += [f"{result['stages'][stage]:>12.3f}" for stage in STAGES]
+        print(" | ".join(row))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000, 100000])
+    parser.add_argument("--requests", type=int, default=8, help="requests per size")
+    parser.add_argument("--concurrency", type=int, default=4, help="requests in flight")
+    parser.add_argument("--model", default="gpt-3.5-turbo-16k")
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-latency-per-token", type=float, default=0.0)
+    parser.add_argument("--llm-jitter", type=float, default=0.2)
+    parser.add_argument(
+        "--summary-mode",
+        choices=["dense", "fast", "final"],
+        default="dense",
+        help="densification rounds asked of the model",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        action="store_true",
+        help="keep the account rate limits of the model, off by default",
+    )
+    args = parser.parse_args()
+
+    # every request must download, extract and reach the fake model on its own: no summary
+    # cache, no stored artifacts and no merging of identical requests in flight
+    os.environ["SUMMARY_CACHE"] = "none"
+    os.environ["ARTIFACT_STORE"] = "none"
+    os.environ["SINGLE_FLIGHT"] = "none"
+    os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+    import openai
+
+    from app import providers
+    from app.file.extract import shutdown_extraction_pool
+    from app.ratelimit import RateLimiter
+
+    llm = FakeLLMServer(
+        latency=args.llm_latency,
+        latency_per_token=args.llm_latency_per_token,
+        jitter=args.llm_jitter,
+    ).start()
+    openai.api_base = llm.api_base
+    openai.api_key = os.environ["OPENAI_API_KEY"]
+
+    if not args.rate_limit:
+        providers._rate_limiters[args.model] = RateLimiter(10**9, 10**12)
+
+    with tempfile.TemporaryDirectory() as directory:
+        names = write_corpus(directory, args.sizes)
+        files = FileServer(directory).start()
+        try:
+            # a single event loop, the rate limiters of the app are bound to it
+            results = asyncio.run(
+                run_sizes(
+                    {size: files.url(name) for size, name in names.items()},
+                    args.model,
+                    args.requests,
+                    args.concurrency,
+                    args.summary_mode,
+                )
+            )
+        finally:
+            files.stop()
+            llm.stop()
+            shutdown_extraction_pool()
+
+    print(f"\n{llm.n_requests} model calls")
+    print_report(results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+import os
+
+import tiktoken
+
+# the app reads its API key on import, tests never call the OpenAI API
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# byte-level encoding built in-process, tiktoken would download the encodings of the models
+_ENCODING = tiktoken.Encoding(
+    name="test",
+    pat_str=r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""",
+    mergeable_ranks={bytes([i]): i for i in range(256)},
+    special_tokens={},
+)
+tiktoken.encoding_for_model = lambda model_name: _ENCODING
+tiktoken.get_encoding = lambda encoding_name: _ENCODING
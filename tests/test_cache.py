@@ -0,0 +1,66 @@
+import pytest
+
+from app import cache
+from app.cache import LRUCacheBackend, SQLiteCacheBackend, SummaryCache
+from app.prompts import Summary
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    return now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_backend(request, tmp_path):
+    def make_backend(max_size=None, ttl=None):
+        if request.param == "memory":
+            return LRUCacheBackend(max_size=max_size or 1024, ttl=ttl)
+        return SQLiteCacheBackend(tmp_path / "cache", ttl=ttl, max_size=max_size)
+
+    return make_backend
+
+
+def test_entries_expire_after_their_ttl(make_backend, clock):
+    backend = make_backend(ttl=10)
+    backend.set("key", "value")
+
+    clock[0] += 9
+    assert backend.get("key") == "value"
+
+    clock[0] += 2
+    assert backend.get("key") is None
+
+
+def test_entries_never_expire_without_ttl(make_backend, clock):
+    backend = make_backend()
+    backend.set("key", "value")
+
+    clock[0] += 10**9
+    assert backend.get("key") == "value"
+
+
+def test_lru_backend_evicts_the_least_recently_used_entry(clock):
+    backend = LRUCacheBackend(max_size=2)
+    backend.set("a", "1")
+    backend.set("b", "2")
+    backend.get("a")
+
+    backend.set("c", "3")
+
+    assert backend.get("a") == "1"
+    assert backend.get("b") is None
+    assert backend.get("c") == "3"
+
+
+def test_summary_cache_is_keyed_on_text_model_and_prompt():
+    summary_cache = SummaryCache(LRUCacheBackend())
+    summary = Summary(title="Title", content="Summary.")
+
+    summary_cache.set("text", "gpt-3.5-turbo", "prompt", summary)
+
+    assert summary_cache.get("text", "gpt-3.5-turbo", "prompt") == summary
+    assert summary_cache.get("other text", "gpt-3.5-turbo", "prompt") is None
+    assert summary_cache.get("text", "gpt-4", "prompt") is None
+    assert summary_cache.get("text", "gpt-3.5-turbo", "other prompt") is None
@@ -0,0 +1,118 @@
+import random
+
+import pytest
+
+from app.chunking import Boundary, find_boundaries, pack_chunks
+from app.tokens import TokenizedDocument
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+
+
+def make_text(seed: int, n_sections: int = 6) -> str:
+    rng = random.Random(seed)
+    sections = []
+    for section_index in range(n_sections):
+        paragraphs = [
+            " ".join(
+                " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 15))) + "."
+                for _ in range(rng.randint(1, 5))
+            )
+            for _ in range(rng.randint(1, 4))
+        ]
+        sections.append(f"# Section {section_index}\n\n" + "\n\n".join(paragraphs))
+    return "\n\n".join(sections)
+
+
+def random_boundaries(rng: random.Random, n_tokens: int):
+    token_indices = sorted(rng.sample(range(1, n_tokens), k=n_tokens // 7))
+    return [(index, rng.choice(list(Boundary))) for index in token_indices]
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pack_chunks_covers_the_document_within_the_budget(seed):
+    rng = random.Random(seed)
+    n_tokens = rng.randint(1, 2000)
+    boundaries = random_boundaries(rng, n_tokens) if n_tokens > 7 else []
+    max_tokens = rng.randint(8, 300)
+
+    slices = pack_chunks(n_tokens, boundaries, max_tokens)
+
+    assert slices[0][0] == 0
+    assert slices[-1][1] == n_tokens
+    for (_, end), (next_start, _) in zip(slices, slices[1:]):
+        assert next_start == end
+    for start, end in slices:
+        assert 0 < end - start <= max_tokens
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_pack_chunks_overlaps_move_forward(seed):
+    rng = random.Random(seed)
+    n_tokens = rng.randint(100, 2000)
+    boundaries = random_boundaries(rng, n_tokens)
+    max_tokens = rng.randint(8, 300)
+    overlap_tokens = rng.randint(1, max_tokens)
+
+    slices = pack_chunks(n_tokens, boundaries, max_tokens, overlap_tokens)
+
+    assert slices[-1][1] == n_tokens
+    for (start, end), (next_start, next_end) in zip(slices, slices[1:]):
+        assert start < next_start < end
+        # the overlap is capped to a quarter of the budget
+        assert end - next_start <= max_tokens // 4
+        assert next_end > end
+    for start, end in slices:
+        assert 0 < end - start <= max_tokens
+
+
+def test_pack_chunks_prefers_the_best_boundary():
+    boundaries = [(60, Boundary.WORD), (70, Boundary.HEADING), (90, Boundary.SENTENCE)]
+
+    assert pack_chunks(200, boundaries, 100)[0] == (0, 70)
+
+
+def test_pack_chunks_cuts_text_without_boundaries_at_the_budget():
+    assert pack_chunks(250, [], 100) == [(0, 100), (100, 200), (200, 250)]
+
+
+def test_find_boundaries_ranks_headings_over_paragraphs_and_sentences():
+    text = "One two. Three\n\n# Title\nFour"
+    document = TokenizedDocument(text, "gpt-3.5-turbo")
+    _, token_offsets = document.tokenizer.decode_with_offsets(document.tokens)
+
+    def token_at(substring: str) -> int:
+        return token_offsets.index(text.index(substring))
+
+    assert find_boundaries(text, token_offsets) == [
+        (token_at("two"), Boundary.WORD),
+        (token_at("Three"), Boundary.SENTENCE),
+        # the paragraph break before the heading
+        (token_at("#"), Boundary.HEADING),
+        (token_at("Four"), Boundary.WORD),
+    ]
+
+
+@pytest.mark.parametrize("stable", [False, True])
+@pytest.mark.parametrize("seed", range(5))
+def test_chunk_slices_decode_to_the_document(seed, stable):
+    text = make_text(seed)
+    document = TokenizedDocument(text, "gpt-3.5-turbo")
+
+    slices = document.chunk_slices(200, stable=stable)
+
+    assert all(end - start <= 200 for start, end in slices)
+    assert "".join(document.chunks(200, stable=stable)) == text
+
+
+def test_stable_chunk_slices_only_change_around_an_edit():
+    text = make_text(0, n_sections=20)
+    edited_text = text.replace("Section 1\n", "Section 1 with a longer title\n", 1)
+
+    chunks = TokenizedDocument(text, "gpt-3.5-turbo").chunks(200, stable=True)
+    edited_chunks = TokenizedDocument(edited_text, "gpt-3.5-turbo").chunks(
+        200, stable=True
+    )
+
+    assert chunks != edited_chunks
+    # past the edit, chunks end at the same boundaries again
+    assert chunks[-5:] == edited_chunks[-5:]
@@ -0,0 +1,81 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List
+
+import pytest
+
+from app.file.extract import (
+    HTMLExtractor,
+    PDFExtractor,
+    PlainTextExtractor,
+    TextExtractor,
+    TextractExtractor,
+    aiter_pages,
+    get_extractor,
+)
+
+
+class PagedExtractor(TextExtractor):
+    """Extractor of a file of ten pages, numbered."""
+
+    def count_pages(self, path: Path) -> int:
+        return 10
+
+    def extract_pages(self, path: Path, start: int, end: int) -> List[str]:
+        return [f"page {i}" for i in range(start, end)]
+
+
+def test_extractors_must_implement_extract_pages():
+    class IncompleteExtractor(TextExtractor):
+        pass
+
+    with pytest.raises(TypeError):
+        TextExtractor()
+    with pytest.raises(TypeError):
+        IncompleteExtractor()
+
+
+@pytest.mark.parametrize(
+    "extractor_class",
+    [PlainTextExtractor, HTMLExtractor, PDFExtractor, TextractExtractor],
+)
+def test_extractors_can_be_instantiated(extractor_class):
+    assert isinstance(extractor_class(), TextExtractor)
+
+
+def test_mime_type_takes_precedence_over_the_extension():
+    assert isinstance(get_extractor(".txt", "application/pdf"), PDFExtractor)
+    assert isinstance(get_extractor(".PDF"), PDFExtractor)
+    assert isinstance(get_extractor("", "TEXT/HTML"), HTMLExtractor)
+    assert isinstance(get_extractor(".docx"), TextractExtractor)
+
+
+def test_pages_are_extracted_in_order():
+    expected = [f"page {i}" for i in range(10)]
+
+    async def extract():
+        with ThreadPoolExecutor(4) as executor:
+            return [
+                page
+                async for page in aiter_pages(
+                    PagedExtractor(), Path("file"), pages_per_batch=3, executor=executor
+                )
+            ]
+
+    assert (
+        list(PagedExtractor().iter_pages(Path("file"), pages_per_batch=3)) == expected
+    )
+    assert asyncio.run(extract()) == expected
+
+
+def test_html_extractor_skips_scripts_and_styles(tmp_path):
+    path = tmp_path / "page.html"
+    path.write_text(
+        "<html><head><style>p {}</style><script>var x;</script></head>"
+        "<body><h1>Title</h1><p>Some text.</p></body></html>"
+    )
+
+    text = "".join(HTMLExtractor().iter_pages(path))
+
+    assert text.split() == ["Title", "Some", "text."]
@@ -0,0 +1,166 @@
+import asyncio
+import time
+
+import pytest
+
+from app.jobs import InMemoryJobStore, JobQueue, SQLiteJobStore
+from app.prompts import Summary
+from app.schema import Job, JobStatus, SummaryParameters, SummaryResponse
+
+
+def make_response(summary_parameters: SummaryParameters) -> SummaryResponse:
+    return SummaryResponse(
+        summary_parameters=summary_parameters,
+        summary=Summary(title="Title", content="Summary."),
+        input_cost=0.0,
+        output_cost=0.0,
+        total_cost=0.0,
+        currency="USD",
+        num_input_tokens=0,
+        num_output_tokens=0,
+    )
+
+
+def make_job(job_id: str, status: JobStatus = JobStatus.PENDING) -> Job:
+    return Job(
+        id=job_id,
+        status=status,
+        summary_parameters=SummaryParameters(url=f"https://example.com/{job_id}.pdf"),
+        created_at=time.time(),
+        updated_at=time.time(),
+    )
+
+
+async def summarize(summary_parameters, on_event):
+    await asyncio.sleep(0.01)
+    return make_response(summary_parameters)
+
+
+def test_identical_unfinished_jobs_are_deduplicated():
+    queue = JobQueue(InMemoryJobStore(), summarize=summarize)
+
+    job = queue.submit(SummaryParameters(url="https://example.com/a.pdf"))
+
+    assert queue.submit(SummaryParameters(url="https://example.com/a.pdf")) == job
+
+
+def test_jobs_differing_in_any_parameter_are_distinct():
+    queue = JobQueue(InMemoryJobStore(), summarize=summarize)
+
+    job = queue.submit(SummaryParameters(url="https://example.com/a.pdf"))
+    fast_job = queue.submit(
+        SummaryParameters(url="https://example.com/a.pdf", summary_mode="final")
+    )
+    incremental_job = queue.submit(
+        SummaryParameters(url="https://example.com/a.pdf", incremental=True)
+    )
+
+    assert len({job.id, fast_job.id, incremental_job.id}) == 3
+
+
+def test_finished_jobs_are_not_returned_for_new_submissions():
+    async def main():
+        queue = JobQueue(InMemoryJobStore(), summarize=summarize)
+        await queue.start()
+        try:
+            job = queue.submit(SummaryParameters(url="https://example.com/a.pdf"))
+            while queue.get(job.id).status != JobStatus.SUCCEEDED:
+                await asyncio.sleep(0.01)
+            return job, queue.submit(SummaryParameters(url="https://example.com/a.pdf"))
+        finally:
+            await queue.stop()
+
+    job, new_job = asyncio.run(main())
+
+    assert new_job.id != job.id
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    if request.param == "memory":
+        store = InMemoryJobStore()
+        return lambda: store
+    # each call opens another connection, like another worker process would
+    return lambda: SQLiteJobStore(tmp_path / "jobs.sqlite3")
+
+
+def test_a_job_is_claimed_once(make_store):
+    store, other_store = make_store(), make_store()
+    store.save(make_job("a"))
+
+    job = store.claim("a", "owner", lease=60)
+
+    assert job is not None and job.status == JobStatus.RUNNING
+    assert other_store.claim("a", "other owner", lease=60) is None
+    assert other_store.claimable() == []
+    assert store.renew("a", "owner", lease=60)
+    assert not other_store.renew("a", "other owner", lease=60)
+
+
+def test_a_job_with_an_expired_lease_is_claimed_again(make_store):
+    store, other_store = make_store(), make_store()
+    store.save(make_job("a"))
+    store.claim("a", "owner", lease=0.01)
+    time.sleep(0.02)
+
+    assert [job.id for job in other_store.claimable()] == ["a"]
+    assert other_store.claim("a", "other owner", lease=60) is not None
+    assert not store.renew("a", "owner", lease=60)
+
+
+def test_finished_jobs_are_not_claimed(make_store):
+    store = make_store()
+    store.save(make_job("a", JobStatus.SUCCEEDED))
+
+    assert store.claim("a", "owner", lease=60) is None
+    assert store.claimable() == []
+
+
+def test_queues_sharing_a_store_run_each_job_once(tmp_path):
+    runs = []
+
+    async def summarize_once(summary_parameters, on_event):
+        runs.append(summary_parameters.url)
+        return await summarize(summary_parameters, on_event)
+
+    async def main():
+        queues = [
+            JobQueue(
+                SQLiteJobStore(tmp_path / "jobs.sqlite3"), summarize=summarize_once
+            )
+            for _ in range(3)
+        ]
+        jobs = [queues[0].submit(make_job(str(i)).summary_parameters) for i in range(5)]
+        for queue in queues:
+            await queue.start()
+        try:
+            while any(
+                queues[0].get(job.id).status != JobStatus.SUCCEEDED for job in jobs
+            ):
+                await asyncio.sleep(0.01)
+        finally:
+            for queue in queues:
+                await queue.stop()
+
+    asyncio.run(main())
+
+    assert sorted(runs) == sorted(set(runs)) and len(runs) == 5
+
+
+def test_in_memory_store_forgets_the_oldest_finished_jobs():
+    store = InMemoryJobStore(max_finished=2)
+    store.save(make_job("pending"))
+    for job_id in "abc":
+        store.save(make_job(job_id, JobStatus.SUCCEEDED))
+
+    assert store.get("pending") is not None
+    assert store.get("a") is None
+    assert store.get("b") is not None and store.get("c") is not None
+
+
+def test_in_memory_store_forgets_expired_finished_jobs():
+    store = InMemoryJobStore(ttl=0.01)
+    store.save(make_job("a", JobStatus.FAILED))
+    time.sleep(0.02)
+
+    assert store.get("a") is None
@@ -0,0 +1,50 @@
+import json
+import random
+
+import pytest
+
+from app.jsonstream import JSONArrayParser
+
+ELEMENTS = [
+    {"Missing_Entities": "a, b", "Denser_Summary": 'quote " and bracket ] inside'},
+    {"Missing_Entities": "", "Denser_Summary": "escaped \\ backslash, comma"},
+    [1, [2, 3], {"nested": "}"}],
+    "plain string",
+    42,
+]
+TEXT = "```json\n" + json.dumps(ELEMENTS, indent=2) + "\n```\ntrailing text ["
+
+
+def split_randomly(text: str, rng: random.Random):
+    cuts = sorted(rng.sample(range(1, len(text)), k=rng.randint(0, len(text) // 4)))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_parses_the_array_whatever_the_splits(seed):
+    parser = JSONArrayParser()
+
+    items = []
+    for piece in split_randomly(TEXT, random.Random(seed)):
+        items.extend(parser.feed(piece))
+
+    assert items == ELEMENTS
+    assert parser.items == ELEMENTS
+    assert parser.is_done
+
+
+def test_elements_are_returned_as_soon_as_complete():
+    parser = JSONArrayParser()
+    text = json.dumps(ELEMENTS)
+    first_end = text.index("}") + 1
+
+    assert parser.feed(text[: first_end - 1]) == []
+    assert parser.feed(text[first_end - 1 : first_end]) == [ELEMENTS[0]]
+    assert not parser.is_done
+
+
+def test_malformed_element_raises():
+    parser = JSONArrayParser()
+
+    with pytest.raises(json.JSONDecodeError):
+        parser.feed("[{'single': 'quotes'}]")
@@ -0,0 +1,93 @@
+import asyncio
+import time
+
+import pytest
+
+from app import ratelimit
+from app.ratelimit import RateLimiter, SQLiteRateLimiter, TokenBucket
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_token_bucket_refills_continuously_up_to_its_capacity(clock):
+    bucket = TokenBucket(capacity=10, refill_rate=2)
+
+    bucket.take(10)
+    assert bucket.time_until_available(4) == pytest.approx(2.0)
+
+    clock[0] += 1.5
+    assert bucket.time_until_available(4) == pytest.approx(0.5)
+
+    clock[0] += 100
+    assert bucket.time_until_available(10) == 0.0
+    # more than the capacity is clamped to it
+    assert bucket.time_until_available(50) == 0.0
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_limiter(request, tmp_path):
+    def make_limiter(requests_per_minute, tokens_per_minute=None):
+        if request.param == "memory":
+            return RateLimiter(requests_per_minute, tokens_per_minute)
+        return SQLiteRateLimiter(
+            "model", requests_per_minute, tokens_per_minute, tmp_path / "limits"
+        )
+
+    return make_limiter
+
+
+def test_a_burst_within_the_limits_does_not_wait(make_limiter):
+    limiter = make_limiter(requests_per_minute=60, tokens_per_minute=6000)
+
+    async def burst():
+        await asyncio.gather(*(limiter.acquire(100) for _ in range(60)))
+
+    start = time.monotonic()
+    asyncio.run(burst())
+
+    assert time.monotonic() - start < 0.5
+
+
+def test_requests_wait_for_the_token_budget(make_limiter):
+    # 10 tokens per second
+    limiter = make_limiter(requests_per_minute=6000, tokens_per_minute=600)
+
+    async def acquire():
+        await limiter.acquire(600)
+        await limiter.acquire(3)
+
+    start = time.monotonic()
+    asyncio.run(acquire())
+
+    assert 0.25 < time.monotonic() - start < 1.0
+
+
+def test_requests_wait_for_the_request_budget(make_limiter):
+    # 2 requests per second
+    limiter = make_limiter(requests_per_minute=120)
+    for _ in range(120):
+        limiter.acquire_blocking()
+
+    start = time.monotonic()
+    limiter.acquire_blocking()
+
+    assert 0.3 < time.monotonic() - start < 1.0
+
+
+def test_sqlite_limiters_share_their_buckets(tmp_path):
+    limiter = SQLiteRateLimiter("model", 6000, 600, tmp_path / "limits")
+    other_limiter = SQLiteRateLimiter("model", 6000, 600, tmp_path / "limits")
+    unrelated_limiter = SQLiteRateLimiter("other", 6000, 600, tmp_path / "limits")
+
+    limiter.acquire_blocking(600)
+    start = time.monotonic()
+    unrelated_limiter.acquire_blocking(600)
+    assert time.monotonic() - start < 0.2
+
+    other_limiter.acquire_blocking(3)
+    assert 0.25 < time.monotonic() - start < 1.0
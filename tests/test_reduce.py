@@ -0,0 +1,72 @@
+import asyncio
+import random
+
+import pytest
+
+from app.pipeline import group_summaries, reduce_summaries, truncate_summary
+from app.prompts import Summary
+from app.tokens import get_encoder
+
+
+class FakeJoinSummarizer:
+    """Records the number of tokens of each join call, answers with a fixed summary."""
+
+    def __init__(self, n_summary_tokens: int) -> None:
+        self.tokenizer = get_encoder("gpt-3.5-turbo")
+        self.n_summary_tokens = n_summary_tokens
+        self.calls = []
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode(text))
+
+    async def asummarize(self, text: str) -> Summary:
+        self.calls.append(self.count_tokens(text))
+        return Summary(title="Title", content="y" * self.n_summary_tokens)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_groups_fit_the_budget_and_pair_up_small_summaries(seed):
+    rng = random.Random(seed)
+    max_tokens = rng.randint(50, 1000)
+    fan_in = rng.randint(1, 10)
+    n_summary_tokens = [rng.randint(1, max_tokens // 2) for _ in range(50)]
+
+    groups = group_summaries(n_summary_tokens, max_tokens, fan_in)
+
+    assert [i for group in groups for i in group] == list(range(50))
+    for group in groups:
+        assert len(group) <= max(2, fan_in)
+        assert sum(n_summary_tokens[i] for i in group) <= max_tokens
+    assert all(len(group) >= 2 for group in groups[:-1])
+
+
+def test_truncate_summary_cuts_to_the_budget():
+    tokenizer = get_encoder("gpt-3.5-turbo")
+    summary = Summary(title="Title", content="word " * 100)
+
+    truncated = truncate_summary(summary, 42, tokenizer)
+
+    assert len(tokenizer.encode(truncated.content)) <= 42
+    assert summary.content.startswith(truncated.content)
+    assert truncated.title == summary.title
+    assert truncate_summary(summary, 1000, tokenizer) is summary
+
+
+@pytest.mark.parametrize(
+    "n_summaries, n_summary_tokens, n_joined_tokens",
+    [(30, 500, 300), (7, 100, 100), (50, 10, 600), (1, 2000, 10)],
+)
+def test_every_join_call_fits_the_budget(
+    n_summaries, n_summary_tokens, n_joined_tokens
+):
+    join_summarizer = FakeJoinSummarizer(n_joined_tokens)
+    summaries = [
+        Summary(title="Title", content="x" * n_summary_tokens)
+        for _ in range(n_summaries)
+    ]
+
+    summary = asyncio.run(reduce_summaries(summaries, join_summarizer, 450, fan_in=10))
+
+    assert summary.content == "y" * n_joined_tokens
+    assert join_summarizer.calls
+    assert max(join_summarizer.calls) <= 450
@@ -0,0 +1,111 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from app.file.remote import FileTooLargeError, RemoteFile
+from app.file.store import ArtifactStore
+
+
+class StreamingTransport(httpx.AsyncBaseTransport):
+    """Answers requests with ``handler``, streaming the body of the responses."""
+
+    def __init__(self, handler) -> None:
+        self.handler = handler
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        # unlike httpx.MockTransport, which reads the whole body first
+        return self.handler(request)
+
+
+def make_client(handler) -> httpx.AsyncClient:
+    return httpx.AsyncClient(transport=StreamingTransport(handler))
+
+
+async def download(remote_file: RemoteFile, handler, chunk_size: int = 100) -> None:
+    async with make_client(handler) as client:
+        await remote_file.download(chunk_size=chunk_size, client=client)
+
+
+def test_download_streams_the_file_to_disk(tmp_path):
+    def handler(request):
+        return httpx.Response(200, content=b"x" * 1000)
+
+    async def main():
+        async with RemoteFile(
+            "https://example.com/file.txt", directory=tmp_path
+        ) as remote_file:
+            await download(remote_file, handler)
+            return remote_file.bytes_downloaded, remote_file.extract_text()
+
+    assert asyncio.run(main()) == (1000, "x" * 1000)
+    # the downloaded file is deleted once done
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_a_slow_download_times_out_as_a_whole(tmp_path):
+    async def drip():
+        # every chunk arrives well within the timeout, the whole file does not
+        for _ in range(100):
+            await asyncio.sleep(0.05)
+            yield b"x"
+
+    def handler(request):
+        return httpx.Response(200, content=drip())
+
+    remote_file = RemoteFile(
+        "https://example.com/file.txt", timeout=0.5, directory=tmp_path
+    )
+    start = time.monotonic()
+
+    with pytest.raises(httpx.TimeoutException):
+        asyncio.run(download(remote_file, handler, chunk_size=1))
+
+    assert time.monotonic() - start < 1.5
+    assert 0 < remote_file.bytes_downloaded < 100
+
+
+def test_files_larger_than_the_maximum_size_are_rejected(tmp_path):
+    def announced(request):
+        return httpx.Response(200, content=b"x" * 1000)
+
+    async def unannounced_chunks():
+        for _ in range(10):
+            yield b"x" * 100
+
+    def unannounced(request):
+        return httpx.Response(200, content=unannounced_chunks())
+
+    for handler in (announced, unannounced):
+        remote_file = RemoteFile(
+            "https://example.com/file.txt", max_size=500, directory=tmp_path
+        )
+        with pytest.raises(FileTooLargeError):
+            asyncio.run(download(remote_file, handler))
+        assert remote_file.bytes_downloaded <= 600
+
+
+def test_unchanged_stored_files_are_not_downloaded_again(tmp_path):
+    requests = []
+
+    def handler(request):
+        requests.append(request)
+        if request.headers.get("If-None-Match") == '"v1"':
+            return httpx.Response(304)
+        return httpx.Response(200, content=b"text", headers={"ETag": '"v1"'})
+
+    store = ArtifactStore(tmp_path / "store")
+
+    async def main():
+        texts = []
+        for _ in range(2):
+            async with RemoteFile(
+                "https://example.com/file.txt", directory=tmp_path, store=store
+            ) as remote_file:
+                await download(remote_file, handler)
+                texts.append((remote_file.is_from_store, remote_file.extract_text()))
+        return texts
+
+    assert asyncio.run(main()) == [(False, "text"), (True, "text")]
+    assert len(requests) == 2
@@ -0,0 +1,108 @@
+import asyncio
+
+import openai
+import pytest
+
+from app.retry import ahedge, aretry, retry
+
+
+def make_flaky_call(errors, result="result"):
+    """Call raising the given errors one after the other, then returning ``result``."""
+    errors = list(errors)
+    attempts = []
+
+    async def call():
+        attempts.append(len(attempts))
+        if errors:
+            raise errors.pop(0)
+        return result
+
+    return call, attempts
+
+
+def test_aretry_retries_transient_errors():
+    call, attempts = make_flaky_call(
+        [openai.error.RateLimitError("slow down"), asyncio.TimeoutError()]
+    )
+    reasons = []
+
+    result = asyncio.run(
+        aretry(call, max_retries=2, base_delay=0.01, on_retry=reasons.append)
+    )
+
+    assert result == "result"
+    assert reasons == ["rate_limit", "timeout"]
+
+
+def test_aretry_gives_up_after_max_retries():
+    call, attempts = make_flaky_call([asyncio.TimeoutError()] * 3)
+
+    with pytest.raises(asyncio.TimeoutError):
+        asyncio.run(aretry(call, max_retries=2, base_delay=0.01))
+    assert len(attempts) == 3
+
+
+def test_retry_does_not_retry_other_errors():
+    attempts = []
+
+    def call():
+        attempts.append(1)
+        raise openai.error.InvalidRequestError("too long", param=None)
+
+    with pytest.raises(openai.error.InvalidRequestError):
+        retry(call, max_retries=5, base_delay=0.01)
+    assert len(attempts) == 1
+
+
+def test_ahedge_returns_the_first_attempt_done():
+    delays = [1.0, 0.01]
+
+    async def call():
+        await asyncio.sleep(delays.pop(0))
+        return "result"
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        result = await ahedge(call, hedge_after=0.05)
+        return result, loop.time() - start
+
+    result, elapsed = asyncio.run(main())
+
+    assert result == "result"
+    assert elapsed < 0.5
+
+
+def test_ahedge_cancels_its_attempts_when_cancelled():
+    cancelled = []
+
+    async def call():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    async def main():
+        hedged = asyncio.ensure_future(ahedge(call, hedge_after=5))
+        await asyncio.sleep(0.05)
+        hedged.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await hedged
+        await asyncio.sleep(0)
+
+    asyncio.run(main())
+
+    assert cancelled == [True]
+
+
+def test_ahedge_reports_the_error_of_the_first_attempt():
+    errors = [ValueError("first"), ValueError("second")]
+
+    async def call():
+        error = errors.pop(0)
+        await asyncio.sleep(0.1)
+        raise error
+
+    with pytest.raises(ValueError, match="first"):
+        asyncio.run(ahedge(call, hedge_after=0.01))
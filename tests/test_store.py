@@ -0,0 +1,117 @@
+import time
+from pathlib import Path
+
+import pytest
+
+from app.file.store import ArtifactStore
+
+
+@pytest.fixture
+def write_file(tmp_path):
+    def write_file(content: bytes) -> Path:
+        path = tmp_path / f"download-{time.monotonic_ns()}"
+        path.write_bytes(content)
+        return path
+
+    return write_file
+
+
+@pytest.fixture
+def directory(tmp_path):
+    return tmp_path / "store"
+
+
+def test_stored_files_are_revalidated_with_their_headers(directory, write_file):
+    store = ArtifactStore(directory)
+    artifact = store.put_file(
+        "https://example.com/a.pdf",
+        write_file(b"pdf"),
+        etag='"v1"',
+        last_modified="Mon",
+    )
+    store.release(artifact)
+
+    stored = store.get("https://example.com/a.pdf")
+
+    assert stored.raw_path.read_bytes() == b"pdf"
+    assert stored.validation_headers == {
+        "If-None-Match": '"v1"',
+        "If-Modified-Since": "Mon",
+    }
+    assert store.get("https://example.com/b.pdf") is None
+
+
+def test_text_round_trips_page_by_page(directory, write_file):
+    store = ArtifactStore(directory)
+    artifact = store.put_file("https://example.com/a.pdf", write_file(b"pdf"))
+
+    store.put_text(artifact, ["first page", "", "third page é"])
+    store.release(artifact)
+    stored = store.get("https://example.com/a.pdf")
+
+    assert stored.has_text
+    assert list(store.iter_pages(stored)) == ["first page", "", "third page é"]
+
+
+def test_a_new_version_does_not_replace_a_file_in_use(directory, write_file):
+    store = ArtifactStore(directory)
+    old = store.put_file("https://example.com/a.pdf", write_file(b"old"))
+
+    new = store.put_file("https://example.com/a.pdf", write_file(b"new"))
+
+    assert old.raw_path.read_bytes() == b"old"
+    assert new.raw_path.read_bytes() == b"new"
+    store.release(old)
+    assert not old.directory.exists()
+    assert new.raw_path.exists()
+
+
+def test_files_in_use_are_not_evicted(directory, write_file):
+    store = ArtifactStore(directory, max_bytes=5)
+    in_use = store.put_file("https://example.com/a.pdf", write_file(b"aaaa"))
+    released = store.put_file("https://example.com/b.pdf", write_file(b"bbbb"))
+    store.release(released)
+
+    store.put_file("https://example.com/c.pdf", write_file(b"cccc"))
+
+    assert in_use.raw_path.exists()
+    assert store.get("https://example.com/b.pdf") is None
+
+
+def test_pins_hold_for_every_process_sharing_the_store(directory, write_file):
+    # stores on the same directory, like those of several worker processes
+    store, other_store = ArtifactStore(directory), ArtifactStore(directory, max_bytes=1)
+    in_use = store.put_file("https://example.com/a.pdf", write_file(b"old"))
+
+    other_store.release(
+        other_store.put_file("https://example.com/a.pdf", write_file(b"new"))
+    )
+    other_store.evict()
+
+    assert in_use.raw_path.read_bytes() == b"old"
+    store.release(in_use)
+    assert not in_use.directory.exists()
+
+
+def test_pins_of_dead_processes_expire(directory, write_file):
+    store = ArtifactStore(directory, pin_lease=0.01)
+    # never released
+    old = store.put_file("https://example.com/a.pdf", write_file(b"old"))
+    new = store.put_file("https://example.com/a.pdf", write_file(b"new"))
+    store.release(new)
+    assert old.directory.exists()
+
+    time.sleep(0.02)
+    store.evict()
+
+    assert not old.directory.exists()
+    assert new.raw_path.exists()
+
+
+def test_files_removed_from_disk_are_forgotten(directory, write_file):
+    store = ArtifactStore(directory)
+    artifact = store.put_file("https://example.com/a.pdf", write_file(b"pdf"))
+    store.release(artifact)
+    artifact.raw_path.unlink()
+
+    assert store.get("https://example.com/a.pdf") is None
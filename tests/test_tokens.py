@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from app.filtering import filter_pages
+from app.tokens import TokenizedDocument
+
+WORDS = "alpha beta gamma delta epsilon zeta eta theta iota kappa".split()
+LICENSE_TEXT = "Licensed under the terms of the license, see the license file. " * 3
+
+
+class CountingTokenizer:
+    """Tokenizer counting the characters it encodes."""
+
+    def __init__(self, tokenizer) -> None:
+        self.tokenizer = tokenizer
+        self.n_encoded_chars = 0
+
+    def encode(self, text: str):
+        self.n_encoded_chars += len(text)
+        return self.tokenizer.encode(text)
+
+    def decode(self, tokens):
+        return self.tokenizer.decode(tokens)
+
+    def decode_with_offsets(self, tokens):
+        return self.tokenizer.decode_with_offsets(tokens)
+
+
+def make_pages(seed: int, n_pages: int = 12):
+    rng = random.Random(seed)
+    pages = []
+    for page_index in range(n_pages):
+        paragraphs = [
+            " ".join(f"{rng.choice(WORDS)}{rng.randint(0, 999)} é" for _ in range(12))
+            for _ in range(4)
+        ]
+        if page_index % 4 == 0:
+            paragraphs.append(LICENSE_TEXT)
+        body = "\n\n".join(paragraphs)
+        pages.append(
+            f"ACME Corp confidential\n{body}\nPage {page_index} of {n_pages}\n"
+        )
+    pages[-1] += "\nReferences\n[1] A paper.\n[2] Another paper.\n"
+    return pages
+
+
+def make_document(pages) -> TokenizedDocument:
+    document = TokenizedDocument("", "gpt-3.5-turbo")
+    for page in pages:
+        document.append(page)
+    return document
+
+
+def test_pages_round_trip():
+    pages = make_pages(0)
+
+    document = make_document(pages)
+
+    assert document.pages == [""] + pages
+    assert document.text == "".join(pages)
+    assert document.tokenizer.decode(document.tokens) == document.text
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_filtered_document_decodes_to_the_filtered_pages(seed):
+    document = make_document(make_pages(seed))
+    filtered_pages = filter_pages(document.pages, strip_section_titles=["References"])
+
+    filtered = document.filter_pages(filtered_pages)
+
+    assert filtered.pages == [""] + filtered_pages
+    assert filtered.text == "".join(filtered_pages)
+    assert filtered.tokenizer.decode(filtered.tokens) == filtered.text
+    # the filters removed the headers, footers, duplicates and references
+    assert "ACME" not in filtered.text and "References" not in filtered.text
+    assert document.text.count(LICENSE_TEXT) == 3
+    assert filtered.text.count(LICENSE_TEXT) == 1
+
+
+def test_filtered_document_reuses_the_tokens_of_the_kept_text():
+    document = make_document(make_pages(0))
+    filtered_pages = filter_pages(document.pages, strip_section_titles=["References"])
+    document.tokenizer = tokenizer = CountingTokenizer(document.tokenizer)
+
+    filtered = document.filter_pages(filtered_pages)
+
+    assert filtered.tokenizer.decode(filtered.tokens) == filtered.text
+    # only the text around the cuts is encoded again
+    assert tokenizer.n_encoded_chars < len(filtered.text) / 10
+
+
+def test_unfiltered_pages_keep_their_tokens():
+    document = make_document(make_pages(0))
+
+    filtered = document.filter_pages(document.pages)
+
+    assert filtered.tokens == document.tokens